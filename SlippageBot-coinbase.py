@@ -11,6 +11,31 @@ import random
 from eth_account import Account
 from datetime import datetime
 import csv
+import contextlib
+import asyncio
+import threading
+from collections import namedtuple
+from functools import lru_cache
+from market_store import MarketStore
+from price_engine import (build_price_graph, path_price, pool_spot_price, price_path, propagate_usd_price_tree,
+                          propagate_usd_prices)
+from price_history_store import PriceHistory
+from tick_archive import TickArchive
+from position_journal import PositionJournal
+from signal_kernel import momentum_signals
+from exit_engine import ExitEngine
+from loop_scheduler import LoopScheduler
+from rpc_client import RpcClient, to_int
+from graphql_client import GraphQLClient
+from subgraph_pools import changed_since, fetch_pools, merge_changed_pools
+from nonce_manager import NonceManager
+from receipt_tracker import ReceiptTracker
+from fee_oracle import FeeOracle
+from allowance_cache import AllowanceCache
+from batch_swap import BATCH_EXECUTOR_ABI, swap_results
+from web3.datastructures import AttributeDict
+from hexbytes import HexBytes
+import numpy as np
 # Logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -26,13 +51,10 @@ AERODROME_SUBGRAPH_URL = "https://gateway.thegraph.com/api/547adc7c0f0541cf9e78f
 #THEGRAPH_UNISWAP_URL = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3"
 THEGRAPH_COINBASE_URL = AERODROME_SUBGRAPH_URL
 
-# **CACHE SETTINGS**
-TOKEN_PAIRS_CACHE_FILE = "token_pairs_cache.json"
-LAST_PAIR_FETCH_TIME = 0  # Last time pairs were fetched (UNIX timestamp)
-
-# **CACHE POOLS** (Fetch every 1 hour)
-POOLS_CACHE_FILE = "pools_cache.json"
-LAST_POOL_FETCH_TIME = 0  # Store last fetch time
+# **CACHE SETTINGS** (pools, tokens and per-fetcher freshness live in one SQLite store)
+MARKET_STORE_FILE = "market_store.db"
+FETCH_TTL = 3600  # Refetch each source at most every 1 hour
+MARKET_STORE = MarketStore(MARKET_STORE_FILE)
 
 if not RPC_URL or not PRIVATE_KEY:
     raise ValueError("Missing required environment variables. Check your .env file.")
@@ -47,6 +69,8 @@ if w3.is_connected():
     print("Connected to the network")
 else:
     print("Failed to connect to the network")
+# Hot-path reads (block, gas price, balances) share pooled keep-alive connections and batch requests
+RPC = RpcClient(RPC_URL)
 AERODROME_ROUTER = w3.to_checksum_address("0xcF77a3Ba9A5CA399B7c97c74d54e5b1Beb874E43")  # Confirm actual address
 
 owner_address = w3.eth.account.from_key(PRIVATE_KEY).address
@@ -62,6 +86,7 @@ TAKE_PROFIT_PERCENT = 0.09  # 10% increase
 TAKE_PROFIT_STOP_LOSS_PERCENT = -0.015
 
 TRADE_LOG_FILE = "trade_history.csv"
+FILL_LOG_FILE = "fill_history.csv"  # One row per mined swap (status, amount received, gas)
 
 # **Uniswap V3 Pool ABI (Minimal Required Functions & Events)**
 UNISWAP_V3_POOL_ABI = [
@@ -262,6 +287,20 @@ AERODROME_ROUTER_ABI = json.loads('[{"inputs": [{ "internalType": "uint256", "na
 # Uniswap V2 Router Address (Polygon)
 UNISWAP_V2_ROUTER = w3.to_checksum_address("0xedf6066a2b290C185783862C7F4776A2C8077AD1")
 
+# Multicall3 (same address on every EVM chain, including Base)
+MULTICALL3_ADDRESS = w3.to_checksum_address("0xcA11bde05977b3631167028862bE2a173976CA11")
+MULTICALL3_ABI = json.loads('[{"inputs":[{"components":[{"internalType":"address","name":"target","type":"address"},{"internalType":"bool","name":"allowFailure","type":"bool"},{"internalType":"bytes","name":"callData","type":"bytes"}],"internalType":"struct Multicall3.Call3[]","name":"calls","type":"tuple[]"}],"name":"aggregate3","outputs":[{"components":[{"internalType":"bool","name":"success","type":"bool"},{"internalType":"bytes","name":"returnData","type":"bytes"}],"internalType":"struct Multicall3.Result[]","name":"returnData","type":"tuple[]"}],"stateMutability":"payable","type":"function"}]')
+MULTICALL_CHUNK_SIZE = 500  # Calls per eth_call; keeps each request under RPC gas/size limits
+
+# 4-byte selectors for the view calls we batch
+DECIMALS_SELECTOR = Web3.keccak(text="decimals()")[:4]
+SYMBOL_SELECTOR = Web3.keccak(text="symbol()")[:4]
+GET_RESERVES_SELECTOR = Web3.keccak(text="getReserves()")[:4]
+STABLE_SELECTOR = Web3.keccak(text="stable()")[:4]
+FEE_SELECTOR = Web3.keccak(text="fee()")[:4]
+GET_BLOCK_NUMBER_SELECTOR = Web3.keccak(text="getBlockNumber()")[:4]  # Multicall3 helper
+RESERVES_CHUNK_SIZE = 1000  # getReserves() is cheap, so pack more of them per eth_call
+
 # Uniswap Pool Fee Tier (500 = 0.05%, 3000 = 0.3%, 10000 = 1%)
 POOL_FEE = 3000
 
@@ -269,8 +308,6 @@ POOL_FEE = 3000
 USDC_ADDRESS = w3.to_checksum_address("0x3c499c542cEF5E3811e1192ce70d8cC03d5c3359")  # usdc
 WETH_ADDRESS = w3.to_checksum_address("0x7ceB23fD6bC0adD59E62ac25578270cFf1b9f619")  # with
 
-LAST_PAIR_FETCH_TIME = 0
-
 # Load mock data from files
 #with open("mock_token_pairs.json", "r") as f:
 #    token_pairs = json.load(f)
@@ -291,20 +328,25 @@ LAST_PAIR_FETCH_TIME = 0
 #print(f"Loaded {len(monitor_swaps_data)} swaps")
 
 
-PRICE_HISTORY_FILE = "price_history.json"
+PRICE_HISTORY_FILE = "price_history.json"  # Legacy JSON history, imported once into the store below
+PRICE_HISTORY_STORE = "price_history_aerodrome"  # This bot's own .npz snapshot + .ticks log (capacities differ per bot)
+PRICE_HISTORY_CAPACITY = 600  # ✅ Keep last 10 hours of minute prices per token
+TICK_ARCHIVE_DIR = "tick_archive/aerodrome"  # Every loop's USD prices, kept for replays (one writer per archive, one directory per day)
+TICK_ARCHIVE = TickArchive(TICK_ARCHIVE_DIR)
 
 FETCH_SWAPS_FROM_LATEST_XBLOCKS = 500
 IF_FETCH_SWAPS_FROM_LATEST_XBLOCKS = False
 
+# Aerodrome pool Swap event (both addresses indexed up front, unlike Uniswap V2's sender ... to)
 SWAP_EVENT_ABI = {
     "anonymous": False,
     "inputs": [
         {"indexed": True, "name": "sender", "type": "address"},
+        {"indexed": True, "name": "to", "type": "address"},
         {"indexed": False, "name": "amount0In", "type": "uint256"},
         {"indexed": False, "name": "amount1In", "type": "uint256"},
         {"indexed": False, "name": "amount0Out", "type": "uint256"},
         {"indexed": False, "name": "amount1Out", "type": "uint256"},
-        {"indexed": True, "name": "to", "type": "address"},
     ],
     "name": "Swap",
     "type": "event"
@@ -314,11 +356,14 @@ SWAP_EVENT_ABI = {
 trade_log = []
 
 # ✅ File to store held tokens
-HELD_TOKENS_FILE = "held_tokens.json"
+HELD_TOKENS_FILE = "held_tokens.json"  # Legacy file, imported once into the journal below
+POSITION_JOURNAL_FILE = "positions_aerodrome.jsonl"  # This bot's own append-only open/update/close events
+POSITION_JOURNAL = PositionJournal(POSITION_JOURNAL_FILE)
 
 # ✅ Global variables
 held_tokens = set()
 held_token_prices = {}
+EXIT_ENGINE = ExitEngine()  # Stop-loss / trailing-stop levels of held_token_prices, checked on every Sync tick
 
 # Define base tokens (USDC, WETH, WMATIC) and decimals
 BASE_TOKENS = {
@@ -328,17 +373,31 @@ BASE_TOKENS = {
     "WBTC": {"id": "0x0555E30da8f98308EdB960aa94C0Db47230d2B9c", "decimals": 8, "token_price": 100000.00}
 }
 
+# **PER-FETCHER CACHE** (kept in memory, persisted in MARKET_STORE)
+FETCHER_RESULTS = {}  # fetcher name -> last result
+
+
+def load_cached_fetch(name, force_refresh=False):
+    """Return a fetcher's cached result while it is younger than FETCH_TTL, else None."""
+    if force_refresh or not MARKET_STORE.is_fresh(name, FETCH_TTL):
+        return None
+    if name not in FETCHER_RESULTS:
+        FETCHER_RESULTS[name] = MARKET_STORE.cached_result(name)  # Read from disk once per process
+    return FETCHER_RESULTS[name]
+
+
+def save_cached_fetch(name, result, block=None):
+    FETCHER_RESULTS[name] = result
+    MARKET_STORE.mark_fetched(name, block=block, result=result)
+
+
 # **Load price history from file**
 def load_price_history():
-    if os.path.exists(PRICE_HISTORY_FILE):
-        with open(PRICE_HISTORY_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return PriceHistory(PRICE_HISTORY_STORE, PRICE_HISTORY_CAPACITY, legacy_json=PRICE_HISTORY_FILE)
 
-# **Save price history to file**
+# **Save price history to file** (appends new ticks; snapshots periodically)
 def save_price_history(price_history):
-    with open(PRICE_HISTORY_FILE, "w") as f:
-        json.dump(price_history, f)
+    price_history.flush()
 
 
 def to_checksum(address):
@@ -349,17 +408,151 @@ def to_checksum(address):
         logging.error(f"⚠️ Invalid address: {address}")
         return address  # Return original if conversion fails
 
+@lru_cache(maxsize=None)
+def cached_checksum(address):
+    """Checksum an address once per process (multicall targets repeat every block)."""
+    return w3.to_checksum_address(address)
+
+
+def block_param(block_identifier):
+    """JSON-RPC block parameter: tags ("latest") pass through, block numbers become hex quantities."""
+    return hex(block_identifier) if isinstance(block_identifier, int) else block_identifier
+
+
+MULTICALL3 = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)  # Encoding only; calls go through RPC
+
+
+def multicall(calls, block_identifier="latest", chunk_size=MULTICALL_CHUNK_SIZE):
+    """Run [(target, calldata), ...] through Multicall3 aggregate3; returns [(success, return_data), ...].
+
+    Each chunk is one eth_call, and all chunks share one pooled JSON-RPC batch.
+    """
+    eth_calls = []
+    for start in range(0, len(calls), chunk_size):
+        chunk = [(cached_checksum(target), True, calldata) for target, calldata in calls[start:start + chunk_size]]
+        eth_calls.append(("eth_call", [{"to": MULTICALL3_ADDRESS, "data": MULTICALL3.encode_abi("aggregate3", args=[chunk])},
+                                       block_param(block_identifier)]))
+    results = []
+    for raw in RPC.batch(eth_calls):
+        results.extend(w3.codec.decode(["(bool,bytes)[]"], HexBytes(raw))[0])
+    return [(success, bytes(return_data)) for success, return_data in results]
+
+
+# **CHAIN STATE** (one batched round trip per block instead of a call per field)
+BALANCE_OF_SELECTOR = "0x70a08231"  # balanceOf(address)
+CHAIN_STATE_TTL = 2  # Seconds (one Base block) a chain_state() read is reused
+CHAIN_STATE = {"read_at": 0.0}
+
+
+def latest_block_number():
+    return to_int(RPC.call("eth_blockNumber"))
+
+
+def chain_state():
+    """Latest block number, timestamp, base fee, priority fee and gas price, refreshed at most once per block."""
+    if time.time() - CHAIN_STATE["read_at"] >= CHAIN_STATE_TTL:
+        block, gas_price, priority_fee = RPC.batch([("eth_getBlockByNumber", ["latest", False]), ("eth_gasPrice", []),
+                                                    ("eth_maxPriorityFeePerGas", [])])
+        CHAIN_STATE.update(block=to_int(block["number"]), timestamp=to_int(block["timestamp"]),
+                           base_fee=to_int(block.get("baseFeePerGas")), priority_fee=to_int(priority_fee),
+                           gas_price=to_int(gas_price), read_at=time.time())
+    return CHAIN_STATE
+
+
+def get_wallet_token_balances(token_ids):
+    """balanceOf(WALLET_ADDRESS) for every token in one JSON-RPC batch (smallest units)."""
+    data = BALANCE_OF_SELECTOR + WALLET_ADDRESS.lower()[2:].rjust(64, "0")
+    results = RPC.batch([("eth_call", [{"to": cached_checksum(token_id), "data": data}, "latest"])
+                         for token_id in token_ids])
+    return {token_id: to_int(result) for token_id, result in zip(token_ids, results)}
+
+
 def get_wallet_token_balance(token_id):
-    # Standard ERC-20 balanceOf function ABI
-    balance_of_abi = [{"constant":True,"inputs":[{"name":"_owner","type":"address"}],"name":"balanceOf","outputs":[{"name":"balance","type":"uint256"}],"type":"function"}]
-    
-    # Create contract instance
-    token_contract = w3.eth.contract(address=Web3.to_checksum_address(token_id), abi=balance_of_abi)
-    
-    # Get token balance
-    balance = token_contract.functions.balanceOf(WALLET_ADDRESS).call()
-    
-    return balance  # Returns balance in token's smallest unit (e.g., Wei)
+    return get_wallet_token_balances([token_id])[token_id]  # Returns balance in token's smallest unit (e.g., Wei)
+
+
+# **NONCES** (allocated locally, so approvals and swaps go out back to back)
+NONCES = NonceManager(lambda block_identifier: w3.eth.get_transaction_count(WALLET_ADDRESS, block_identifier))
+
+
+def send_transaction(build):
+    """Sign and send build(nonce) with a locally allocated nonce; returns the tx hash."""
+    tx_hash, _ = NONCES.send(lambda nonce: w3.eth.account.sign_transaction(build(nonce), PRIVATE_KEY).raw_transaction,
+                             w3.eth.send_raw_transaction)
+    return tx_hash
+
+
+# **RECEIPTS** (polled in the background: one batched request per block for everything in flight)
+def to_log(raw):
+    """Decode a raw log object into the shape web3 returns (ints, HexBytes)."""
+    return AttributeDict({**raw, "topics": [HexBytes(topic) for topic in raw["topics"]], "data": HexBytes(raw["data"]),
+                          "blockNumber": to_int(raw["blockNumber"]), "logIndex": to_int(raw["logIndex"]),
+                          "transactionHash": HexBytes(raw["transactionHash"])})
+
+
+def get_logs(filter_params):
+    """eth_getLogs through the pooled RPC client, with web3-shaped logs."""
+    params = dict(filter_params)
+    for key in ("fromBlock", "toBlock"):
+        if key in params:
+            params[key] = block_param(params[key])
+    return [to_log(raw) for raw in RPC.call("eth_getLogs", params)]
+
+
+def to_receipt(raw):
+    """Decode a raw eth_getTransactionReceipt result into the shape web3 returns (ints, HexBytes)."""
+    logs = [to_log(log) for log in raw.get("logs", [])]
+    return AttributeDict({**raw, "logs": logs, "status": to_int(raw.get("status")),
+                          "blockNumber": to_int(raw["blockNumber"]), "gasUsed": to_int(raw["gasUsed"]),
+                          "effectiveGasPrice": to_int(raw.get("effectiveGasPrice")),
+                          "transactionHash": HexBytes(raw["transactionHash"])})
+
+
+def fetch_receipts(tx_hashes):
+    results = RPC.batch([("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes])
+    return [to_receipt(result) if result else None for result in results]
+
+
+RECEIPTS = ReceiptTracker(fetch_receipts, latest_block_number, poll_interval=CHAIN_STATE_TTL)
+
+
+# **FEES** (EIP-1559 fields once per block; gas limits learned per (contract, route) from receipts)
+CHAIN_ID = w3.eth.chain_id  # Read once; build_transaction would otherwise ask for it on every transaction
+FEES = FeeOracle(chain_state, CHAIN_ID)
+
+
+def route_shape(routes):
+    """Gas cache key part for a route: (from, to, stable) per hop (Aerodrome dicts or tuples).
+
+    Tokens are part of the key because transfer costs differ per token (taxes, hooks, rebasing).
+    """
+    hops = [(route["from"], route["to"], route["stable"]) if isinstance(route, dict) else route[:3] for route in routes]
+    return tuple((hop_from.lower(), hop_to.lower(), bool(stable)) for hop_from, hop_to, stable in hops)
+
+
+def track_transaction(tx_hash, gas_key, callback=None):
+    """Track `tx_hash`: learn its gas usage under `gas_key`, then run callback(receipt).
+
+    Successful receipts teach the usage; a revert that burned its whole gas limit ran out of gas,
+    so the next transaction with that key gets twice the limit. On a receipt timeout
+    callback(None) runs after the nonce gap check.
+    """
+    def on_receipt(receipt):
+        if receipt is None:
+            # Accepted but never mined (e.g. dropped from the mempool): later nonces would wait on it forever
+            NONCES.check_gap()
+        elif receipt["status"] == 1:
+            FEES.learn(gas_key, receipt["gasUsed"])
+        else:
+            try:
+                gas_limit = w3.eth.get_transaction(receipt["transactionHash"])["gas"]  # Only fetched for reverts
+                if receipt["gasUsed"] >= gas_limit:
+                    FEES.learn_out_of_gas(gas_key, gas_limit)
+            except Exception as e:
+                logging.error(f"⚠️ Could not check {Web3.to_hex(receipt['transactionHash'])} for out of gas: {e}")
+        if callback is not None:
+            callback(receipt)
+    return RECEIPTS.track(tx_hash, on_receipt)
 
 
 # Function to get ERC-20 balance
@@ -368,21 +561,58 @@ def get_token_balance(token_address, owner):
     balance = token_contract.functions.balanceOf(to_checksum(owner)).call()
     return balance
 
+# **ALLOWANCES** (cached per (token, spender); an approval is sent only when the cached allowance is short)
+ALLOWANCE_SELECTOR = Web3.keccak(text="allowance(address,address)")[:4]
+UNLIMITED_APPROVALS = os.getenv("UNLIMITED_APPROVALS", "").lower() in ("1", "true", "yes")  # Opt-in: approve 2**256 - 1 once per (token, router)
+APPROVAL_AMOUNT = 2**256 - 1 if UNLIMITED_APPROVALS else 0  # 0 = approve exactly each trade's amount
+
+
+def address_word(address):
+    return bytes.fromhex(address.lower()[2:].rjust(64, "0"))
+
+
+def read_allowances(pairs):
+    """allowance(WALLET_ADDRESS, spender) for every (token, spender) in one multicall (None if a read failed)."""
+    owner = address_word(WALLET_ADDRESS)
+    results = multicall([(token, ALLOWANCE_SELECTOR + owner + address_word(spender)) for token, spender in pairs])
+    return [word(data, 0) if success and len(data) >= 32 else None for success, data in results]
+
+
+def prefetch_allowances(pairs):
+    ALLOWANCES.prefetch(pairs)
+
+
+def ensure_allowance(token_address, spender, amount):
+    """Approve `spender` for `amount` of the token unless the cached allowance already covers it."""
+    return ALLOWANCES.ensure(token_address, spender, amount)
+
+
+def spend_allowance(token_address, spender, amount):
+    """Book a sent swap against the cached allowance until its receipt settles it."""
+    ALLOWANCES.spend(token_address, spender, amount)
+
+
+def swap_receipt_handler(token_in, spender, amount_in, callback=None):
+    """Receipt callback for a sent swap: settle its allowance, then callback(receipt)."""
+    def on_receipt(receipt):
+        ALLOWANCES.swap_receipt(token_in, spender, amount_in, receipt)
+        if callback is not None:
+            callback(receipt)
+    return on_receipt
+
+
 # Function to approve Uniswap V2 Router to spend tokens
 def approve_token(token_address, spender, amount):
     token_contract = w3.eth.contract(address=token_address, abi=ERC20_ABI)
     
-    tx = token_contract.functions.approve(spender, amount).build_transaction({
-        "from": WALLET_ADDRESS,
-        "gas": 100000,
-        "gasPrice": w3.eth.gas_price,
-        "nonce": w3.eth.get_transaction_count(WALLET_ADDRESS),
-    })
     try:
-        signed_tx = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        # No receipt wait: the swap sent next gets the following nonce, so it is mined after this approval
+        gas_key = (token_address.lower(), "approve")
+        tx_hash = send_transaction(lambda nonce: token_contract.functions.approve(spender, amount).build_transaction(
+            FEES.tx_params(gas_key, 100000, **{"from": WALLET_ADDRESS, "nonce": nonce})))
         print(f"✅ Approve Transaction Sent: {tx_hash.hex()}")
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        track_transaction(tx_hash, gas_key,
+                          lambda receipt: ALLOWANCES.approval_receipt(token_address, spender, tx_hash, receipt))
 
         return tx_hash
     except Exception as e:
@@ -390,14 +620,20 @@ def approve_token(token_address, spender, amount):
     return 
 
 
-def aerodrome_swap(token_in, token_out, amount_in, amount_out_min, smart_take_profit=False):
+ALLOWANCES = AllowanceCache(WALLET_ADDRESS, read_allowances,
+                            lambda token, spender, amount: approve_token(w3.to_checksum_address(token),
+                                                                         w3.to_checksum_address(spender), amount),
+                            APPROVAL_AMOUNT)
+
+
+def aerodrome_swap(token_in, token_out, amount_in, amount_out_min, smart_take_profit=False, on_receipt=None):
     router_contract = w3.eth.contract(address=AERODROME_ROUTER, abi=AERODROME_ROUTER_ABI)
     print('aerodrome_swap')
     print(token_in)
     print(token_out)
     # Build Swap Transaction
     AERODROME_FACTORY_ADDRESS = w3.to_checksum_address('0x420DD381b31aEf6683db6B902084cB0FFECe40Da')
-    deadline = w3.eth.get_block("latest")["timestamp"] + 300  # 5-minute deadline
+    deadline = chain_state()["timestamp"] + 300  # 5-minute deadline
     stable = False
     routes = [{
         "from": w3.to_checksum_address(token_in),
@@ -410,37 +646,29 @@ def aerodrome_swap(token_in, token_out, amount_in, amount_out_min, smart_take_pr
     amountOutMin = amountOutMin * 0.99
     amountOutMin = amountOutMin * (10**get_token_decimals(token_out))
     amountOutMin = int(amountOutMin)
-    swap_tx = router_contract.functions.swapExactTokensForTokens(
+    # Sign and Send Transaction
+    tx_hash = send_transaction(lambda nonce: router_contract.functions.swapExactTokensForTokens(
         amount_in,
         amountOutMin,
         routes,  
         w3.to_checksum_address(WALLET_ADDRESS),
         deadline
-    ).build_transaction({
+    ).build_transaction(FEES.tx_params((AERODROME_ROUTER, route_shape(routes)), 300000, **{
         "from": w3.to_checksum_address(WALLET_ADDRESS),
-        "gas": 300000,
-        "gasPrice": int(w3.eth.gas_price * 1.5),
-        "nonce": w3.eth.get_transaction_count(WALLET_ADDRESS),
-    })
-
-    # Sign and Send Transaction
-    signed_swap_tx = w3.eth.account.sign_transaction(swap_tx, PRIVATE_KEY)
-    tx_hash = w3.eth.send_raw_transaction(signed_swap_tx.raw_transaction)
+        "nonce": nonce,
+    })))
     print(f"✅ Swap Transaction Sent: {tx_hash.hex()}")
-    try:
-    # Wait for Confirmation
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        print(f"✅ Swap Successful! Tx Hash: {tx_hash.hex()}")
-    except Exception as e:
-        logger.error(f"Error in main loop: {e}")
-    time.sleep(1)
+    spend_allowance(token_in, AERODROME_ROUTER, amount_in)
+    # Confirmation comes from the receipt tracker; the follow-up swap is ordered behind this one by its nonce
+    track_transaction(tx_hash, (AERODROME_ROUTER, route_shape(routes)),
+                      swap_receipt_handler(token_in, AERODROME_ROUTER, amount_in, on_receipt))
     
     #####sell with to usdc
     if token_out == w3.to_checksum_address("0x4200000000000000000000000000000000000006") and smart_take_profit == True:
-        approve_token(token_out, AERODROME_ROUTER, amountOutMin)  # Approve 10
+        ensure_allowance(token_out, AERODROME_ROUTER, amountOutMin)
 
         
-        deadline = w3.eth.get_block("latest")["timestamp"] + 300  # 5-minute deadline
+        deadline = chain_state()["timestamp"] + 300  # 5-minute deadline
         stable = False
         routes = [{
             "from": w3.to_checksum_address(token_out), #WETH
@@ -453,129 +681,135 @@ def aerodrome_swap(token_in, token_out, amount_in, amount_out_min, smart_take_pr
         amountOutUSDC = amountOutUSDC * 0.99
         amountOutUSDC = amountOutUSDC * (10**6)
         amountOutUSDC = int(amountOutUSDC)    
-        swap_tx = router_contract.functions.swapExactTokensForTokens(
+        # Sign and Send Transaction
+        tx_hash = send_transaction(lambda nonce: router_contract.functions.swapExactTokensForTokens(
             amountOutMin,
             amountOutUSDC,
             routes,  
             w3.to_checksum_address(WALLET_ADDRESS),
             deadline
-        ).build_transaction({
+        ).build_transaction(FEES.tx_params((AERODROME_ROUTER, route_shape(routes)), 300000, **{
             "from": w3.to_checksum_address(WALLET_ADDRESS),
-            "gas": 300000,
-            "gasPrice": int(w3.eth.gas_price * 1.5),
-            "nonce": w3.eth.get_transaction_count(WALLET_ADDRESS),
-        })
-
-        # Sign and Send Transaction
-        signed_swap_tx = w3.eth.account.sign_transaction(swap_tx, PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_swap_tx.raw_transaction)
+            "nonce": nonce,
+        })))
         print(f"✅ Swap Transaction Sent: {tx_hash.hex()}")
-        try:
-        # Wait for Confirmation
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-            print(f"✅ Swap Successful! Tx Hash: {tx_hash.hex()}")
-        except Exception as e:
-            logger.error(f"Error in main loop: {e}")
+        spend_allowance(token_out, AERODROME_ROUTER, amountOutMin)
+        track_transaction(tx_hash, (AERODROME_ROUTER, route_shape(routes)),
+                          swap_receipt_handler(token_out, AERODROME_ROUTER, amountOutMin))
     #####
     return tx_hash
 
 
+from web3 import Web3
+from eth_account import Account
 
+# **BATCH EXECUTION** (every swap of one decision cycle in one BatchSwapExecutor transaction)
+BATCH_EXECUTOR_ADDRESS = os.getenv("BATCH_EXECUTOR_ADDRESS")  # Deployed contracts/BatchSwapExecutor.vy; unset = one tx per swap
+AERODROME_FACTORY = "0x420DD381b31aEf6683db6B902084cB0FFECe40Da"
+BASE_WETH_ADDRESS = "0x4200000000000000000000000000000000000006"
+BASE_USDC_ADDRESS = "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913"
+BATCH_SWAP_GAS = 300000  # Gas per swap in a batch transaction
 
-def uniswap_v2_swap(token_in, token_out, amount_in, amount_out_min):
-    router_contract = w3.eth.contract(address=UNISWAP_V2_ROUTER, abi=UNISWAP_V2_ABI)
 
-    # Build Swap Transaction
-    deadline = w3.eth.get_block("latest")["timestamp"] + 300  # 5-minute deadline
-    swap_tx = router_contract.functions.swapExactTokensForTokens(
-        amount_in,
-        amount_out_min,
-        [token_in, token_out],  # Token path
-        WALLET_ADDRESS,
-        deadline
-    ).build_transaction({
-        "from": WALLET_ADDRESS,
-        "gas": 300000,
-        "gasPrice": int(w3.eth.gas_price * 1.5),
-        "nonce": w3.eth.get_transaction_count(WALLET_ADDRESS),
-    })
-    try:
-        # Sign and Send Transaction
-        signed_swap_tx = w3.eth.account.sign_transaction(swap_tx, PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_swap_tx.raw_transaction)
-        print(f"✅ Swap Transaction Sent: {tx_hash.hex()}")
-    
-        # Wait for Confirmation
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        print(f"✅ Swap Successful! Tx Hash: {tx_hash.hex()}")
-    except Exception as e:
-        logger.error(f"Error in main loop: {e}")
-    return 
+def swap_routes(trade):
+    """Aerodrome routes for a trade; a smart take profit continues WETH -> USDC in the same swap."""
+    hops = [trade["tokenIn"], trade["tokenOut"]]
+    if trade.get("smart_take_profit") and trade["tokenOut"].lower() == BASE_WETH_ADDRESS.lower():
+        hops.append(BASE_USDC_ADDRESS)
+    return [(w3.to_checksum_address(hop_from), w3.to_checksum_address(hop_to), False, w3.to_checksum_address(AERODROME_FACTORY))
+            for hop_from, hop_to in zip(hops, hops[1:])]
 
-from web3 import Web3
-from eth_account import Account
 
 def execute_batch_trades(trades):
-    """Executes multiple trades in a single transaction."""
+    """Executes the trades in a single BatchSwapExecutor transaction; returns the trades it did not send.
+
+    Every swap is quoted in one multicall and gets 1% slippage like aerodrome_swap. Inside the
+    contract each swap is tried on its own, so a failing swap refunds its input and the rest
+    still fill. Trades without a quote (or all of them, if the batch could not be sent) are
+    returned for the caller to send one tx per swap, so each one still gets its record_fill.
+    Once the batch transaction is sent its swaps are settled by its receipt only, so nothing
+    that fails after the send can make the caller send them a second time.
+    """
     if not trades:
         print("✅ No trades to execute.")
-        return
+        return []
     
-    router = w3.eth.contract(address=UNISWAP_V2_ROUTER, abi=UNISWAP_V2_ABI)
-
-    txs = []
+    executor_address = w3.to_checksum_address(BATCH_EXECUTOR_ADDRESS)
+    executor = w3.eth.contract(address=executor_address, abi=BATCH_EXECUTOR_ABI)
+    router_contract = w3.eth.contract(address=AERODROME_ROUTER, abi=AERODROME_ROUTER_ABI)
 
     try:
-        #First approve all tokens
-        for trade in trades:
-            approve_token(to_checksum(trade["tokenIn"]), UNISWAP_V2_ROUTER, trade["amountIn"])  # Approve 10
-
-        nonce = w3.eth.get_transaction_count(WALLET_ADDRESS)
-        for trade in trades:
-            path = [trade["tokenIn"], trade["tokenOut"]]
-            amount_in = trade["amountIn"]
-            amount_out_min = trade["amountOutMin"]
-
-            tx = router.functions.swapExactTokensForTokens(
-                amount_in, 0, path, WALLET_ADDRESS, int(time.time()) + 600
-            ).build_transaction({
-                "from": WALLET_ADDRESS,
-                "gas": 250000,
-                "gasPrice": w3.to_wei('5', 'gwei'),
-                "nonce": nonce
-            })
-
-        signed_tx = w3.eth.account.sign_transaction(tx, PRIVATE_KEY)
-        txs.append(signed_tx.raw_transaction)
-        nonce += 1
-
-        # **Send all transactions together**
-        tx_hashes = [w3.eth.send_raw_transaction(tx) for tx in txs]
-    
-        print(f"✅ Sent {len(trades)} trades in batch!")
-        # **🔄 Wait for all transactions to be confirmed**
-        receipts = []
-        for tx_hash in tx_hashes:
-            print(f"⏳ Waiting for transaction {tx_hash.hex()} to be confirmed...")
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)  # ⏳ Wait max 120 sec
-            receipts.append(receipt)
-            print(f"✅ Transaction {tx_hash.hex()} confirmed in block {receipt.blockNumber}")
-
-        print(f"✅ All {len(trades)} trades confirmed! 🎉")
-        return receipts
+        routes = [swap_routes(trade) for trade in trades]
+        quotes = multicall([(AERODROME_ROUTER, HexBytes(router_contract.encode_abi("getAmountsOut", args=[int(trade["amountIn"]), trade_routes])))
+                            for trade, trade_routes in zip(trades, routes)])
+        batch, swaps, unquoted = [], [], []
+        for trade, trade_routes, (success, data) in zip(trades, routes, quotes):
+            if not success:
+                print(f"❌ No quote for {trade['tokenIn']} -> {trade['tokenOut']}, sending it on its own.")
+                unquoted.append(trade)
+                continue
+            amount_out_min = int(w3.codec.decode(["uint256[]"], data)[0][-1] * 0.99)
+            batch.append(dict(trade, tokenOut=trade_routes[-1][1]))
+            swaps.append((w3.to_checksum_address(trade["tokenIn"]), int(trade["amountIn"]), amount_out_min, trade_routes))
+        if not swaps:
+            return unquoted
+
+        # The executor pulls each input from the wallet, so it is the spender to approve
+        # approve() replaces the allowance, so a token swapped twice is approved for its total
+        totals = {}
+        for swap in swaps:
+            totals[swap[0]] = totals.get(swap[0], 0) + swap[1]
+        prefetch_allowances([(token, executor_address) for token in totals])
+        for token, amount in totals.items():
+            ensure_allowance(token, executor_address, amount)
+
+        deadline = chain_state()["timestamp"] + 300  # 5-minute deadline
+        gas_key = (executor_address, tuple(route_shape(swap[3]) for swap in swaps))
+        tx_hash = send_transaction(lambda nonce: executor.functions.batchSwap(swaps, deadline).build_transaction(
+            FEES.tx_params(gas_key, BATCH_SWAP_GAS * len(swaps), **{"from": WALLET_ADDRESS, "nonce": nonce})))
     except Exception as e:
-        logger.error(f"Error in main loop: {e}")
-    return 
-
-def autoTrade(token_in, token_out, amount_in, amount_out_min, pool_fee, smart_take_profit = False):
+        logger.error(f"Error sending batch transaction: {e}")
+        return trades
+
+    # ✅ Sent: from here on the receipt settles these swaps, they never go out one at a time
+    print(f"✅ Sent {len(swaps)} trades in one batch transaction: {tx_hash.hex()}")
+    for swap in swaps:
+        spend_allowance(swap[0], executor_address, swap[1])
+
+    def on_receipt(receipt):
+        # A swap that failed inside a mined batch may still have used its allowance, so only a
+        # reverted (or never mined) batch drops the cached values
+        for swap in swaps:
+            ALLOWANCES.swap_receipt(swap[0], executor_address, swap[1], receipt)
+        record_batch_fill(batch, receipt)
+    track_transaction(tx_hash, gas_key, on_receipt)
+    return unquoted
+
+
+def record_batch_fill(trades, receipt):
+    """record_fill() for each swap of a batch transaction, using its SwapResult event."""
+    if receipt is None:
+        for trade in trades:
+            record_fill(trade, None)
+        return
+    results = swap_results(receipt, BATCH_EXECUTOR_ADDRESS)
+    for result in results.values():
+        if not result.success:
+            print(f"❌ Batch swap {result.index} failed: {result.reason[:100]!r}")
+    for index, trade in enumerate(trades):
+        result = results.get(index)
+        filled = receipt["status"] == 1 and result is not None and result.success
+        record_fill(trade, receipt, filled=filled, amount_out=result.amount_out if result else 0)
+
+def autoTrade(token_in, token_out, amount_in, amount_out_min, pool_fee, smart_take_profit = False, on_receipt=None):
     try:
         token_in = w3.to_checksum_address(token_in)
         token_out = w3.to_checksum_address(token_out)
-        # Step 1: Approve Uniswap V3 Router to Spend Tokens
+        # Step 1: Approve the router to spend tokens (skipped while the cached allowance covers it)
         #for trade in trades
-        approve_token(token_in, AERODROME_ROUTER, amount_in)  # Approve 10
+        ensure_allowance(token_in, AERODROME_ROUTER, amount_in)
 
-        aerodrome_swap(token_in, token_out, amount_in, amount_out_min, smart_take_profit)
+        aerodrome_swap(token_in, token_out, amount_in, amount_out_min, smart_take_profit, on_receipt)
         #execute_batch_trades(trades)
     except Exception as e:
         logger.error(f"Error in main loop: {e}")
@@ -605,18 +839,79 @@ def log_trade(trade_type, token, price, profit_loss=0, reason=""):
         writer.writerow(trade_data)
 
 
+TRANSFER_TOPIC = Web3.to_hex(Web3.keccak(text="Transfer(address,address,uint256)"))
+
+
+def received_amount(receipt, token):
+    """Amount of `token` transferred to WALLET_ADDRESS in `receipt` (smallest units)."""
+    wallet = WALLET_ADDRESS.lower()
+    return sum(word(bytes(log["data"]), 0) for log in receipt["logs"]
+               if log["address"].lower() == token.lower() and len(log["topics"]) == 3
+               and Web3.to_hex(log["topics"][0]) == TRANSFER_TOPIC and "0x" + Web3.to_hex(log["topics"][2])[-40:] == wallet)
+
+
+def log_fill(trade, receipt, amount_out, status):
+    receipt = receipt or {}  # Timed out: only the trade side is known
+    fill_data = {
+        "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "tx_hash": Web3.to_hex(receipt["transactionHash"]) if receipt else "",
+        "token_in": trade["tokenIn"],
+        "token_out": trade["tokenOut"],
+        "amount_in": int(trade["amountIn"]),
+        "amount_out_min": int(trade["amountOutMin"]),
+        "amount_out": amount_out,
+        "status": status,
+        "block": receipt.get("blockNumber"),
+        "gas_used": receipt.get("gasUsed"),
+        "effective_gas_price": receipt.get("effectiveGasPrice"),
+    }
+    file_exists = os.path.exists(FILL_LOG_FILE)
+    with open(FILL_LOG_FILE, mode="a", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fill_data.keys())
+        if not file_exists:
+            writer.writeheader()
+        writer.writerow(fill_data)
+
+
+def record_fill(trade, receipt, filled=None, amount_out=None):
+    """Book a mined swap: a fill log row, and the position undone if it reverted.
+
+    `filled`/`amount_out` override what the receipt says for swaps that share a batch transaction.
+    A None receipt (not mined before the tracker timeout) is booked as not filled.
+    """
+    global held_tokens, held_token_prices
+    if receipt is None:
+        log_fill(trade, None, 0, "timeout")
+        print(f"❌ Swap {trade['tokenIn']} -> {trade['tokenOut']} not mined in time, undoing the position")
+    else:
+        if filled is None:
+            filled = receipt["status"] == 1
+        if amount_out is None:
+            amount_out = received_amount(receipt, trade["tokenOut"])
+        log_fill(trade, receipt, amount_out, int(filled))
+        if filled:
+            print(f"✅ Swap Successful! Tx Hash: {Web3.to_hex(receipt['transactionHash'])} ({amount_out} received)")
+            return
+        print(f"❌ Swap Reverted! Tx Hash: {Web3.to_hex(receipt['transactionHash'])}")
+    with STATE_LOCK:
+        if trade.get("position") is not None:
+            # Sell reverted: the tokens are still in the wallet, so reopen the position
+            held_tokens.add(trade["tokenIn"].lower())
+            held_token_prices[trade["tokenIn"].lower()] = trade["position"]
+        else:
+            # Buy reverted: nothing was bought
+            held_tokens.discard(trade["tokenOut"].lower())
+            held_token_prices.pop(trade["tokenOut"].lower(), None)
+        save_held_tokens()
+        EXIT_ENGINE.sync(held_token_prices)
+
+
 def discover_token_pairs(force_refresh=False):
     """Fetch Uniswap v3 token pairs (caches results for 1 hour)."""
-    global LAST_PAIR_FETCH_TIME
-    now = time.time()
-
     # **Check if last fetch was within 1 hour**
-    if not force_refresh and now - LAST_PAIR_FETCH_TIME < 3600:
-        try:
-            with open(TOKEN_PAIRS_CACHE_FILE, "r") as f:
-                return json.load(f)  # Load from cache
-        except FileNotFoundError:
-            pass  # If cache not found, fetch fresh data
+    cached = load_cached_fetch("uniswap_token_pairs", force_refresh)
+    if cached is not None:
+        return cached
 
     # **Fetch data from TheGraph**
     try:
@@ -661,9 +956,7 @@ def discover_token_pairs(force_refresh=False):
             })
 
         # **Update Cache**
-        LAST_PAIR_FETCH_TIME = now
-        with open(TOKEN_PAIRS_CACHE_FILE, "w") as f:
-            json.dump(token_pairs, f)
+        save_cached_fetch("uniswap_token_pairs", token_pairs)
 
         return token_pairs
 
@@ -671,34 +964,6 @@ def discover_token_pairs(force_refresh=False):
         logging.error(f"❌ Error discovering token pairs: {e}")
         return []
 
-def check_and_approve_allowance(token_address, spender_address, required_amount):
-    """Check token allowance and approve if necessary."""
-    try:
-        token_contract = w3.eth.contract(address=w3.to_checksum_address(token_address), abi=ERC20_ABI)
-
-        # Check allowance
-        allowance = token_contract.functions.allowance(owner_address, spender_address).call()
-        logger.info(f"Current allowance for {token_address}: {allowance}")
-
-        if allowance < required_amount:
-            logger.info(f"Insufficient allowance. Approving {required_amount} for {spender_address}...")
-            approve_tx = token_contract.functions.approve(spender_address, required_amount).build_transaction({
-                'from': owner_address,
-                'gas': 100000,
-                'gasPrice': w3.eth.gas_price,
-                'nonce': w3.eth.get_transaction_count(owner_address)
-            })
-
-            signed_approve_tx = w3.eth.account.sign_transaction(approve_tx, private_key=PRIVATE_KEY)
-            tx_hash = w3.eth.send_raw_transaction(signed_approve_tx.raw_transaction)
-            logger.info(f"Approval transaction sent. Tx hash: {tx_hash.hex()}")
-
-        else:
-            logger.info(f"Sufficient allowance already exists for {spender_address}.")
-
-    except Exception as e:
-        logger.error(f"Error checking or approving allowance for {token_address}: {e}")
-
 
 def get_pool_address(pool_id):
     """Fetch Uniswap V3 pool address using pool ID from Polygon RPC (No Graph API)"""
@@ -715,12 +980,11 @@ def get_pool_address(pool_id):
         return None
 
 def decode_swap_log(log):
-    """ Decodes a Uniswap V2 Swap event log and formats it into swap_data """
+    """ Decodes an Aerodrome pool Swap event log and formats it into swap_data """
     
     try:
         # Ensure log is for Swap event
-        swap_event_topic = event_abi_to_log_topic(SWAP_EVENT_ABI)
-        if log["topics"][0].hex() != swap_event_topic:
+        if Web3.to_hex(log["topics"][0]) != SWAP_EVENT_TOPIC:
             return None  # Skip invalid logs
 
         # Decode the log
@@ -759,7 +1023,6 @@ UNISWAP_V2_PAIR_ABI = [
 ]
 
 
-
 def monitor_swaps_mock(pool_id):
     """Mock swap data to simulate real swaps happening in pools."""
     return [{
@@ -767,83 +1030,84 @@ def monitor_swaps_mock(pool_id):
     }]
 
 
+# Aerodrome Swap(address indexed sender, address indexed to, uint256 amount0In, uint256 amount1In,
+#                uint256 amount0Out, uint256 amount1Out) = 0xb3e27736...
+SWAP_EVENT_TOPIC = Web3.to_hex(event_abi_to_log_topic(SWAP_EVENT_ABI))
+SWAP_LOG_DATA_SIZE = 128  # The four uint256 amounts
+SWAP_LOG_ADDRESS_CHUNK = 5000  # Addresses per eth_getLogs filter (provider limit)
+UINT256_LIMB_WEIGHTS = np.array([2.0 ** 192, 2.0 ** 128, 2.0 ** 64, 1.0])
+
+
+def decode_swap_amounts(logs):
+    """Batch-decode Swap log data into an (N, 4) float array of amount0In, amount1In, amount0Out, amount1Out.
+
+    The four amounts are static uint256 words, so the whole batch is decoded at once as
+    big-endian 64-bit limbs instead of running an ABI decoder per log. Every log must carry
+    exactly SWAP_LOG_DATA_SIZE bytes of data (see well_formed_swap_logs()).
+    """
+    if not logs:
+        return np.empty((0, 4))
+    raw = b"".join(bytes(log["data"]) for log in logs)
+    limbs = np.frombuffer(raw, dtype=">u8").reshape(len(logs), 4, 4).astype(np.float64)
+    return limbs @ UINT256_LIMB_WEIGHTS
+
+
+def well_formed_swap_logs(logs):
+    """Drop logs whose data is not the four Swap amounts, so one bad log cannot sink the batch decode."""
+    well_formed = [log for log in logs if len(log["data"]) == SWAP_LOG_DATA_SIZE]
+    if len(well_formed) < len(logs):
+        logging.warning(f"⚠️ Skipped {len(logs) - len(well_formed)} malformed swap logs")
+    return well_formed
+
+
+def fetch_swaps_by_pool(pool_ids, from_block, to_block="latest"):
+    """Fetch Swap logs for all `pool_ids` with one eth_getLogs; returns {pool id: [swap_data, ...]} in chain order."""
+    addresses = [address for address in (get_pool_address(pool_id) for pool_id in pool_ids) if address]
+    logs = []
+    for start in range(0, len(addresses), SWAP_LOG_ADDRESS_CHUNK):
+        logs.extend(get_logs({
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "address": addresses[start:start + SWAP_LOG_ADDRESS_CHUNK],
+            "topics": [SWAP_EVENT_TOPIC],
+        }))
+    print(f"✅ Found {len(logs)} swap logs for {len(addresses)} pools")
+
+    logs = well_formed_swap_logs(logs)
+    amounts = decode_swap_amounts(logs)
+    amount0_in, amount1_in, amount0_out, amount1_out = amounts.T
+
+    # ✅ Price Calculation (token0 in token1 and token1 in token0), vectorized over the batch
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sell0 = (amount0_in > 0) & (amount1_out > 0)
+        sell1 = (amount1_in > 0) & (amount0_out > 0)
+        price_token0 = np.where(sell0, amount1_out / amount0_in, np.where(sell1, amount1_in / amount0_out, np.nan))
+        price_token1 = np.where(sell0, amount0_in / amount1_out, np.where(sell1, amount0_out / amount1_in, np.nan))
+
+    swaps_by_pool = {}
+    for log, row, p0, p1 in zip(logs, amounts.tolist(), price_token0.tolist(), price_token1.tolist()):
+        swaps_by_pool.setdefault(log["address"].lower(), []).append({
+            "transactionHash": log["transactionHash"].hex(),
+            "blockNumber": log["blockNumber"],
+            "amount0In": row[0],
+            "amount1In": row[1],
+            "amount0Out": row[2],
+            "amount1Out": row[3],
+            "amountUSD": abs(row[0]) + abs(row[1]),  # ✅ USD value traded
+            "price_token0": None if p0 != p0 else p0,  # NaN -> None
+            "price_token1": None if p1 != p1 else p1
+        })
+    return swaps_by_pool
+
 
 def monitor_swaps(pool_id):
-    """Fetch recent swaps from Polygon RPC using Uniswap V3 pool ID"""
-    """Mock monitor_swaps function using preloaded mock data"""
-    #global monitor_swaps_data
-    #return monitor_swaps_data.get(pool_id, [])  # Return mock swap data
+    """Fetch recent swaps from RPC for one pool (see fetch_swaps_by_pool() for many pools at once)"""
     global FETCH_SWAPS_FROM_LATEST_XBLOCKS
     try:
-        # **Fetch Pool Address from Pool ID**
-        pool_address = get_pool_address(pool_id)
-
-        if not pool_address:
-            logging.error(f"❌ Pool address not found for pool ID: {pool_id}")
-            return []
-
-        # **Swap Event Signature (Uniswap V3)**
-        #swap_event_signature = w3.solidity_keccak(['string'],['Swap(address,address,int256,int256,uint160,uint128,int24)']).hex()
-        #print(f"🔍 Debug: Swap Event Signature -> {swap_event_signature}")
-        swap_event_signature = "0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822"
-        #print(f"🔍 Debug: Swap Event Signature -> {swap_event_signature}")
-
-        # **Fetch Swap Logs from Polygon RPC**
-        logs = w3.eth.get_logs({
-            "fromBlock": w3.eth.block_number - FETCH_SWAPS_FROM_LATEST_XBLOCKS,  # Last 500 blocks (~10 minutes)
-            "toBlock": "latest",
-            "pair_address": pool_address,  # ✅ Now using pool address
-            "topics": [swap_event_signature]  # Filter only Swap events
-        })
-        #print(logs)
+        swaps_by_pool = fetch_swaps_by_pool([pool_id], latest_block_number() - FETCH_SWAPS_FROM_LATEST_XBLOCKS)
         if FETCH_SWAPS_FROM_LATEST_XBLOCKS == 500000 and IF_FETCH_SWAPS_FROM_LATEST_XBLOCKS:
             FETCH_SWAPS_FROM_LATEST_XBLOCKS = 500
-
-        print(f"✅ Found {len(logs)} logs (After Filtering)")
-        decoded_swaps = []
-        for log in logs:
-            try:
-                # Instantiate the contract
-                pair_contract = w3.eth.contract(address= pool_address, abi=UNISWAP_V2_PAIR_ABI)
-
-                # Process the log using Uniswap V2 Swap event
-                decoded_event = pair_contract.events.Swap().process_log(log)
-                
-                amount0_in = float(decoded_event["args"]["amount0In"])
-                amount1_in = float(decoded_event["args"]["amount1In"])
-                amount0_out = float(decoded_event["args"]["amount0Out"])
-                amount1_out = float(decoded_event["args"]["amount1Out"])
-
-                # ✅ Price Calculation
-                if amount0_in > 0 and amount1_out > 0:
-                    price_token0 = abs(amount1_out / amount0_in)  # ✅ Token0 price in Token1
-                    price_token1 = abs(amount0_in / amount1_out)  # ✅ Token1 price in Token0
-                elif amount1_in > 0 and amount0_out > 0:
-                    price_token0 = abs(amount1_in / amount0_out)  # ✅ Token0 price in Token1
-                    price_token1 = abs(amount0_out / amount1_in)  # ✅ Token1 price in Token0
-                else:
-                    price_token0 = None
-                    price_token1 = None
-
-                # ✅ Store Swap Data
-                swap_data = {
-                    "transactionHash": log.transactionHash.hex(),
-                    "blockNumber": log.blockNumber,
-                    "amount0In": amount0_in,
-                    "amount1In": amount1_in,
-                    "amount0Out": amount0_out,
-                    "amount1Out": amount1_out,
-                    "amountUSD": abs(amount0_in) + abs(amount1_in),  # ✅ USD value traded
-                    "price_token0": price_token0,  # ✅ Correct price for token0
-                    "price_token1": price_token1   # ✅ Correct price for token1
-                }
-                decoded_swaps.append(swap_data)
-
-            except Exception as decode_error:
-                logging.error(f"⚠️ Error decoding swap log: {decode_error}")
-                continue
-
-        return decoded_swaps[-15:]  # ✅ Returns **decoded** swaps with `amountUSD`
+        return swaps_by_pool.get(pool_id.lower(), [])[-15:]  # ✅ Returns **decoded** swaps with `amountUSD`
 
     except Exception as e:
         logging.error(f"❌ Error fetching swaps from RPC: {e}")
@@ -864,124 +1128,6 @@ def analyze_volume(swaps):
     return sum(float(swap["amountUSD"]) for swap in swaps)
 
 
-def decide_trades_old(token_pairs, price_history, base_tokens, token_prices, pools, 
-                  threshold=0.05, slippage_tolerance=0.01, min_liquidity=5_000):
-    """Scans ALL Uniswap v3 pools and finds the best tokens to trade dynamically."""
-    global IF_FETCH_SWAPS_FROM_LATEST_XBLOCKS
-    global held_tokens, held_token_prices
-    trades = []
-    
-    X = 600  # ✅ Check last 10 hours dynamically
-    min_X = 5  # ✅ Check last 5 minutes dynamically
-
-    for pair in token_pairs:
-        token0 = pair["token0"]
-        token1 = pair["token1"]
-        pool_id = pair["pairId"]
-        liquidity = pair.get("liquidity", min_liquidity + 1)  # Ensure liquidity is always present
-
-        # **Ensure valid Ethereum address**
-        if len(token0["id"]) != 42 or not token0["id"].startswith("0x"):
-            continue
-        if len(token1["id"]) != 42 or not token1["id"].startswith("0x"):
-            continue
-
-        # Ensure sufficient liquidity
-        if liquidity < min_liquidity:
-            continue
-
-        # **Fetch latest swaps**
-        swaps = monitor_swaps(pool_id)
-        amount_usd = swaps[-1]["amountUSD"] if swaps else 1000.0  # Use fallback if no swaps exist
-
-        # **Price Change Calculation**
-        historical_prices = price_history.get(pool_id, {}).get("prices", [])
-        historical_prices.append(amount_usd)
-        price_history[pool_id] = {"amountUSD": amount_usd, "prices": historical_prices[-X:]}
-
-        price_change_values = [
-            (amount_usd - historical_prices[-i]) / historical_prices[-i]
-            for i in range(min_X, min(X, len(historical_prices))) if len(historical_prices) > i
-        ]
-        price_change = max(price_change_values) if price_change_values else 0.0
-
-        # **Trade decision based on price movements**
-        token0_price = determine_token_price(token0["id"], pools) or token_prices.get(token0["id"], 1.0)
-        token1_price = determine_token_price(token1["id"], pools) or token_prices.get(token1["id"], 1.0)
-
-        if token0_price is None or token1_price is None:
-            continue
-
-        # **Find the best base token and pool order**
-        best_base_token = None
-        best_base_token_price = None
-        best_base_token_decimals = None
-
-        for pool in pools:
-            pool_token0 = pool.get("token0", {}).get("id")
-            pool_token1 = pool.get("token1", {}).get("id")
-
-            for base_token in base_tokens.values():
-                base_token_id = base_token["id"]
-                base_token_decimals = base_token["decimals"]
-
-                if pool_token0 == base_token_id and pool_token1 in [token0["id"], token1["id"]]:
-                    best_base_token = base_token_id
-                    best_base_token_price = token_prices.get(base_token_id, 1.0)
-                    best_base_token_decimals = base_token_decimals
-                    break  
-                elif pool_token1 == base_token_id and pool_token0 in [token0["id"], token1["id"]]:
-                    best_base_token = base_token_id
-                    best_base_token_price = token_prices.get(base_token_id, 1.0)
-                    best_base_token_decimals = base_token_decimals
-                    break  
-            if best_base_token:
-                break  
-
-        trade_direction = None
-        token_to_buy = token0["id"] if token0_price > token1_price else token1["id"]
-        token_to_sell = token1["id"] if token0_price > token1_price else token0["id"]
-
-        # **Buy Logic (Force Execution)**
-        if price_change > threshold and token_to_buy not in held_tokens:
-            held_token_prices[token_to_buy] = token0_price if token0["id"] == token_to_buy else token1_price
-            trade_direction = "buy"
-            held_tokens.add(token_to_buy)
-            
-            # ✅ Force trade execution
-            amount_in = int((1 / best_base_token_price) * (10 ** best_base_token_decimals))
-            trade = {
-                "tokenIn": best_base_token,
-                "tokenOut": token_to_buy,
-                "amountIn": amount_in,
-                "amountOutMin": int(amount_in * (1 - slippage_tolerance)),
-                "poolFee": 3000
-            }
-            trades.append(trade)
-        
-        # **Take Profit / Stop Loss Logic**
-        elif token_to_sell in held_tokens:
-            buy_price = held_token_prices[token_to_sell]
-            adjusted_price_change = (token_prices[token_to_sell] - buy_price) / buy_price
-
-            if adjusted_price_change >= TAKE_PROFIT_PERCENT or adjusted_price_change <= STOP_LOSS_PERCENT:
-                trade_direction = "sell"
-                held_tokens.discard(token_to_sell)
-                del held_token_prices[token_to_sell]
-                
-                # ✅ Force trade execution
-                amount_in = int((1 / best_base_token_price) * (10 ** best_base_token_decimals))
-                trade = {
-                    "tokenIn": token_to_sell,
-                    "tokenOut": best_base_token,
-                    "amountIn": amount_in,
-                    "amountOutMin": int(amount_in * (1 - slippage_tolerance)),
-                    "poolFee": 3000
-                }
-                trades.append(trade)
-    
-    return trades
-
 def extract_swap_price(log, pool_address):
     """Extracts price from Uniswap V2 Swap event log using process_log()."""
     try:
@@ -1012,61 +1158,19 @@ def extract_swap_price(log, pool_address):
         return None
 
 
-
 def fetch_recent_swaps(pair_id, from_block, to_block):
     """
     Fetch the latest swap event price for a given token within Uniswap V2 pools.
     """
     print(f"🔍 Fetching recent swaps for token: {pair_id}...")
 
-    swap_event_signature = "0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822"
-
     try:
-        # **Fetch Pool Address from Pool ID**
-        pool_address = get_pool_address(pair_id)
-
-        if not pool_address:
-            logging.error(f"❌ Pool address not found for pool ID: {pool_id}")
-            return []
-
-        swap_event_signature = "0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822"
-
-        # **Fetch Swap Logs from Polygon RPC**
-        logs = w3.eth.get_logs({
-            "fromBlock": w3.eth.block_number - FETCH_SWAPS_FROM_LATEST_XBLOCKS,  # Last 500 blocks (~10 minutes)
-            "toBlock": "latest",
-            "pair_address": pool_address,  # ✅ Now using pool address
-            "topics": [swap_event_signature]  # Filter only Swap events
-        })
-        
-        print(f"✅ Found fetch_recent_swaps {len(logs)} logs (After Filtering)")   
-
-        decoded_swaps = []
-        for log in logs:
-            try:
-                # Instantiate the contract
-                pair_contract = w3.eth.contract(address= pool_address, abi=UNISWAP_V2_PAIR_ABI)
-
-                # Process the log using Uniswap V2 Swap event
-                decoded_event = pair_contract.events.Swap().process_log(log)
-                # **Extract relevant data**
-                # **Extract Swap Data (Fix for V2)**
-                swap_data = {
-                    "transactionHash": log.transactionHash.hex(),
-                    "blockNumber": log.blockNumber,
-                    "amount0In": float(decoded_event["args"]["amount0In"]),  # ✅ Corrected field name
-                    "amount1In": float(decoded_event["args"]["amount1In"]),
-                    "amount0Out": float(decoded_event["args"]["amount0Out"]),
-                    "amount1Out": float(decoded_event["args"]["amount1Out"]),
-                    "amountUSD": abs(float(decoded_event["args"]["amount0In"])) + abs(float(decoded_event["args"]["amount1In"]))  # ✅ Calculate USD value based on inputs
-                }
-                token_price = swap_data['amount0In'] / swap_data['amount1In'] if swap_data['amount1In'] > 0 else swap_data['amount0Out'] / swap_data['amount1Out']
-                decoded_swaps.append(swap_data)
-                return token_price
-
-            except Exception as e:
-                print(f"❌ ERROR: Failed to decode swap log for {pair_id} - {e}")
-                continue
+        swaps = fetch_swaps_by_pool([pair_id], from_block, to_block).get(pair_id.lower(), [])
+        for swap_data in reversed(swaps):
+            if swap_data["amount1In"] > 0:
+                return swap_data["amount0In"] / swap_data["amount1In"]
+            if swap_data["amount1Out"] > 0:
+                return swap_data["amount0Out"] / swap_data["amount1Out"]
 
     except Exception as e:
         print(f"❌ ERROR: Failed to fetch logs for {pair_id} - {e}")
@@ -1075,57 +1179,60 @@ def fetch_recent_swaps(pair_id, from_block, to_block):
     return None  # ✅ Return None if no valid price found
 
 
-def decide_trades(token_pairs, price_history, token_prices_in_usd, base_tokens, pools, base_token_prices,
-                  threshold=0.02, slippage_tolerance=0.005, min_liquidity=10_000):
-    """Scans ALL Uniswap v2 pools and finds the best tokens to trade dynamically."""
+def decide_trades(snapshot, price_history, token_prices_in_usd, base_tokens, base_token_prices,
+                  threshold=0.02, slippage_tolerance=0.005, min_liquidity=10_000,
+                  held=None, held_prices=None, replay=False):
+    """Scans ALL pools in the market snapshot and finds the best tokens to trade dynamically.
+
+    Positions are read and changed in `held`/`held_prices` (default: the bot's held_tokens and
+    held_token_prices). With `replay` set, no wallet calls are made and nothing is written.
+    """
     global IF_FETCH_SWAPS_FROM_LATEST_XBLOCKS
-    global held_tokens, held_token_prices
+    if held is None:
+        held, held_prices = held_tokens, held_token_prices
+    persist_positions = (lambda: None) if replay else save_held_tokens
+    record_trade = (lambda *args: None) if replay else log_trade
     trades = []
+    pool_index = get_pool_index(snapshot, base_tokens)
 
-    X = 600  # ✅ Check last 10 hours dynamically
     min_X = 5  # ✅ Check last 5 minutes dynamically
 
-    # ✅ Collect all unique tokens
-    unique_tokens = set()
-    for pair in token_pairs:
-        unique_tokens.add(pair["token0"]["id"].lower())
-        unique_tokens.add(pair["token1"]["id"].lower())
-    
-    for token_id in unique_tokens:
-        if token_id in base_tokens.values():
-            continue  # Skip base tokens
-        
-        token_price = token_prices_in_usd.get(token_id, 0)
-        print(f"🔍 DEBUG: token_id = {token_id}, price = {token_price}")
-        
-        if token_price == 0:
-            print(f"⚠️ WARNING: Missing price for {token_id}, skipping.")
-            continue  # Skip if price is missing
-
-        # **Price Change Calculation**
-        historical_prices = price_history.get(token_id, {}).get("prices", [])
-        
-        # Append latest token price
-        if token_price:
-            historical_prices.append(token_price)
-
-        # Keep only last X prices
-        price_history[token_id] = {"prices": historical_prices[-X:]}
-        
-        # Ensure price change is calculated over 5 minutes to 10 hours
-        if len(historical_prices) < min_X:
-            continue
-        
-        # Extract price history
-        token_price_history = [entry for entry in historical_prices]
-
-        # Ensure we have enough history
-        if len(token_price_history) < min_X:
-            continue
-
-        # Get price change over time
-        price_change = (token_price - token_price_history[-min_X]) / token_price_history[-min_X]
-
+    # ✅ Price every tradable token and append the whole tick to the history in one go
+    tokens, token_position = get_trade_universe(snapshot, base_tokens)
+    universe_prices = np.fromiter((token_prices_in_usd.get(token_id, 0) for token_id in tokens),
+                                  dtype=np.float64, count=len(tokens))
+    priced = np.flatnonzero(universe_prices > 0)  # Skip tokens with a missing price
+    priced_tokens = [tokens[i] for i in priced.tolist()]
+    prices = universe_prices[priced]
+    rows = price_history.append_many(priced_tokens, prices)
+
+    # Held positions as arrays aligned with `priced_tokens`
+    priced_position = np.full(len(tokens), -1, dtype=np.int64)
+    priced_position[priced] = np.arange(len(priced))
+    held_ids = [token_id for token_id in held if token_id in token_position]
+    held_index = priced_position[[token_position[token_id] for token_id in held_ids]].astype(np.int64)
+    held_ids = [token_id for token_id, index in zip(held_ids, held_index.tolist()) if index >= 0]
+    held_index = held_index[held_index >= 0]
+    buy_prices = np.array([held_prices[token_id]["buy_price"] for token_id in held_ids], dtype=np.float64)
+    highest_prices = np.array([held_prices[token_id].get("highest_price", held_prices[token_id]["buy_price"])
+                               for token_id in held_ids], dtype=np.float64)
+
+    # ✅ One kernel pass: momentum, stop-loss, take-profit and trailing drawdown for every token
+    signals = momentum_signals(price_history, rows, prices, min_X, threshold, held_index, buy_prices, highest_prices)
+
+    # Update highest price if the price continues to increase
+    for token_id, old_highest, new_highest in zip(held_ids, highest_prices.tolist(), signals.highest_prices.tolist()):
+        if new_highest > old_highest:
+            held_prices[token_id]["highest_price"] = new_highest
+
+    actions = {index: "Buy Signal" for index in signals.buy.tolist()}
+    actions.update({index: "Stop Loss" for index in signals.stop_loss.tolist()})
+    actions.update({index: "SMART TAKE PROFIT" for index in signals.take_profit.tolist()})
+
+    for index, signal in actions.items():
+        token_id = priced_tokens[index]
+        token_price = float(prices[index])
+        price_change = signals.price_change[index]
         print(f"🔍 DEBUG: {token_id} Price Change = {price_change:.4%}, Threshold = {threshold:.4%}")
         
         # **Trade decision based on price movements**
@@ -1133,47 +1240,36 @@ def decide_trades(token_pairs, price_history, token_prices_in_usd, base_tokens,
         temp_token_id = token_id
         temp_buy_price = 0
         temp_current_price = token_price
-        temp_stop_loss_take_profit_buy_signal = ''
+        temp_stop_loss_take_profit_buy_signal = signal
         smart_take_profit = False
-        if price_change > threshold and token_id not in held_tokens:
+        position = None
+        if signal == "Buy Signal":
             trade_direction = "buy"
-            held_token_prices[token_id] = {"buy_price": token_price, "highest_price": token_price}
-            held_tokens.add(token_id)
-            save_held_tokens()  # ✅ Save after buying
+            held_prices[token_id] = {"buy_price": token_price, "highest_price": token_price}
+            held.add(token_id)
+            persist_positions()  # ✅ Save after buying
             print(f"✅ BUY: {token_id} at {token_price:.2f}")
             temp_buy_price = token_price
-            temp_stop_loss_take_profit_buy_signal = "Buy Signal"
-            #log_trade("buy", token_id, token_price, 0, "Buy Signal")
 
-        elif token_id in held_tokens:
-            buy_price = held_token_prices[token_id]["buy_price"]
+        else:
+            position = dict(held_prices[token_id])  # Reopened if the sell reverts
+            buy_price = held_prices[token_id]["buy_price"]
             current_price = token_price
-            highest_price = held_token_prices[token_id].get("highest_price", buy_price)
             temp_buy_price = buy_price
+            trade_direction = "sell"
             # Stop-loss: Sell if price drops 3% from buy price
-            if (current_price - buy_price) / buy_price <= -0.03:
-                trade_direction = "sell"
+            if signal == "Stop Loss":
                 print(f"🚨 STOP LOSS: Selling {token_id}")
-                temp_stop_loss_take_profit_buy_signal = "Stop Loss"
-                #profit_loss = (current_price - buy_price) / buy_price * 100
-                #log_trade("sell", token_id, float(current_price), float(profit_loss), "Stop Loss")
            
-            # Take profit: Sell if price increases by 7% from buy price]
-            elif (current_price - buy_price) / buy_price >= 0.07:
-                # Update highest price if the price continues to increase
-                if current_price > highest_price:
-                    held_token_prices[token_id]["highest_price"] = current_price
-                # If price drops by 2% from the peak, sell
-                if (held_token_prices[token_id]["highest_price"] - current_price) / held_token_prices[token_id]["highest_price"] >= 0.02:
-                    trade_direction = "sell"
-                    smart_take_profit = True
-                    profit_percentage = ((current_price - buy_price) / buy_price) * 100
-                    print(f"💰 SMART TAKE PROFIT: Selling {token_id} at {current_price:.2f} ({profit_percentage:.2f}% profit)")
-                    temp_stop_loss_take_profit_buy_signal = "SMART TAKE PROFIT"
-                    # Remove token from held tokens after selling
-                    held_tokens.discard(token_id)
-                    del held_token_prices[token_id]
-                    save_held_tokens()
+            # Take profit: price reached +7% from buy price, then dropped 2% from the peak
+            else:
+                smart_take_profit = True
+                profit_percentage = ((current_price - buy_price) / buy_price) * 100
+                print(f"💰 SMART TAKE PROFIT: Selling {token_id} at {current_price:.2f} ({profit_percentage:.2f}% profit)")
+                # Remove token from held tokens after selling
+                held.discard(token_id)
+                del held_prices[token_id]
+                persist_positions()
 
             
         if trade_direction:
@@ -1186,28 +1282,15 @@ def decide_trades(token_pairs, price_history, token_prices_in_usd, base_tokens,
             for base in ["WETH"]:
                 base_token_id = base_tokens[base]["id"].lower()  # Convert to lowercase
 
-                for pool in pools:
-                    pool_token0 = pool["token0"]["id"].lower()
-                    pool_token1 = pool["token1"]["id"].lower()
-
-                    # Debugging: Show pool details
-                    print(f"🧐 Checking Pool: {pool_token0} <-> {pool_token1} | Base: {base} ({base_token_id})")
-
-                    # Buying case: Base token must be the input
+                # ✅ O(1) route lookup: deepest pool between this token and the base token
+                best_pool = pool_index.get((token_id, base_token_id))
+                if best_pool:
                     if trade_direction == "buy":
-                        if (pool_token0 == base_token_id and pool_token1 == token_id) or (pool_token1 == base_token_id and pool_token0 == token_id):
-                            print(f"✅ Found Valid BUY Pool: {base_token_id} -> {token_id}")
-                            preferred_base = base_token_id
-                            best_pool = pool
-                            valid_pool_found = True
-
-                    # Selling case: Target token must be the input
-                    elif trade_direction == "sell":
-                        if (pool_token0 == token_id and pool_token1 == base_token_id) or (pool_token1 == token_id and pool_token0 == base_token_id):
-                            print(f"✅ Found Valid SELL Pool: {token_id} -> {base_token_id}")
-                            preferred_base = base_token_id
-                            best_pool = pool
-                            valid_pool_found = True
+                        print(f"✅ Found Valid BUY Pool: {base_token_id} -> {token_id}")
+                    else:
+                        print(f"✅ Found Valid SELL Pool: {token_id} -> {base_token_id}")
+                    preferred_base = base_token_id
+                    valid_pool_found = True
 
                 if valid_pool_found:
                     token_name = base
@@ -1215,21 +1298,21 @@ def decide_trades(token_pairs, price_history, token_prices_in_usd, base_tokens,
 
             if not valid_pool_found:
                 if trade_direction == "buy":
-                    held_tokens.discard(token_id)
-                    held_token_prices.pop(token_id, None)
-                    save_held_tokens()  # ✅ Save after selling
+                    held.discard(token_id)
+                    held_prices.pop(token_id, None)
+                    persist_positions()  # ✅ Save after selling
                 print(f"❌ No valid base token found for {token_id}, skipping.")
                 continue
 
             if valid_pool_found:
                 amount_out_min = 0
                 if trade_direction == "sell":
-                    held_tokens.discard(token_id)
-                    held_token_prices.pop(token_id, None)
-                    save_held_tokens()  # ✅ Save after selling
+                    held.discard(token_id)
+                    held_prices.pop(token_id, None)
+                    persist_positions()  # ✅ Save after selling
                     # Keep only the last 3 prices to prevent old data affecting new buy signals
                     if token_id in price_history:
-                        price_history[token_id]["prices"] = price_history[token_id]["prices"][-3:]  
+                        price_history.truncate(token_id, 3)
                         save_price_history(price_history)  # ✅ Save updated price history
                         print(f"🔄 RESET PRICE HISTORY for {token_id}, keeping last 3 prices.")
                 #amount_in = int((5 / base_tokens[base]["token_price"]) * (10 ** base_tokens[base]["decimals"]))  # 5 USD worth of base token
@@ -1240,28 +1323,49 @@ def decide_trades(token_pairs, price_history, token_prices_in_usd, base_tokens,
                     amount_out_min = (3/token_price)*(1 - slippage_tolerance)
                     amount_out_min = amount_out_min*(10**get_token_decimals(token_id))
                     amount_out_min = int(amount_out_min)
-                    log_trade("buy", token_id, token_price, 0, temp_stop_loss_take_profit_buy_signal)
+                    record_trade("buy", token_id, token_price, 0, temp_stop_loss_take_profit_buy_signal)
                 elif trade_direction == "sell":
-                    amount_in = get_wallet_token_balance(token_id)
+                    amount_in = 0 if replay else get_wallet_token_balance(token_id)
                     #amount_out_min = ((2/get_weth_price())/token_price)*(10**get_token_decimals(token_id))
                     amount_out_min = (((amount_in / (10**get_token_decimals(token_id))) * token_price)/BASE_TOKENS[token_name]["token_price"])*(1 - slippage_tolerance)
                     amount_out_min = amount_out_min*(10**base_tokens[token_name]["decimals"])
                     amount_out_min = int(amount_out_min)
                     profit_loss = (temp_current_price - temp_buy_price) / temp_buy_price * 100
-                    log_trade("sell", temp_token_id, float(temp_current_price), float(profit_loss), temp_stop_loss_take_profit_buy_signal)
+                    record_trade("sell", temp_token_id, float(temp_current_price), float(profit_loss), temp_stop_loss_take_profit_buy_signal)
                 trade = {
                     "tokenIn": token_id if trade_direction == "sell" else preferred_base,
                     "tokenOut": preferred_base if trade_direction == "sell" else token_id,
                     "amountIn": amount_in,
                     "amountOutMin": amount_out_min,
                     "poolFee": 3000,
-                    "smart_take_profit": smart_take_profit
+                    "smart_take_profit": smart_take_profit,
+                    "position": position
                 }
                 trades.append(trade)
             
     return trades
 
 
+def replay_decide_trades(snapshot, start=None, end=None, **decide_kwargs):
+    """Run decide_trades over archived Aerodrome ticks as fast as the CPU allows.
+
+    Uses a fresh in-memory price history and position set, makes no wallet calls and writes
+    no files; returns [(timestamp, trades)] for every tick that produced trades. The live
+    positions are never touched, so a replay can run next to the trading pipeline.
+    """
+    replay_history = PriceHistory(None, PRICE_HISTORY_CAPACITY)
+    replay_held, replay_held_prices = set(), {}
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for timestamp, token_prices in TICK_ARCHIVE.replay(start, end, source="aerodrome"):
+            trades = decide_trades(snapshot=snapshot, price_history=replay_history,
+                                   token_prices_in_usd=token_prices, held=replay_held,
+                                   held_prices=replay_held_prices, replay=True, **decide_kwargs)
+            if trades:
+                results.append((timestamp, trades))
+    return results
+
+
 def fetch_all_token_prices():
     """Fetch all token prices in USD from The Graph API dynamically"""
     query = """
@@ -1310,12 +1414,10 @@ def fetch_all_token_prices():
     return token_prices
 
 
-
-
 def determine_token_price(token_id, pools):
     """Determines the latest token price from Uniswap V2 swaps."""
-    from_block = w3.eth.block_number - 500  # ✅ Last 500 blocks
-    to_block = w3.eth.block_number  # ✅ Current block
+    to_block = latest_block_number()  # ✅ Current block
+    from_block = to_block - 500  # ✅ Last 500 blocks
 
     # Get price from latest swaps
     price = fetch_recent_swaps(token_id, from_block, to_block)
@@ -1359,13 +1461,18 @@ def determine_token_price_mock(token_id, pools):
         return None
 
 
-
 def execute_trades(trades):
     """Execute the trades by interacting with the smart contract."""
     if not trades:
         logger.info("No trades to execute.")
         return
 
+    # One transaction for the whole cycle when the batch executor is deployed; one per swap otherwise
+    if BATCH_EXECUTOR_ADDRESS:
+        trades = execute_batch_trades(trades)  # What the batch did not take goes out one swap at a time
+        if not trades:
+            return
+
     tokens_in = [trade["tokenIn"] for trade in trades]
     tokens_out = [trade["tokenOut"] for trade in trades]
     amounts_in = [int(trade["amountIn"]) for trade in trades]
@@ -1380,12 +1487,14 @@ def execute_trades(trades):
     logger.info(f"Amounts In: {amounts_in}")
     logger.info(f"Amounts Out Min: {amounts_out_min}")
     logger.info(f"Pool Fees: {pool_fees}")
-    
 
+    # One multicall for every allowance this batch needs
+    prefetch_allowances([(token_in, AERODROME_ROUTER) for token_in in tokens_in])
     
     for i in range(len(trades)):
         # Execute autoTrade
-        autoTrade(w3.to_checksum_address(tokens_in[i]), w3.to_checksum_address(tokens_out[i]), amounts_in[i], amounts_out_min[i], pool_fees[i], smart_take_profits[i])
+        autoTrade(w3.to_checksum_address(tokens_in[i]), w3.to_checksum_address(tokens_out[i]), amounts_in[i], amounts_out_min[i], pool_fees[i], smart_take_profits[i],
+                  on_receipt=lambda receipt, trade=trades[i]: record_fill(trade, receipt))
         print(i)
         print(tokens_in[i])
         print(tokens_out[i])
@@ -1400,19 +1509,12 @@ def execute_trades(trades):
         #log_trade(trade_log)
 
 
-
 # **CACHE POOLS (Fetch Only Every 1 Hour)**
 def fetch_all_pools(force_refresh=False):
-    global LAST_POOL_FETCH_TIME
-    now = time.time()
-
     # **Check if last fetch was within 1 hour**
-    if not force_refresh and now - LAST_POOL_FETCH_TIME < 3600:
-        try:
-            with open(POOLS_CACHE_FILE, "r") as f:
-                return json.load(f)  # Load from cache
-        except FileNotFoundError:
-            pass  # If cache not found, fetch fresh data
+    cached = load_cached_fetch("uniswap_pools", force_refresh)
+    if cached is not None:
+        return cached
 
     # Fetch fresh pools
     query = """
@@ -1475,11 +1577,8 @@ def fetch_all_pools(force_refresh=False):
         pools1.extend(pools2)
         pools = pools1
 
-        LAST_POOL_FETCH_TIME = now
-
         # **Cache the response**
-        with open(POOLS_CACHE_FILE, "w") as f:
-            json.dump(pools, f)
+        save_cached_fetch("uniswap_pools", pools)
 
         return pools
 
@@ -1591,43 +1690,11 @@ def convert_to_usd(token_prices_in_base):
     return token_prices_in_usd
 
 
-
 def calculate_all_token_prices(pairs, base_tokens, base_token_prices):
     """
     Compute the price of all tokens in USD, even if they are not paired with base tokens.
     """
-    token_prices_in_usd = {}
-
-    # Step 1: Initialize base tokens with known USD prices
-    for base_token, base_info in base_tokens.items():
-        token_prices_in_usd[base_info["id"].lower()] = base_info["token_price"]
-
-    # Step 2: First pass - Direct price assignments from base tokens
-    for pair in pairs:
-        token0_id = pair["token0"]["id"].lower()
-        token1_id = pair["token1"]["id"].lower()
-        token0_price = float(pair["token0Price"])
-        token1_price = float(pair["token1Price"])
-
-        if token0_id in token_prices_in_usd:
-            token_prices_in_usd[token1_id] = token_prices_in_usd[token0_id] * token0_price
-        elif token1_id in token_prices_in_usd:
-            token_prices_in_usd[token0_id] = token_prices_in_usd[token1_id] * token1_price
-
-    # Step 3: Second pass - Fill missing values indirectly
-    for _ in range(3):  # Repeat up to 3 times to fill missing prices via connected pairs
-        for pair in pairs:
-            token0_id = pair["token0"]["id"].lower()
-            token1_id = pair["token1"]["id"].lower()
-            token0_price = float(pair["token0Price"])
-            token1_price = float(pair["token1Price"])
-
-            if token0_id in token_prices_in_usd and token1_id not in token_prices_in_usd:
-                token_prices_in_usd[token1_id] = token_prices_in_usd[token0_id] * token0_price
-            elif token1_id in token_prices_in_usd and token0_id not in token_prices_in_usd:
-                token_prices_in_usd[token0_id] = token_prices_in_usd[token1_id] * token1_price
-
-    return token_prices_in_usd
+    return propagate_usd_prices(build_price_graph(pairs), base_token_usd_prices(base_tokens))
 
 def fetch_pairs():
 # **Fetch data from TheGraph**
@@ -1677,24 +1744,19 @@ def fetch_pairs():
 def load_held_tokens():
     global held_tokens, held_token_prices
 
-    if os.path.exists(HELD_TOKENS_FILE):
-        with open(HELD_TOKENS_FILE, "r") as file:
-            data = json.load(file)
-            held_tokens = set(data.get("held_tokens", []))
-            held_token_prices = data.get("held_token_prices", {})
-        print(f"🔄 Loaded {len(held_tokens)} held tokens from file.")
+    POSITION_JOURNAL.import_legacy(held_tokens_file=HELD_TOKENS_FILE)
+    positions = POSITION_JOURNAL.open_positions()
+    held_tokens = set(positions)
+    held_token_prices = {token: position for token, position in positions.items() if position is not None}
+    print(f"🔄 Loaded {len(held_tokens)} held tokens from the position journal.")
 
 # ✅ Save Held Tokens to File (every time we buy/sell)
 def save_held_tokens():
     global held_tokens, held_token_prices
     
-    data = {
-        "held_tokens": list(held_tokens),
-        "held_token_prices": held_token_prices
-    }
-    
-    with open(HELD_TOKENS_FILE, "w") as file:
-        json.dump(data, file, indent=4)
+    # Appends only the open/update/close events since the last save; fsyncs are batched
+    POSITION_JOURNAL.record({token: held_token_prices.get(token) for token in held_tokens})
+    POSITION_JOURNAL.commit()
 
 import time
 import json
@@ -1704,25 +1766,17 @@ import logging
 # Constants
 BITQUERY_API_KEY = "YOUR_BITQUERY_API_KEY"
 BITQUERY_URL = "https://graphql.bitquery.io/"
-POOLS_CACHE_FILE = "pools_cache.json"
-LAST_POOL_FETCH_TIME = 0
+BITQUERY = GraphQLClient(BITQUERY_URL, headers={"X-API-KEY": BITQUERY_API_KEY})
 
 # **CACHE POOLS (Fetch Only Every 1 Hour)**
 def fetch_all_pools_aerodrome(force_refresh=False):
-    global LAST_POOL_FETCH_TIME
-    now = time.time()
-
     # **Check if last fetch was within 1 hour**
-    if not force_refresh and now - LAST_POOL_FETCH_TIME < 3600:
-        try:
-            with open(POOLS_CACHE_FILE, "r") as f:
-                return json.load(f)  # Load from cache
-        except FileNotFoundError:
-            pass  # If cache not found, fetch fresh data
+    cached = load_cached_fetch("bitquery_aerodrome_pools", force_refresh)
+    if cached is not None:
+        return cached
 
     # **Query 1: token0 must be a base token**
     query1 = """
-    {
         EVM(network: base) {
             DEXTrades(
                 where: {
@@ -1738,12 +1792,10 @@ def fetch_all_pools_aerodrome(force_refresh=False):
                 }
             }
         }
-    }
     """
 
     # **Query 2: token1 must be a base token**
     query2 = """
-    {
         EVM(network: base) {
             DEXTrades(
                 where: {
@@ -1759,41 +1811,22 @@ def fetch_all_pools_aerodrome(force_refresh=False):
                 }
             }
         }
-    }
     """
 
     try:
-        # **Fetch Data for Query 1**
-        response1 = requests.post(
-            BITQUERY_URL,
-            json={"query": query1},
-            headers={"X-API-KEY": BITQUERY_API_KEY}
-        )
-        response1.raise_for_status()
-        data1 = response1.json()
-
-        # **Fetch Data for Query 2**
-        response2 = requests.post(
-            BITQUERY_URL,
-            json={"query": query2},
-            headers={"X-API-KEY": BITQUERY_API_KEY}
-        )
-        response2.raise_for_status()
-        data2 = response2.json()
+        # **Fetch both queries in one request (aliased fields)**
+        data = BITQUERY.execute_many({"token0_base": query1, "token1_base": query2})
 
         # **Process Data**
-        pools1 = parse_pools(data1)
-        pools2 = parse_pools(data2)
+        pools1 = parse_pools({"data": {"EVM": data["token0_base"]}})
+        pools2 = parse_pools({"data": {"EVM": data["token1_base"]}})
 
         # **Combine Pools**
         pools1.extend(pools2)
         pools = pools1
 
-        LAST_POOL_FETCH_TIME = now
-
         # **Cache the response**
-        with open(POOLS_CACHE_FILE, "w") as f:
-            json.dump(pools, f)
+        save_cached_fetch("bitquery_aerodrome_pools", pools)
 
         return pools
 
@@ -1846,20 +1879,98 @@ def get_expected_output(token_in, token_out, amount_in, pools):
     return 0  # No valid pool found
 
 
-def get_token_decimals(token_address):
-    """Fetches the number of decimals for an ERC-20 token."""
+# **TOKEN REGISTRY** (decimals/symbol/checksum address, persisted in MARKET_STORE)
+TOKEN_REGISTRY = {}  # lower-case token id -> {"id": checksum address, "symbol": str, "decimals": int}
 
-    ERC20_ABI_DECIMALS = [
-    {
-        "constant": True,
-        "inputs": [],
-        "name": "decimals",
-        "outputs": [{"name": "", "type": "uint8"}],
-        "type": "function",
-    }
-]
 
-    token_contract = w3.eth.contract(address=w3.to_checksum_address(token_address), abi=ERC20_ABI_DECIMALS)
+def register_tokens(tokens):
+    """Add {"id", "symbol", "decimals"} tokens to the registry and persist the new ones."""
+    new_tokens = []
+    for token in tokens:
+        token_id = token["id"].lower()
+        if token.get("decimals") is None:
+            continue
+        decimals = int(token["decimals"])
+        known = TOKEN_REGISTRY.get(token_id)
+        if known and known["decimals"] == decimals and known["symbol"] == token.get("symbol"):
+            continue  # Already registered, skip the checksum work
+        TOKEN_REGISTRY[token_id] = {"id": w3.to_checksum_address(token_id), "symbol": token.get("symbol"), "decimals": decimals}
+        new_tokens.append({"id": token_id, "symbol": token.get("symbol"), "decimals": decimals})
+    MARKET_STORE.upsert_tokens(new_tokens)
+
+
+def register_pool_tokens(pools):
+    """Seed the registry from the decimals the subgraph already returns with each pool."""
+    register_tokens([pool[side] for pool in pools for side in ("token0", "token1")])
+
+
+def load_token_registry():
+    """Load persisted token metadata and seed the base tokens (once, at startup)."""
+    for token in MARKET_STORE.all_tokens():
+        TOKEN_REGISTRY[token["id"]] = {
+            "id": w3.to_checksum_address(token["id"]),
+            "symbol": token["symbol"],
+            "decimals": token["decimals"],
+        }
+    register_tokens([{"id": info["id"], "symbol": symbol, "decimals": info["decimals"]}
+                     for symbol, info in BASE_TOKENS.items()])
+    print(f"🔄 Loaded {len(TOKEN_REGISTRY)} tokens into the token registry.")
+
+
+def decode_symbol(return_data):
+    """Decode symbol() output, tolerating tokens that return bytes32 instead of string."""
+    try:
+        return w3.codec.decode(["string"], return_data)[0]
+    except Exception:
+        return return_data[:32].rstrip(b"\x00").decode("utf-8", errors="ignore")
+
+
+def backfill_token_registry(token_ids):
+    """Fetch decimals and symbol for unknown tokens with one batched Multicall3 round trip."""
+    unknown = sorted({token_id.lower() for token_id in token_ids} - TOKEN_REGISTRY.keys())
+    invalid = [token_id for token_id in unknown if not Web3.is_address(token_id)]
+    if invalid:
+        # e.g. symbols from an old held_tokens.json; one bad target would fail the whole multicall
+        logging.error(f"⚠️ Skipping invalid token addresses: {invalid}")
+        unknown = [token_id for token_id in unknown if token_id not in invalid]
+    if not unknown:
+        return
+
+    calls = []
+    for token_id in unknown:
+        calls.append((token_id, DECIMALS_SELECTOR))
+        calls.append((token_id, SYMBOL_SELECTOR))
+    results = multicall(calls)
+
+    tokens = []
+    for i, token_id in enumerate(unknown):
+        decimals_ok, decimals_data = results[2 * i]
+        symbol_ok, symbol_data = results[2 * i + 1]
+        if not decimals_ok or len(decimals_data) < 32:
+            logging.error(f"⚠️ decimals() failed for {token_id}, leaving it out of the registry")
+            continue
+        tokens.append({
+            "id": token_id,
+            "symbol": decode_symbol(symbol_data) if symbol_ok else None,
+            "decimals": int.from_bytes(decimals_data[:32], "big"),
+        })
+    register_tokens(tokens)
+    print(f"✅ Backfilled {len(tokens)}/{len(unknown)} tokens into the token registry.")
+
+
+def get_token_decimals(token_address):
+    """Returns the number of decimals for an ERC-20 token from the registry (RPC only for unknown tokens)."""
+    token_id = token_address.lower()
+    if token_id not in TOKEN_REGISTRY:
+        try:
+            backfill_token_registry([token_id])
+        except Exception as e:
+            logging.error(f"⚠️ Token registry backfill failed for {token_id}: {e}")
+    if token_id in TOKEN_REGISTRY:
+        return TOKEN_REGISTRY[token_id]["decimals"]
+
+    # Multicall backfill failed; ask the token directly
+    token_contract = w3.eth.contract(address=w3.to_checksum_address(token_address), abi=ERC20_ABI)
     return token_contract.functions.decimals().call()
 
 
@@ -1897,365 +2008,616 @@ def update_base_tokens():
 def get_weth_price():
     return BASE_TOKENS["WETH"]["token_price"]
 
-def fetch_all_pools_coinbase_subgraph(force_refresh=False):
-    global LAST_POOL_FETCH_TIME
-    now = time.time()
 
-    # **Check if last fetch was within 1 hour**
-    if not force_refresh and now - LAST_POOL_FETCH_TIME < 3600:
+# **MARKET SNAPSHOT** (one subgraph pull per loop, shared by pricing and trading)
+SNAPSHOT_MIN_LIQUIDITY = "1000000"
+SUBGRAPH_MAX_WORKERS = 8
+SUBGRAPH = GraphQLClient(THEGRAPH_COINBASE_URL, max_workers=SUBGRAPH_MAX_WORKERS)
+
+# pools       -> WETH pools as Uniswap V2-style pairs (id, token decimals, reserveUSD, USD token prices)
+# token_pairs -> all pools as {token0, token1, pairId, liquidity, token0Price, token1Price} (USD token prices)
+# pairs       -> all pools with the pool's own token0Price/token1Price
+MarketSnapshot = namedtuple("MarketSnapshot", ["fetched_at", "block", "version", "weth_price",
+                                               "pools", "token_pairs", "pairs"])
+EMPTY_MARKET_SNAPSHOT = MarketSnapshot(fetched_at=0, block=None, version=0, weth_price=0,
+                                       pools=(), token_pairs=(), pairs=())
+LAST_MARKET_SNAPSHOT = EMPTY_MARKET_SNAPSHOT
+
+
+# **INCREMENTAL SUBGRAPH SYNC**
+# Every pool above SNAPSHOT_MIN_LIQUIDITY, kept current by pulling only what changed since `block`
+SUBGRAPH_SYNC_STATE = {
+    "block": None,    # Subgraph block of the last successful sync
+    "version": 0,     # Bumped whenever the pool set changes
+    "pools": {},      # pool id -> raw subgraph pool
+}
+
+
+def load_subgraph_sync_state():
+    """Restore the synced pool set and its block from MARKET_STORE (once, at startup)."""
+    state = SUBGRAPH_SYNC_STATE
+    state["pools"] = {pool["id"]: pool for pool in MARKET_STORE.all_pools()}
+    state["block"] = MARKET_STORE.last_fetch("subgraph_sync")[1] if state["pools"] else None
+    state["version"] += 1
+    print(f"🔄 Loaded {len(state['pools'])} pools from {MARKET_STORE_FILE} (block {state['block']})")
+
+
+def fetch_subgraph_block():
+    """Return the block number the subgraph has indexed up to."""
+    data = SUBGRAPH.execute("{ _meta { block { number } } }")
+    if "_meta" not in data:
+        raise ValueError(f"Unexpected response format: {data}")
+    return int(data["_meta"]["block"]["number"])
+
+
+def sync_subgraph_pools(force_full=False):
+    """Bring SUBGRAPH_SYNC_STATE up to the subgraph head; returns True if the pool set changed."""
+    state = SUBGRAPH_SYNC_STATE
+    head_block = fetch_subgraph_block()
+    min_liquidity = float(SNAPSHOT_MIN_LIQUIDITY)
+
+    if not force_full and state["block"] is not None:
+        if head_block <= state["block"]:
+            return False  # Nothing new indexed since the last sync
+
         try:
-            with open(POOLS_CACHE_FILE, "r") as f:
-                return json.load(f)  # Load from cache
-        except FileNotFoundError:
-            pass  # If cache not found, fetch fresh data
+            # ✅ Only pools created or touched since the last sync (no liquidity filter, so
+            # pools that dropped below the threshold come back too and can be evicted)
+            changed = fetch_pools(SUBGRAPH, changed_since(state["block"]), block=head_block)
+            kept, evicted = merge_changed_pools(state["pools"], changed, min_liquidity)
+            MARKET_STORE.upsert_pools(kept)
+            MARKET_STORE.delete_pools(evicted)
+            register_pool_tokens(kept)
+            MARKET_STORE.mark_fetched("subgraph_sync", block=head_block)
+            state["block"] = head_block
+            if changed:
+                state["version"] += 1
+            print(f"🔄 Incremental pool sync to block {head_block}: {len(changed)} changed pools")
+            return bool(changed)
+        except Exception as e:
+            logging.error(f"⚠️ Incremental pool sync failed, falling back to full sync: {e}")
 
-    # ✅ **GraphQL Query for Coinbase Pools**
-    query = """
-    {
-      pools(first: 1000, where: { liquidity_gte: "1000000",
-          token0_: { symbol_in: ["WETH"] }
- }) {
-        id
-        token0 {
-          id
-          symbol
-          decimals
-          derivedETH
-          volumeUSD
-        }
-        token1 {
-          id
-          symbol
-          decimals
-          derivedETH
-          volumeUSD
-        }
-        liquidity
-      }
-    }
-    """
-    pairs = []
-    try:
-        response = requests.post(THEGRAPH_COINBASE_URL, json={'query': query})
-        response.raise_for_status()  # Raise error for bad response
-        json_response = response.json()
-        #print("🔍 Debug: Full API Response:", json_response)
+    pools = fetch_pools(SUBGRAPH, f'liquidity_gte: "{SNAPSHOT_MIN_LIQUIDITY}"', block=head_block)
+    state["pools"] = {pool["id"]: pool for pool in pools}
+    MARKET_STORE.replace_pools(pools)
+    register_pool_tokens(pools)
+    MARKET_STORE.mark_fetched("subgraph_sync", block=head_block)
+    state["block"] = head_block
+    state["version"] += 1
+    print(f"✅ Full pool sync at block {head_block}: {len(pools)} pools")
+    return True
 
-        # **Check if response contains expected data**
-        if "data" not in json_response or "pools" not in json_response["data"]:
-            raise ValueError(f"Unexpected response format: {json_response}")
 
-        pools = json_response["data"]["pools"]
-        LAST_POOL_FETCH_TIME = now
+def synced_subgraph_pools():
+    """Return the synced pools in id order."""
+    return [SUBGRAPH_SYNC_STATE["pools"][pool_id] for pool_id in sorted(SUBGRAPH_SYNC_STATE["pools"])]
 
-        # ✅ **Fetch WETH price from Chainlink**
-        weth_price = get_weth_price()
 
-        # ✅ **Convert Coinbase Pools to Uniswap V2 `pairs` Format**
-        
-        for pool in pools:
-            token0 = pool["token0"]
-            token1 = pool["token1"]
+def build_market_snapshot(raw_pools, weth_price, block=None, version=0):
+    """Convert raw subgraph pools into one immutable snapshot with every shape the bot uses."""
+    pools = []
+    token_pairs = []
+    pairs = []
+
+    for pool in raw_pools:
+        token0 = pool["token0"]
+        token1 = pool["token1"]
 
-            # Get token decimals
-            token0_decimals = int(token0["decimals"])
-            token1_decimals = int(token1["decimals"])
+        # Get token decimals
+        token0_decimals = int(token0["decimals"])
+        token1_decimals = int(token1["decimals"])
 
-            # Convert derivedETH to USD price
-            token0_price = float(token0["derivedETH"]) * weth_price if float(token0["derivedETH"]) > 0 else 0
-            token1_price = float(token1["derivedETH"]) * weth_price if float(token1["derivedETH"]) > 0 else 0
+        # Convert derivedETH to USD price
+        token0_derived_eth = float(token0["derivedETH"])
+        token1_derived_eth = float(token1["derivedETH"])
+        token0_usd = token0_derived_eth * weth_price if token0_derived_eth > 0 else 0
+        token1_usd = token1_derived_eth * weth_price if token1_derived_eth > 0 else 0
+        liquidity = float(pool["liquidity"])
 
-            # Construct Uniswap V2-like pair structure
-            pair = {
+        if token0["symbol"] == "WETH" or token1["symbol"] == "WETH":
+            pools.append({
                 "id": pool["id"],
-                "token0": {
-                    "id": token0["id"],
-                    "symbol": token0["symbol"],
-                    "decimals": token0_decimals
-                },
-                "token1": {
-                    "id": token1["id"],
-                    "symbol": token1["symbol"],
-                    "decimals": token1_decimals
-                },
-                "reserveUSD": float(pool["liquidity"]),
-                "token0Price": token0_price,
-                "token1Price": token1_price
-            }
-            pairs.append(pair)
-    except Exception as e:
-        print(f"⚠️ Error fetching POOLS: {e}")
-        return []
+                "token0": {"id": token0["id"], "symbol": token0["symbol"], "decimals": token0_decimals},
+                "token1": {"id": token1["id"], "symbol": token1["symbol"], "decimals": token1_decimals},
+                "reserveUSD": liquidity,
+                "token0Price": token0_usd,
+                "token1Price": token1_usd
+            })
 
-###############PAIR2
-# ✅ **GraphQL Query for Coinbase Pools**
-    query = """
-    {
-      pools(first: 1000, where: { liquidity_gte: "1000000",
-          token1_: { symbol_in: ["WETH"] }
- }) {
-        id
-        token0 {
-          id
-          symbol
-          decimals
-          derivedETH
-          volumeUSD
-        }
-        token1 {
-          id
-          symbol
-          decimals
-          derivedETH
-          volumeUSD
-        }
-        liquidity
-      }
-    }
-    """
+        token_pairs.append({
+            "token0": {"id": token0["id"], "symbol": token0["symbol"]},
+            "token1": {"id": token1["id"], "symbol": token1["symbol"]},
+            "pairId": pool["id"],
+            "liquidity": int(liquidity),
+            "token0Price": token0_usd,
+            "token1Price": token1_usd
+        })
 
-    try:
-        response = requests.post(THEGRAPH_COINBASE_URL, json={'query': query})
-        response.raise_for_status()  # Raise error for bad response
-        json_response = response.json()
-        #print("🔍 Debug: Full API Response:", json_response)
+        pairs.append({
+            "token0": {"id": token0["id"], "symbol": token0["symbol"]},
+            "token1": {"id": token1["id"], "symbol": token1["symbol"]},
+            "pairId": pool["id"],
+            "token0Price": float(pool.get("token0Price") or 0),
+            "token1Price": float(pool.get("token1Price") or 0),
+            "liquidity": liquidity
+        })
 
-        # **Check if response contains expected data**
-        if "data" not in json_response or "pools" not in json_response["data"]:
-            raise ValueError(f"Unexpected response format: {json_response}")
+    return MarketSnapshot(fetched_at=time.time(), block=block, version=version, weth_price=weth_price,
+                          pools=tuple(pools), token_pairs=tuple(token_pairs), pairs=tuple(pairs))
 
-        pools = json_response["data"]["pools"]
-        LAST_POOL_FETCH_TIME = now
 
-        # ✅ **Fetch WETH price from Chainlink**
+def fetch_market_snapshot():
+    """Sync pools above SNAPSHOT_MIN_LIQUIDITY and build the loop's market snapshot."""
+    global LAST_MARKET_SNAPSHOT
+    try:
+        sync_subgraph_pools()
         weth_price = get_weth_price()
+        version = SUBGRAPH_SYNC_STATE["version"]
 
-        # ✅ **Convert Coinbase Pools to Uniswap V2 `pairs` Format**
-        #pairs = []
-        for pool in pools:
-            token0 = pool["token0"]
-            token1 = pool["token1"]
+        # ✅ Reuse the previous snapshot if neither the pools nor the WETH price moved
+        if LAST_MARKET_SNAPSHOT.version == version and LAST_MARKET_SNAPSHOT.weth_price == weth_price:
+            return LAST_MARKET_SNAPSHOT
 
-            # Get token decimals
-            token0_decimals = int(token0["decimals"])
-            token1_decimals = int(token1["decimals"])
+        snapshot = build_market_snapshot(synced_subgraph_pools(), weth_price,
+                                         block=SUBGRAPH_SYNC_STATE["block"], version=version)
+        LAST_MARKET_SNAPSHOT = snapshot
+        print(f"✅ Market snapshot: {len(snapshot.token_pairs)} pools, {len(snapshot.pools)} WETH pools")
+        return snapshot
+    except Exception as e:
+        logging.error(f"❌ Error fetching market snapshot: {e}")
+        return EMPTY_MARKET_SNAPSHOT
 
-            # Convert derivedETH to USD price
-            token0_price = float(token0["derivedETH"]) * weth_price if float(token0["derivedETH"]) > 0 else 0
-            token1_price = float(token1["derivedETH"]) * weth_price if float(token1["derivedETH"]) > 0 else 0
 
-            # Construct Uniswap V2-like pair structure
-            pair = {
-                "id": pool["id"],
-                "token0": {
-                    "id": token0["id"],
-                    "symbol": token0["symbol"],
-                    "decimals": token0_decimals
-                },
-                "token1": {
-                    "id": token1["id"],
-                    "symbol": token1["symbol"],
-                    "decimals": token1_decimals
-                },
-                "reserveUSD": float(pool["liquidity"]),
-                "token0Price": token0_price,
-                "token1Price": token1_price
-            }
-            pairs.append(pair)
+# **POOL INDEX** ((token, base token) -> deepest pool, rebuilt only when the pool set changes)
+POOL_INDEX = {"version": None, "index": {}}
 
-        # **Cache the response**
-        with open(POOLS_CACHE_FILE, "w") as f:
-            json.dump(pairs, f)
 
-        return pairs
+def build_pool_index(pools, base_tokens):
+    """Map (token id, base token id), both lower-case, to the highest-liquidity pool joining them."""
+    base_ids = {info["id"].lower() for info in base_tokens.values()}
+    index = {}
+    for pool in pools:
+        pool_token0 = pool["token0"]["id"].lower()
+        pool_token1 = pool["token1"]["id"].lower()
+        for token_id, other_id in ((pool_token0, pool_token1), (pool_token1, pool_token0)):
+            if other_id not in base_ids:
+                continue
+            best = index.get((token_id, other_id))
+            if best is None or float(pool.get("reserveUSD", 0)) > float(best.get("reserveUSD", 0)):
+                index[(token_id, other_id)] = pool
+    return index
 
-    except Exception as e:
-        print(f"⚠️ Error fetching POOLS: {e}")
-        return []
 
+def get_pool_index(snapshot, base_tokens):
+    """Return the pool index for `snapshot`, rebuilding it only when the synced pool set changed."""
+    if POOL_INDEX["version"] != snapshot.version:
+        POOL_INDEX["index"] = build_pool_index(snapshot.pools, base_tokens)
+        POOL_INDEX["version"] = snapshot.version
+    return POOL_INDEX["index"]
 
 
-def discover_token_pairs_coinbase(force_refresh=False):
-    """Fetch Coinbase token pairs and return in Uniswap V2 format (caches results for 1 hour)."""
-    global LAST_PAIR_FETCH_TIME
-    now = time.time()
+# **TRADE UNIVERSE** (tokens decide_trades scans, rebuilt only when the pool set changes)
+TRADE_UNIVERSE = {"version": None, "tokens": [], "position": {}}
 
-    # **Check if last fetch was within 1 hour**
-    if not force_refresh and now - LAST_PAIR_FETCH_TIME < 3600:
-        try:
-            with open(TOKEN_PAIRS_CACHE_FILE, "r") as f:
-                return json.load(f)  # Load from cache
-        except FileNotFoundError:
-            pass  # If cache not found, fetch fresh data
 
-    # ✅ **GraphQL Query for Coinbase Token Pairs**
-    query = """
-    {
-      pools(first: 1000, where: { liquidity_gte: "1000000" }) {
-        id
-        token0 {
-          id
-          symbol
-          decimals
-          derivedETH
-          volumeUSD
-        }
-        token1 {
-          id
-          symbol
-          decimals
-          derivedETH
-          volumeUSD
-        }
-        liquidity
-      }
-    }
-    """
+def get_trade_universe(snapshot, base_tokens):
+    """Return (token ids, {token id: position}) for every non-base token in the snapshot's pairs."""
+    if TRADE_UNIVERSE["version"] != snapshot.version:
+        base_ids = {info["id"].lower() for info in base_tokens.values()}
+        tokens = []
+        for pair in snapshot.token_pairs:
+            tokens.append(pair["token0"]["id"].lower())
+            tokens.append(pair["token1"]["id"].lower())
+        tokens = [token_id for token_id in dict.fromkeys(tokens) if token_id not in base_ids]
+        TRADE_UNIVERSE["tokens"] = tokens
+        TRADE_UNIVERSE["position"] = {token_id: i for i, token_id in enumerate(tokens)}
+        TRADE_UNIVERSE["version"] = snapshot.version
+    return TRADE_UNIVERSE["tokens"], TRADE_UNIVERSE["position"]
 
-    try:
-        response = requests.post(THEGRAPH_COINBASE_URL, json={"query": query})
-        response.raise_for_status()
-        data = response.json()
 
-        # **Check if response contains expected data**
-        if "data" not in data or "pools" not in data["data"]:
-            raise ValueError(f"Unexpected response format: {data}")
+# **PRICE GRAPH** (token index + edge arrays, rebuilt only when the pool set changes)
+PRICE_GRAPH = {"version": None, "graph": None}
 
-        pools = data["data"]["pools"]
-        token_pairs = []
 
-        # ✅ **Fetch WETH price from Chainlink**
-        weth_price = get_weth_price()
+def get_price_graph(snapshot):
+    """Return the price graph for `snapshot`, rebuilding it only when the synced pool set changed."""
+    if PRICE_GRAPH["version"] != snapshot.version:
+        PRICE_GRAPH["graph"] = build_price_graph(snapshot.pairs)
+        PRICE_GRAPH["version"] = snapshot.version
+    return PRICE_GRAPH["graph"]
 
-        for pool in pools:
-            token0 = pool["token0"]
-            token1 = pool["token1"]
 
-            # Get token decimals
-            token0_decimals = int(token0["decimals"])
-            token1_decimals = int(token1["decimals"])
+def base_token_usd_prices(base_tokens):
+    return {base_info["id"].lower(): base_info["token_price"] for base_info in base_tokens.values()}
 
-            # Convert derivedETH to USD price
-            token0_price = float(token0["derivedETH"]) * weth_price if float(token0["derivedETH"]) > 0 else 0
-            token1_price = float(token1["derivedETH"]) * weth_price if float(token1["derivedETH"]) > 0 else 0
 
-            token_pairs.append({
-                "token0": {
-                    "id": token0["id"],
-                    "symbol": token0["symbol"]
-                },
-                "token1": {
-                    "id": token1["id"],
-                    "symbol": token1["symbol"]
-                },
-                "pairId": pool["id"],
-                "liquidity": int(float(pool["liquidity"])),
-                "token0Price": token0_price,
-                "token1Price": token1_price
-            })
+def calculate_all_token_prices_coinbase(snapshot, base_tokens):
+    """
+    Compute the price of all tokens in USD, even if they are not paired with base tokens.
+    """
+    return propagate_usd_prices(get_price_graph(snapshot), base_token_usd_prices(base_tokens))
 
-        # **Update Cache**
-        LAST_PAIR_FETCH_TIME = now
-        with open(TOKEN_PAIRS_CACHE_FILE, "w") as f:
-            json.dump(token_pairs, f)
 
-        return token_pairs
+# **ON-CHAIN RESERVES** (Multicall3 getReserves() as the primary price source)
+POOL_METADATA = {}  # pool id -> {"stable": bool or None, "fee": int or None}, read once per pool
+POOL_RESERVES = {}  # pool id -> (reserve0, reserve1, block)
 
-    except Exception as e:
-        logging.error(f"❌ Error discovering token pairs: {e}")
-        return []
 
-def fetch_pairs_coinbase():
-    """Fetch trading pairs from Coinbase and return in the same format as Uniswap V2."""
-    try:
-        query = """
-        {
-          pools(first: 1000, where: { liquidity_gte: "1000000" }) {
-            token0 { id symbol decimals derivedETH }
-            token1 { id symbol decimals derivedETH }
-            token0Price
-            token1Price
-          }
-        }
-        """
+def word(data, index):
+    """Return the `index`-th 32-byte ABI word of `data` as an int."""
+    return int.from_bytes(data[32 * index:32 * (index + 1)], "big")
 
-        response = requests.post(THEGRAPH_COINBASE_URL, json={"query": query})
-        response.raise_for_status()
-        data = response.json()
 
-        # **Check if response contains expected data**
-        if "data" not in data or "pools" not in data["data"]:
-            raise ValueError(f"Unexpected response format: {data}")
+def read_pool_reserves(pool_ids):
+    """Read getReserves() for every pool (plus stable()/fee() for new pools) through Multicall3.
 
-        pools = data["data"]["pools"]
-        token_pairs = []
+    Returns the block the reserves were read at; results land in POOL_RESERVES and POOL_METADATA.
+    """
+    calls = [(MULTICALL3_ADDRESS, GET_BLOCK_NUMBER_SELECTOR)]
+    calls.extend((pool_id, GET_RESERVES_SELECTOR) for pool_id in pool_ids)
+    new_pools = [pool_id for pool_id in pool_ids if pool_id not in POOL_METADATA]
+    for pool_id in new_pools:
+        calls.append((pool_id, STABLE_SELECTOR))
+        calls.append((pool_id, FEE_SELECTOR))
+
+    # ✅ The first chunk reports its block; later chunks are pinned to it so reserves are consistent
+    results = multicall(calls[:RESERVES_CHUNK_SIZE], chunk_size=RESERVES_CHUNK_SIZE)
+    block = word(results[0][1], 0)
+    results += multicall(calls[RESERVES_CHUNK_SIZE:], block_identifier=block, chunk_size=RESERVES_CHUNK_SIZE)
+
+    for pool_id, (success, data) in zip(pool_ids, results[1:1 + len(pool_ids)]):
+        if success and len(data) >= 64:
+            POOL_RESERVES[pool_id] = (word(data, 0), word(data, 1), block)
+
+    metadata_results = results[1 + len(pool_ids):]
+    for i, pool_id in enumerate(new_pools):
+        stable_ok, stable_data = metadata_results[2 * i]
+        fee_ok, fee_data = metadata_results[2 * i + 1]
+        POOL_METADATA[pool_id] = {
+            "stable": bool(word(stable_data, 0)) if stable_ok and len(stable_data) >= 32 else None,
+            "fee": word(fee_data, 0) if fee_ok and len(fee_data) >= 32 else None,
+        }
+    return block
 
-        for pool in pools:
-            token0 = pool["token0"]
-            token1 = pool["token1"]
 
-            token0_price = float(pool.get("token0Price", "0"))  # Ensure float
-            token1_price = float(pool.get("token1Price", "0"))  # Ensure float
+# Graph edge rates kept in sync with POOL_RESERVES, updated only for pools that changed
+RESERVE_RATES = {"version": None, "rates": None, "pair_index": {}}
 
-            token_pairs.append({
-                "token0": {
-                    "id": token0["id"],
-                    "symbol": token0["symbol"]
-                },
-                "token1": {
-                    "id": token1["id"],
-                    "symbol": token1["symbol"]
-                },
-                "token0Price": token0_price,
-                "token1Price": token1_price
+
+def apply_reserve_rates(snapshot, pool_ids):
+    """Refresh the edge rates of `pool_ids` from POOL_RESERVES (falling back to subgraph prices)."""
+    rates = RESERVE_RATES["rates"]
+    for pool_id in pool_ids:
+        i = RESERVE_RATES["pair_index"].get(pool_id)
+        if i is None:
+            continue
+        pair = snapshot.pairs[i]
+        reserves = POOL_RESERVES.get(pool_id)
+        token0 = TOKEN_REGISTRY.get(pair["token0"]["id"].lower())
+        token1 = TOKEN_REGISTRY.get(pair["token1"]["id"].lower())
+        if not reserves or not token0 or not token1 or reserves[0] == 0 or reserves[1] == 0:
+            continue
+        stable = POOL_METADATA.get(pool_id, {}).get("stable")
+        if stable is None:
+            continue  # Curve unknown: keep the subgraph rate rather than guess
+        x = reserves[0] / 10 ** token0["decimals"]
+        y = reserves[1] / 10 ** token1["decimals"]
+        # token0Price = token0 per token1, token1Price = token1 per token0 (human units)
+        token0_per_token1 = pool_spot_price(x, y, stable)
+        rates[2 * i] = token0_per_token1
+        rates[2 * i + 1] = 1 / token0_per_token1
+
+
+def reserve_rates(snapshot, graph, changed_pool_ids=None):
+    """Edge rates for `graph` from POOL_RESERVES; only `changed_pool_ids` are recomputed once warm."""
+    if RESERVE_RATES["version"] != snapshot.version:
+        RESERVE_RATES["rates"] = graph.rates.copy()
+        RESERVE_RATES["pair_index"] = {pair["pairId"]: i for i, pair in enumerate(snapshot.pairs)}
+        RESERVE_RATES["version"] = snapshot.version
+        changed_pool_ids = RESERVE_RATES["pair_index"]
+    elif changed_pool_ids is None:
+        changed_pool_ids = RESERVE_RATES["pair_index"]
+    apply_reserve_rates(snapshot, changed_pool_ids)
+    return RESERVE_RATES["rates"]
+
+
+def calculate_all_token_prices_onchain(snapshot, base_tokens):
+    """Price every token from on-chain reserves (one Multicall3 round trip), subgraph as fallback."""
+    graph = get_price_graph(snapshot)
+    try:
+        block = read_pool_reserves([pair["pairId"] for pair in snapshot.pairs])
+        print(f"✅ Read reserves for {len(snapshot.pairs)} pools at block {block}")
+        rates = reserve_rates(snapshot, graph)
+    except Exception as e:
+        logging.error(f"⚠️ Reserve read failed, using subgraph prices: {e}")
+        rates = graph.rates
+    return propagate_usd_prices(graph, base_token_usd_prices(base_tokens), rates)
+
+
+# **SYNC LOG INGESTER** (reserves follow the chain from Sync events instead of polling every pool)
+SYNC_EVENT_TOPIC = Web3.to_hex(Web3.keccak(text="Sync(uint256,uint256)"))
+SYNC_LOG_ADDRESS_CHUNK = 5000   # Addresses per eth_getLogs filter (provider limit)
+SYNC_LOG_MAX_BLOCK_RANGE = 500  # Blocks per eth_getLogs call when catching up
+BASE_BLOCK_TIME = 2             # Seconds per Base block
+LOOP_CADENCE = 60               # Seconds between main loop iterations
+LOOP_PHASE_BUDGETS = {"fetch": 15, "price": 5, "decide": 5, "execute": 30, "persist": 2}  # Seconds; overruns are logged
+SYNC_TRACKER = {"block": None, "pending": set()}  # Last block whose Sync logs were applied, pools not yet repriced by a slot
+
+
+def poll_sync_logs(pool_ids):
+    """Apply Sync logs for `pool_ids` since the last processed block; returns the set of pools that traded."""
+    untracked = [pool_id for pool_id in pool_ids if pool_id not in POOL_RESERVES]
+    if SYNC_TRACKER["block"] is None or untracked:
+        # ✅ Seed the table (or new pools) with one Multicall3 read, then follow logs from there
+        block = read_pool_reserves(untracked if SYNC_TRACKER["block"] is not None else pool_ids)
+        if SYNC_TRACKER["block"] is None:
+            SYNC_TRACKER["block"] = block
+            SYNC_TRACKER["pending"].update(pool_ids)
+            return set(pool_ids)
+
+    head = latest_block_number()
+    updated = set()
+    from_block = SYNC_TRACKER["block"] + 1
+    while from_block <= head:
+        to_block = min(head, from_block + SYNC_LOG_MAX_BLOCK_RANGE - 1)
+        for start in range(0, len(pool_ids), SYNC_LOG_ADDRESS_CHUNK):
+            logs = get_logs({
+                "fromBlock": from_block,
+                "toBlock": to_block,
+                "address": [cached_checksum(pool_id) for pool_id in pool_ids[start:start + SYNC_LOG_ADDRESS_CHUNK]],
+                "topics": [SYNC_EVENT_TOPIC],
             })
+            # Logs come back in chain order, so the last Sync per pool wins
+            for log in logs:
+                pool_id = log["address"].lower()
+                if POOL_RESERVES.get(pool_id, (0, 0, -1))[2] > log["blockNumber"]:
+                    continue  # A fresher Multicall3 read already covers this pool
+                data = bytes(log["data"])
+                POOL_RESERVES[pool_id] = (word(data, 0), word(data, 1), log["blockNumber"])
+                updated.add(pool_id)
+        from_block = to_block + 1
+    SYNC_TRACKER["block"] = max(SYNC_TRACKER["block"], head)
+    updated.update(untracked)
+    SYNC_TRACKER["pending"].update(updated)
+    return updated
+
+
+def take_pending_syncs():
+    """Pools whose reserves changed since the last slot repricing (from any poller), clearing the set.
+
+    Only track_token_prices() drains it; the market stage reprices whenever it is non-empty.
+    """
+    pending = SYNC_TRACKER["pending"]
+    SYNC_TRACKER["pending"] = set()
+    return pending
 
-        return token_pairs
 
+def track_token_prices(snapshot, base_tokens):
+    """Price every token from the Sync-driven reserve table, recomputing only pools that traded."""
+    graph = get_price_graph(snapshot)
+    try:
+        poll_sync_logs([pair["pairId"] for pair in snapshot.pairs])
+        updated = take_pending_syncs()  # Includes pools that traded while follow_blocks was polling
+        print(f"✅ {len(updated)} pools updated up to block {SYNC_TRACKER['block']}")
+        rates = reserve_rates(snapshot, graph, updated)
     except Exception as e:
-        logging.error(f"❌ Unexpected error fetching Coinbase PAIR PRICES: {e}")
-        return []
+        logging.error(f"⚠️ Sync log ingestion failed, using Multicall3 reserves: {e}")
+        return calculate_all_token_prices_onchain(snapshot, base_tokens)
+    return propagate_usd_prices(graph, base_token_usd_prices(base_tokens), rates)
 
 
+def follow_blocks(snapshot, seconds, on_sync=None):
+    """Keep the reserve table current block by block for `seconds` (replaces a blind sleep).
 
-def calculate_all_token_prices_coinbase(pairs, base_tokens):
+    `on_sync(updated_pool_ids)` runs after every poll that saw trades, e.g. check_exits().
     """
-    Compute the price of all tokens in USD, even if they are not paired with base tokens.
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        updated = set()
+        try:
+            updated = poll_sync_logs([pair["pairId"] for pair in snapshot.pairs])
+        except Exception as e:
+            logging.error(f"⚠️ Sync log ingestion failed: {e}")
+        if updated and on_sync is not None:
+            try:
+                on_sync(updated)
+            except Exception as e:
+                logging.error(f"⚠️ Error handling Sync tick: {e}")
+        time.sleep(min(BASE_BLOCK_TIME, max(0, deadline - time.time())))
+
+
+# Price paths of the held tokens: which pools each one's USD price runs through
+EXIT_PATHS = {"key": None, "paths": {}, "pool_tokens": {}}
+
+
+def exit_price_paths(snapshot, graph, rates, base_prices):
+    """{token: (graph index, edge path)} for EXIT_ENGINE positions and {pool id: {token, ...}} on those paths.
+
+    Rebuilt with one full propagation when the pool set or the held positions change.
     """
-    token_prices_in_usd = {}
+    key = (snapshot.version, frozenset(EXIT_ENGINE.positions))
+    if EXIT_PATHS["key"] != key:
+        _, parent = propagate_usd_price_tree(graph, base_prices, rates)
+        paths = {}
+        pool_tokens = {}
+        for token_id in EXIT_ENGINE.positions:
+            index = graph.token_index.get(token_id)
+            if index is None:
+                continue
+            paths[token_id] = (index, price_path(graph, parent, index))
+            for edge in paths[token_id][1]:
+                pool_tokens.setdefault(snapshot.pairs[edge // 2]["pairId"], set()).add(token_id)
+        EXIT_PATHS.update(key=key, paths=paths, pool_tokens=pool_tokens)
+    return EXIT_PATHS["paths"], EXIT_PATHS["pool_tokens"]
 
-    # Step 1: Initialize base tokens with known USD prices
-    for base_token, base_info in base_tokens.items():
-        token_prices_in_usd[base_info["id"].lower()] = base_info["token_price"]
 
-    # Step 2: First pass - Direct price assignments from base tokens
-    for pair in pairs:
-        token0_id = pair["token0"]["id"].lower()
-        token1_id = pair["token1"]["id"].lower()
-        token0_price = float(pair["token0Price"])
-        token1_price = float(pair["token1Price"])
+def check_exits(snapshot, updated, price_history, base_tokens, slippage_tolerance):
+    """Reprice the held tokens the pools in `updated` touch and return sells for crossed exit levels.
+
+    SYNC_TRACKER["pending"] is left alone: the next slot still reprices every pool that traded.
+    """
+    if not len(EXIT_ENGINE):
+        return []
+    graph = get_price_graph(snapshot)
+    rates = reserve_rates(snapshot, graph, updated)
+    base_prices = base_token_usd_prices(base_tokens)
+    paths, pool_tokens = exit_price_paths(snapshot, graph, rates, base_prices)
+    affected = set().union(*(pool_tokens.get(pool_id, ()) for pool_id in updated))
+    exits = []
+    for token_id in affected:
+        index, path = paths[token_id]
+        price = path_price(graph, base_prices, rates, index, path)
+        if np.isnan(price):
+            EXIT_PATHS["key"] = None  # A pool on the path went dead; re-route on the next tick
+            continue
+        exit_signal = EXIT_ENGINE.update(token_id, price)
+        if exit_signal:
+            exits.append(exit_signal)
+    return exit_trades(snapshot, exits, price_history, base_tokens, slippage_tolerance)
+
+
+def exit_trades(snapshot, exits, price_history, base_tokens, slippage_tolerance):
+    """Sell trades for exit engine signals, sized and booked like the sells in decide_trades."""
+    global held_tokens, held_token_prices
+    pool_index = get_pool_index(snapshot, base_tokens)
+    token_name = "WETH"
+    base_token_id = base_tokens[token_name]["id"].lower()
+    trades = []
+    balances = get_wallet_token_balances([exit_signal.token for exit_signal in exits]) if exits else {}
+    for exit_signal in exits:
+        token_id = exit_signal.token
+        print(f"🚨 {exit_signal.reason}: Selling {token_id} at {exit_signal.price:.2f} (Sync tick)")
+        if not pool_index.get((token_id, base_token_id)):
+            print(f"❌ No valid base token found for {token_id}, skipping.")
+            continue
+        held_tokens.discard(token_id)
+        held_token_prices.pop(token_id, None)
+        save_held_tokens()  # ✅ Save after selling
+        # Keep only the last 3 prices to prevent old data affecting new buy signals
+        if token_id in price_history:
+            price_history.truncate(token_id, 3)
+            save_price_history(price_history)
+        amount_in = balances[token_id]
+        amount_out_min = (((amount_in / (10**get_token_decimals(token_id))) * exit_signal.price)/base_tokens[token_name]["token_price"])*(1 - slippage_tolerance)
+        amount_out_min = int(amount_out_min*(10**base_tokens[token_name]["decimals"]))
+        profit_loss = (exit_signal.price - exit_signal.buy_price) / exit_signal.buy_price * 100
+        log_trade("sell", token_id, float(exit_signal.price), float(profit_loss), exit_signal.reason)
+        trades.append({
+            "tokenIn": token_id,
+            "tokenOut": base_token_id,
+            "amountIn": amount_in,
+            "amountOutMin": amount_out_min,
+            "poolFee": 3000,
+            "smart_take_profit": exit_signal.reason == "SMART TAKE PROFIT",
+            "position": {"buy_price": exit_signal.buy_price, "highest_price": exit_signal.highest_price}
+        })
+    return trades
 
-        if token0_id in token_prices_in_usd:
-            token_prices_in_usd[token1_id] = token_prices_in_usd[token0_id] * token0_price
-        elif token1_id in token_prices_in_usd:
-            token_prices_in_usd[token0_id] = token_prices_in_usd[token1_id] * token1_price
 
-    # Step 3: Second pass - Fill missing values indirectly
-    for _ in range(3):  # Repeat up to 3 times to fill missing prices via connected pairs
-        for pair in pairs:
-            token0_id = pair["token0"]["id"].lower()
-            token1_id = pair["token1"]["id"].lower()
-            token0_price = float(pair["token0Price"])
-            token1_price = float(pair["token1Price"])
+# **PIPELINE** (market -> decide -> execute run concurrently, joined by bounded queues)
+TRADE_QUEUE_SIZE = 4  # Trade batches waiting for execution before decide blocks
+STATE_LOCK = threading.Lock()  # Guards held_tokens / price history / EXIT_ENGINE across the stage threads
 
-            if token0_id in token_prices_in_usd and token1_id not in token_prices_in_usd:
-                token_prices_in_usd[token1_id] = token_prices_in_usd[token0_id] * token0_price
-            elif token1_id in token_prices_in_usd and token0_id not in token_prices_in_usd:
-                token_prices_in_usd[token0_id] = token_prices_in_usd[token1_id] * token1_price
 
-    return token_prices_in_usd
+def offer_latest(queue, item):
+    """Put `item` without waiting, replacing an unconsumed older item so readers get the freshest one."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
 
 
+async def market_stage(scheduler, market_queue, trade_queue):
+    """Fetch and price the market once per slot, following Sync logs (and queueing exits) in between."""
+    loop = asyncio.get_running_loop()
+    state = {"snapshot": EMPTY_MARKET_SNAPSHOT, "prices": {}}
+
+    def queue_exits(updated):
+        with STATE_LOCK:
+            trades = check_exits(state["snapshot"], updated, price_history, BASE_TOKENS, slippage_tolerance=0.2)
+        if trades:
+            # Same executor as the slot trades, so swaps never run concurrently
+            asyncio.run_coroutine_threadsafe(trade_queue.put(trades), loop).result()
+
+    def idle(seconds):
+        follow_blocks(state["snapshot"], seconds, on_sync=queue_exits)
+
+    def refresh():
+        update_base_tokens()
+        snapshot = fetch_market_snapshot()
+        scheduler.checkpoint("fetch")
+        # Reprice only if pools traded or the pool set / ETH price moved since the last slot
+        market_changed = scheduler.changed("market", (snapshot.version, BASE_TOKENS["WETH"]["token_price"]))
+        if market_changed or SYNC_TRACKER["pending"] or not state["prices"]:
+            state["prices"] = track_token_prices(snapshot, BASE_TOKENS)
+            scheduler.checkpoint("price")
+        else:
+            scheduler.skip("price")
+        state["snapshot"] = snapshot
+        return snapshot, state["prices"]
+
+    while True:
+        await asyncio.to_thread(scheduler.wait, idle)
+        try:
+            offer_latest(market_queue, await asyncio.to_thread(refresh))
+        except Exception as e:
+            logger.error(f"Error in market stage: {e}")
+
+
+async def decide_stage(scheduler, market_queue, trade_queue):
+    """Turn each market snapshot into trades and persist the state they were decided on."""
+    def decide(snapshot, token_prices_in_usd):
+        with STATE_LOCK:
+            TICK_ARCHIVE.append_many(token_prices_in_usd, "aerodrome")
+            trades = decide_trades(snapshot=snapshot, price_history=price_history, token_prices_in_usd=token_prices_in_usd,
+                                   base_tokens=BASE_TOKENS, base_token_prices=TOKEN_PRICES,
+                                   threshold=0.03, slippage_tolerance=0.2, min_liquidity=500_000)
+            start = time.time()
+            save_price_history(price_history)
+            TICK_ARCHIVE.flush()
+            save_held_tokens()  # Journal highest-price updates and fsync batched events
+            EXIT_ENGINE.sync(held_token_prices)
+            scheduler.record("persist", time.time() - start)
+        return trades
+
+    while True:
+        snapshot, token_prices_in_usd = await market_queue.get()
+        start = time.time()
+        try:
+            trades = await asyncio.to_thread(decide, snapshot, token_prices_in_usd)
+        except Exception as e:
+            logger.error(f"Error in decide stage: {e}")
+            continue
+        scheduler.record("decide", time.time() - start)
+        print(f"✅ {len(trades)} Trades Generated!")
+        print(trades)
+        if trades:
+            await trade_queue.put(trades)  # Blocks only when execution is TRADE_QUEUE_SIZE batches behind
+
+
+async def execute_stage(scheduler, trade_queue):
+    """Send queued trades one batch at a time; waiting for receipts here no longer holds up the fetches."""
+    while True:
+        trades = await trade_queue.get()
+        start = time.time()
+        try:
+            await asyncio.to_thread(execute_trades, trades)
+        except Exception as e:
+            logger.error(f"Error in execute stage: {e}")
+        scheduler.record("execute", time.time() - start)
+
+
+async def run_pipeline():
+    # Check prices every minute on a fixed grid, and only once a new block exists
+    scheduler = LoopScheduler(LOOP_CADENCE, name="aerodrome", budgets=LOOP_PHASE_BUDGETS,
+                              block_number=latest_block_number, block_time=BASE_BLOCK_TIME)
+    market_queue = asyncio.Queue(maxsize=1)  # Latest snapshot only; a slow decide skips stale ones
+    trade_queue = asyncio.Queue(maxsize=TRADE_QUEUE_SIZE)
+    await asyncio.gather(
+        market_stage(scheduler, market_queue, trade_queue),
+        decide_stage(scheduler, market_queue, trade_queue),
+        execute_stage(scheduler, trade_queue),
+    )
+
 
 # **DETERMINE TOKEN PRICES (CACHE)**
 TOKEN_PRICE_CACHE = {}
@@ -2303,22 +2665,10 @@ price_history = load_price_history()
 #print(token_prices_in_usd)
 # ✅ Load held tokens when script starts
 load_held_tokens()
-while True:
-    try:
-        update_base_tokens()
-        pools = fetch_all_pools_coinbase_subgraph()
-        token_pairs = discover_token_pairs_coinbase()
-        pairs = fetch_pairs_coinbase()
-        token_prices_in_usd = calculate_all_token_prices_coinbase(pairs, BASE_TOKENS)
-        trades = decide_trades(token_pairs= token_pairs, price_history=price_history, token_prices_in_usd=token_prices_in_usd,
-                           base_tokens=BASE_TOKENS, pools=pools, base_token_prices= TOKEN_PRICES,
-                           threshold=0.03, slippage_tolerance=0.2, min_liquidity=500_000)
-        print(f"✅ {len(trades)} Trades Generated!")
-        print(trades)
-        execute_trades(trades)
-        save_price_history(price_history)
-    except Exception as e:
-        logger.error(f"Error in main loop: {e}")
-        
-    time.sleep(60)  # Check prices and execute trades every minute
-    
+load_token_registry()
+load_subgraph_sync_state()
+try:
+    backfill_token_registry(held_tokens)  # Positions opened before the registry existed
+except Exception as e:
+    logging.error(f"⚠️ Token registry backfill failed at startup (decimals will be read per token): {e}")
+asyncio.run(run_pipeline())
@@ -0,0 +1,118 @@
+"""Router/executor allowances of one wallet, cached so an approve() is sent only when a swap would fall short."""
+import threading
+
+from web3 import Web3
+
+UNLIMITED = 2**256 - 1  # Never drawn down by transferFrom on most tokens, so spends are not booked against it
+APPROVAL_TOPIC = Web3.to_hex(Web3.keccak(text="Approval(address,address,uint256)"))
+
+
+def approval_value(receipt, owner, token, spender):
+    """Allowance set by the Approval(owner, spender) event of `token` in `receipt`, or None."""
+    value = None
+    for log in receipt["logs"]:
+        topics = [Web3.to_hex(topic) for topic in log["topics"]]
+        if (log["address"].lower() == token and len(topics) == 3 and topics[0] == APPROVAL_TOPIC
+                and "0x" + topics[1][-40:] == owner and "0x" + topics[2][-40:] == spender):
+            value = int.from_bytes(bytes(log["data"])[:32], "big")
+    return value
+
+
+class AllowanceCache:
+    """Allowance left per (token, spender), kept without reading the chain before every swap.
+
+    read_allowances([(token, spender), ...]) returns the on-chain allowances (None where the
+    read failed); approve(token, spender, amount) sends an approve() and returns its tx hash
+    (or None). Swaps are booked when sent. Until its receipt arrives a swap counts as in
+    flight, and a chain read is lowered by the in-flight spends, which it may not include yet.
+    An approval receipt's Approval value predates the swaps sent after that approval, so it is
+    rebased by the spends booked since. A swap that reverted or never arrived drops its key,
+    so the next prefetch re-reads it from the chain instead of trusting the cached amount.
+    """
+
+    def __init__(self, owner, read_allowances, approve, approval_amount=0):
+        self.owner = owner.lower()
+        self.read_allowances = read_allowances
+        self.approve = approve
+        self.approval_amount = approval_amount  # 0 = approve exactly what the swap needs
+        self.allowances = {}  # (token, spender) lower-case -> allowance left for new swaps
+        self.in_flight = {}   # (token, spender) -> amount of sent swaps without a receipt
+        self.approvals = {}   # (token, spender) -> [tx hash of the latest approval, spends booked since]
+        self.lock = threading.RLock()  # Swaps are booked on the sender thread, receipts on the tracker's
+
+    @staticmethod
+    def key(token, spender):
+        return token.lower(), spender.lower()
+
+    def get(self, token, spender):
+        return self.allowances.get(self.key(token, spender))
+
+    def prefetch(self, pairs):
+        """Read the allowance of every uncached (token, spender) in one read_allowances() call."""
+        with self.lock:
+            missing = list(dict.fromkeys(self.key(token, spender) for token, spender in pairs
+                                         if self.key(token, spender) not in self.allowances))
+        if not missing:
+            return
+        values = self.read_allowances(missing)
+        with self.lock:
+            for key, value in zip(missing, values):
+                if value is not None and key not in self.allowances:
+                    self.allowances[key] = value if value == UNLIMITED else max(0, value - self.in_flight.get(key, 0))
+
+    def ensure(self, token, spender, amount):
+        """Approve `spender` for `amount` unless the cached allowance covers it; returns the approval tx hash."""
+        key = self.key(token, spender)
+        if key not in self.allowances:
+            self.prefetch([key])
+        if self.allowances.get(key, 0) >= amount:
+            return None
+        approved = max(amount, self.approval_amount)
+        tx_hash = self.approve(token, spender, approved)
+        if tx_hash is not None:
+            with self.lock:
+                # Swaps sent after it are mined after it (local nonces), so they can count on it
+                self.allowances[key] = approved
+                self.approvals[key] = [tx_hash, 0]
+        return tx_hash
+
+    def spend(self, token, spender, amount):
+        """Book a sent swap against the allowance."""
+        key = self.key(token, spender)
+        with self.lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + amount
+            if key in self.approvals:
+                self.approvals[key][1] += amount
+            if key in self.allowances and self.allowances[key] != UNLIMITED:
+                self.allowances[key] = max(0, self.allowances[key] - amount)
+
+    def swap_receipt(self, token, spender, amount, receipt):
+        """Settle a booked swap; `receipt` is None if it was never mined."""
+        key = self.key(token, spender)
+        with self.lock:
+            left = self.in_flight.get(key, 0) - amount
+            if left > 0:
+                self.in_flight[key] = left
+            else:
+                self.in_flight.pop(key, None)
+            if receipt is None or receipt["status"] == 0:
+                # Nothing (or, for a lost tx, possibly nothing) was pulled: re-read instead of guessing
+                self.allowances.pop(key, None)
+                if key in self.approvals:
+                    self.approvals[key][1] -= amount
+
+    def approval_receipt(self, token, spender, tx_hash, receipt):
+        """Settle an approve() sent by ensure(); `receipt` is None if it was never mined."""
+        key = self.key(token, spender)
+        with self.lock:
+            approval = self.approvals.get(key)
+            if approval is None or approval[0] != tx_hash:
+                return  # A later approval replaced this one; its own receipt settles the key
+            del self.approvals[key]
+            value = approval_value(receipt, self.owner, *key) if receipt is not None and receipt["status"] == 1 else None
+            if value is None:
+                self.allowances.pop(key, None)  # Reverted, lost or no event: re-read from the chain
+            elif value == UNLIMITED:
+                self.allowances[key] = value
+            else:
+                self.allowances[key] = max(0, value - approval[1])
@@ -0,0 +1,25 @@
+"""BatchSwapExecutor (contracts/BatchSwapExecutor.vy) ABI and decoding of its per-swap SwapResult events."""
+import json
+from collections import namedtuple
+
+from eth_abi import decode
+from web3 import Web3
+
+BATCH_EXECUTOR_ABI = json.loads('[{"inputs":[{"components":[{"name":"tokenIn","type":"address"},{"name":"amountIn","type":"uint256"},{"name":"amountOutMin","type":"uint256"},{"components":[{"name":"from","type":"address"},{"name":"to","type":"address"},{"name":"stable","type":"bool"},{"name":"factory","type":"address"}],"name":"routes","type":"tuple[]"}],"name":"swaps","type":"tuple[]"},{"name":"deadline","type":"uint256"}],"name":"batchSwap","outputs":[{"name":"succeeded","type":"bool[]"},{"name":"amountsOut","type":"uint256[]"}],"stateMutability":"nonpayable","type":"function"}]')
+SWAP_RESULT_TOPIC = Web3.to_hex(Web3.keccak(text="SwapResult(uint256,address,bool,uint256,bytes)"))
+
+# One swap of a batch: `reason` is the router's revert data (or "transferFrom failed") when not `success`
+SwapResult = namedtuple("SwapResult", ["index", "token_in", "success", "amount_out", "reason"])
+
+
+def swap_results(receipt, executor_address):
+    """{swap index: SwapResult} from the SwapResult events `executor_address` emitted in `receipt`."""
+    results = {}
+    for log in receipt["logs"]:
+        topics = [Web3.to_hex(topic) for topic in log["topics"]]
+        if log["address"].lower() != executor_address.lower() or len(topics) != 3 or topics[0] != SWAP_RESULT_TOPIC:
+            continue
+        success, amount_out, reason = decode(["bool", "uint256", "bytes"], bytes(log["data"]))
+        index = int(topics[1], 16)
+        results[index] = SwapResult(index, "0x" + topics[2][-40:], success, amount_out, reason)
+    return results
@@ -6,6 +6,10 @@ import socket
 import os
 import json
 from dotenv import load_dotenv
+from price_history_store import PriceHistory
+from tick_archive import TickArchive
+from position_journal import PositionJournal
+from loop_scheduler import LoopScheduler
 
 load_dotenv()
 
@@ -22,9 +26,15 @@ CONNECTION_ERRORS = (requests.exceptions.ChunkedEncodingError, requests.exceptio
                      requests.exceptions.Timeout, socket.timeout)
 CONNECTION_ERRORS += (ConnectionResetError,)
 # ✅ File to store held tokens
-HELD_TOKENS_FILE = "held_tokens.json"
-PRICE_HISTORY_FILE = "price_history.json"
-TOKEN_PRICES_FILENAME = "token_prices.txt"
+HELD_TOKENS_FILE = "held_tokens.json"  # Legacy file, imported once into the journal below
+POSITION_JOURNAL_FILE = "positions_bybit1smart_chatgpt.jsonl"  # This bot's own append-only position and start/profit price events
+PRICE_HISTORY_FILE = "price_history.json"  # Legacy JSON history, imported once into the store below
+PRICE_HISTORY_STORE = "price_history_bybit1smart_chatgpt"  # This bot's own .npz snapshot + .ticks log (capacities differ per bot)
+TICK_ARCHIVE_DIR = "tick_archive/bybit1smart_chatgpt"  # Every tick's price, kept for replays (one writer per archive, one directory per day)
+TOKEN_PRICES_FILENAME = "token_prices.txt"  # Legacy file, imported once into the journal
+POSITION_JOURNAL = PositionJournal(POSITION_JOURNAL_FILE)
+LOOP_CADENCE = 30  # Seconds between price checks
+LOOP_PHASE_BUDGETS = {"fetch": 10, "trade": 15}  # Seconds; overruns are logged
 
 
 def make_order(symbol, side, qty):    
@@ -72,25 +82,20 @@ def get_token_balance(coin):
 def save_held_tokens():
     global held_tokens, held_token_prices
     
-    data = {
-        "held_tokens": list(held_tokens),
-        "held_token_prices": held_token_prices
-    }
-    
-    with open(HELD_TOKENS_FILE, "w") as file:
-        json.dump(data, file, indent=4)
+    # Appends only the open/update/close events since the last save; fsyncs are batched
+    POSITION_JOURNAL.record({token: held_token_prices.get(token) for token in held_tokens})
+    POSITION_JOURNAL.commit()
 
 
 # ✅ Load Held Tokens from File (at startup)
 def load_held_tokens():
     global held_tokens, held_token_prices
 
-    if os.path.exists(HELD_TOKENS_FILE):
-        with open(HELD_TOKENS_FILE, "r") as file:
-            data = json.load(file)
-            held_tokens = set(data.get("held_tokens", []))
-            held_token_prices = data.get("held_token_prices", {})
-        print(f"🔄 Loaded {len(held_tokens)} held tokens from file.")
+    POSITION_JOURNAL.import_legacy(held_tokens_file=HELD_TOKENS_FILE, token_prices_file=TOKEN_PRICES_FILENAME)
+    positions = POSITION_JOURNAL.open_positions()
+    held_tokens = set(positions)
+    held_token_prices = {token: position for token, position in positions.items() if position is not None}
+    print(f"🔄 Loaded {len(held_tokens)} held tokens from the position journal.")
 
 
 def find_price_jump(token_price_history, min_x, percentage_threshold=0.03):
@@ -116,30 +121,23 @@ def find_price_jump(token_price_history, min_x, percentage_threshold=0.03):
 
 
 # **Load price history from file**
-def load_price_history():
-    if os.path.exists(PRICE_HISTORY_FILE):
-        with open(PRICE_HISTORY_FILE, "r") as f:
-            return json.load(f)
-    return {}
+def load_price_history(capacity):
+    return PriceHistory(PRICE_HISTORY_STORE, capacity, legacy_json=PRICE_HISTORY_FILE)
 
-# **Save price history to file**
+# **Save price history to file** (appends new ticks; snapshots periodically)
 def save_price_history(price_history):
-    with open(PRICE_HISTORY_FILE, "w") as f:
-        json.dump(price_history, f)
+    price_history.flush()
 
 def save_prices(start_price, profit_price):
-    with open(TOKEN_PRICES_FILENAME, "w") as file:
-        file.write(f"{start_price},{profit_price}")
+    POSITION_JOURNAL.record_levels(start_price, profit_price)
+    POSITION_JOURNAL.commit()
 
 
 def load_prices():
-    if os.path.exists(TOKEN_PRICES_FILENAME):
-        with open(TOKEN_PRICES_FILENAME, "r") as file:
-            data = file.read().strip()
-            if data:
-                start_price, profit_price = map(float, data.split(","))
-                return start_price, profit_price
-    return None, None  # Default values if file doesn't exist
+    if POSITION_JOURNAL.levels is not None:
+        start_price, profit_price = POSITION_JOURNAL.levels
+        return start_price, profit_price
+    return None, None  # Default values if nothing was saved yet
 
 
 
@@ -233,8 +231,9 @@ session = HTTP(
 held_tokens = set()
 held_token_prices = {}
 load_held_tokens()
-price_history = load_price_history()
 X = 2400  # ✅ Check last 10 hours dynamically
+price_history = load_price_history(X)
+tick_archive = TickArchive(TICK_ARCHIVE_DIR)
 min_X = 60  # ✅ Check last 5 minutes dynamically
 smart_take_profit = False
 can_buy = False
@@ -248,38 +247,34 @@ if TOKEN_START_PRICE is None or TOKEN_PROFIT_PRICE is None:
 
 
 token_history_price = float(get_token_price(SYMBOL))
+# Iterations start every LOOP_CADENCE seconds on a fixed grid; `continue` and errors wait for the next slot too
+scheduler = LoopScheduler(LOOP_CADENCE, name=SYMBOL, budgets=LOOP_PHASE_BUDGETS)
 sleep(30)
 
 while True:
+    scheduler.wait()
     try:
         token_price = float(get_token_price(SYMBOL))
         grass = get_token_balance(COIN)
         usdt = get_token_balance(HELP_COIN)
         print(grass)
         print(usdt)
+        scheduler.checkpoint("fetch")
         # **Price Change Calculation**
-        historical_prices = price_history.get(COIN, {}).get("prices", [])
-        
-        # Append latest token price
+        # Append latest token price (the ring buffer keeps only the last X prices)
         if token_price:
-            historical_prices.append(token_price)
-
-        # Keep only last X prices
-        price_history[COIN] = {"prices": historical_prices[-X:]}
+            price_history.append(COIN, token_price)
+            tick_archive.append(COIN, token_price, "bybit")
         save_price_history(price_history)
+        tick_archive.flush()
 
         # Ensure price change is calculated over 2.5 minutes to 4 hours
-        if len(historical_prices) < min_X:
+        if price_history.count(COIN) < min_X:
             continue
         
         # Extract price history
-        token_price_history = [entry for entry in historical_prices]
-
-        # Ensure we have enough history
-        if len(token_price_history) < min_X:
-            continue
+        token_price_history = price_history.window(COIN)
         short_array = 3
-        save_price_history(price_history)
         if can_buy == False:
             spike_fluct = 0.0
             # Run detection function
@@ -321,7 +316,7 @@ while True:
             save_prices(TOKEN_START_PRICE, TOKEN_PROFIT_PRICE)
             # Keep only last 3 prices
             short = len(token_price_history) - short_array
-            price_history[COIN] = {"prices": historical_prices[-short:]}
+            price_history.truncate(COIN, short)
             save_price_history(price_history)
         print('TOKEN_START_PRICE')
         print(TOKEN_START_PRICE)
@@ -384,11 +379,12 @@ while True:
                     can_buy = False
                     smart_take_profit = False
                     save_prices(TOKEN_START_PRICE, TOKEN_PROFIT_PRICE)
-                    #price_history[COIN] = {"prices": historical_prices[-3:]}
+                    #price_history.truncate(COIN, 3)
                     #save_price_history(price_history)
 
         token_history_price = token_price
-        sleep(30)
+        save_held_tokens()  # Journal highest-price updates and fsync batched events
+        scheduler.checkpoint("trade")
     except CONNECTION_ERRORS as e:
         print(f'Éxception  {e}')
     except Exception as e:
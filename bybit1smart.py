@@ -6,6 +6,11 @@ import socket
 import os
 import json
 from dotenv import load_dotenv
+from price_history_store import PriceHistory
+from tick_archive import TickArchive
+from rolling_extrema import RollingMin, rise_from_min
+from position_journal import PositionJournal
+from loop_scheduler import LoopScheduler
 
 load_dotenv()
 
@@ -22,9 +27,15 @@ CONNECTION_ERRORS = (requests.exceptions.ChunkedEncodingError, requests.exceptio
                      requests.exceptions.Timeout, socket.timeout)
 CONNECTION_ERRORS += (ConnectionResetError,)
 # ✅ File to store held tokens
-HELD_TOKENS_FILE = "held_tokens.json"
-PRICE_HISTORY_FILE = "price_history.json"
-TOKEN_PRICES_FILENAME = "token_prices.txt"
+HELD_TOKENS_FILE = "held_tokens.json"  # Legacy file, imported once into the journal below
+POSITION_JOURNAL_FILE = "positions_bybit1smart.jsonl"  # This bot's own append-only position and start/profit price events
+PRICE_HISTORY_FILE = "price_history.json"  # Legacy JSON history, imported once into the store below
+PRICE_HISTORY_STORE = "price_history_bybit1smart"  # This bot's own .npz snapshot + .ticks log (capacities differ per bot)
+TICK_ARCHIVE_DIR = "tick_archive/bybit1smart"  # Every tick's price, kept for replays (one writer per archive, one directory per day)
+TOKEN_PRICES_FILENAME = "token_prices.txt"  # Legacy file, imported once into the journal
+POSITION_JOURNAL = PositionJournal(POSITION_JOURNAL_FILE)
+LOOP_CADENCE = 30  # Seconds between price checks
+LOOP_PHASE_BUDGETS = {"fetch": 10, "trade": 15}  # Seconds; overruns are logged
 
 
 def make_order(symbol, side, qty):    
@@ -72,38 +83,27 @@ def get_token_balance(coin):
 def save_held_tokens():
     global held_tokens, held_token_prices
     
-    data = {
-        "held_tokens": list(held_tokens),
-        "held_token_prices": held_token_prices
-    }
-    
-    with open(HELD_TOKENS_FILE, "w") as file:
-        json.dump(data, file, indent=4)
+    # Appends only the open/update/close events since the last save; fsyncs are batched
+    POSITION_JOURNAL.record({token: held_token_prices.get(token) for token in held_tokens})
+    POSITION_JOURNAL.commit()
 
 
 # ✅ Load Held Tokens from File (at startup)
 def load_held_tokens():
     global held_tokens, held_token_prices
 
-    if os.path.exists(HELD_TOKENS_FILE):
-        with open(HELD_TOKENS_FILE, "r") as file:
-            data = json.load(file)
-            held_tokens = set(data.get("held_tokens", []))
-            held_token_prices = data.get("held_token_prices", {})
-        print(f"🔄 Loaded {len(held_tokens)} held tokens from file.")
+    POSITION_JOURNAL.import_legacy(held_tokens_file=HELD_TOKENS_FILE, token_prices_file=TOKEN_PRICES_FILENAME)
+    positions = POSITION_JOURNAL.open_positions()
+    held_tokens = set(positions)
+    held_token_prices = {token: position for token, position in positions.items() if position is not None}
+    print(f"🔄 Loaded {len(held_tokens)} held tokens from the position journal.")
 
 
-def find_price_jump(token_price_history, min_x, percentage_threshold=0.03):
-    prices = token_price_history[-min_x:]  # Get the last min_x prices
-    min_price = float('inf')  # Start with a very high number
-    last_price = None  # Store the last price when threshold is crossed
+def find_price_jump(rolling_min, latest_price, percentage_threshold=0.03):
+    # rolling_min tracks the minimum of the window incrementally instead of rescanning it
     price_change = 0.0
 
-    for price in prices:
-        if price < min_price:
-            min_price = price  # Update min_price if a new lower value is found
-        
-    price_change_temp = (token_price_history[-1] - min_price) / min_price
+    price_change_temp = rise_from_min(latest_price, rolling_min.min())
     print(f"cenata se promenila od minimalista cena za {price_change_temp} procenti")
     if price_change_temp >= percentage_threshold:
         price_change = price_change_temp
@@ -116,30 +116,23 @@ def find_price_jump(token_price_history, min_x, percentage_threshold=0.03):
 
 
 # **Load price history from file**
-def load_price_history():
-    if os.path.exists(PRICE_HISTORY_FILE):
-        with open(PRICE_HISTORY_FILE, "r") as f:
-            return json.load(f)
-    return {}
+def load_price_history(capacity):
+    return PriceHistory(PRICE_HISTORY_STORE, capacity, legacy_json=PRICE_HISTORY_FILE)
 
-# **Save price history to file**
+# **Save price history to file** (appends new ticks; snapshots periodically)
 def save_price_history(price_history):
-    with open(PRICE_HISTORY_FILE, "w") as f:
-        json.dump(price_history, f)
+    price_history.flush()
 
 def save_prices(start_price, profit_price):
-    with open(TOKEN_PRICES_FILENAME, "w") as file:
-        file.write(f"{start_price},{profit_price}")
+    POSITION_JOURNAL.record_levels(start_price, profit_price)
+    POSITION_JOURNAL.commit()
 
 
 def load_prices():
-    if os.path.exists(TOKEN_PRICES_FILENAME):
-        with open(TOKEN_PRICES_FILENAME, "r") as file:
-            data = file.read().strip()
-            if data:
-                start_price, profit_price = map(float, data.split(","))
-                return start_price, profit_price
-    return None, None  # Default values if file doesn't exist
+    if POSITION_JOURNAL.levels is not None:
+        start_price, profit_price = POSITION_JOURNAL.levels
+        return start_price, profit_price
+    return None, None  # Default values if nothing was saved yet
 
 
 
@@ -153,8 +146,12 @@ session = HTTP(
 held_tokens = set()
 held_token_prices = {}
 load_held_tokens()
-price_history = load_price_history()
 X = 480  # ✅ Check last 10 hours dynamically
+price_history = load_price_history(X)
+tick_archive = TickArchive(TICK_ARCHIVE_DIR)
+# Minimum of every stored price but the oldest (what find_price_jump used to scan)
+rolling_min = RollingMin(X - 1)
+rolling_min.reset(price_history.window(COIN)[1:])
 min_X = 5  # ✅ Check last 5 minutes dynamically
 smart_take_profit = False
 
@@ -167,49 +164,44 @@ if TOKEN_START_PRICE is None or TOKEN_PROFIT_PRICE is None:
 
 
 token_history_price = float(get_token_price(SYMBOL))
+# Iterations start every LOOP_CADENCE seconds on a fixed grid; `continue` and errors wait for the next slot too
+scheduler = LoopScheduler(LOOP_CADENCE, name=SYMBOL, budgets=LOOP_PHASE_BUDGETS)
 sleep(30)
 
 while True:
+    scheduler.wait()
     try:
         token_price = float(get_token_price(SYMBOL))
         grass = get_token_balance(COIN)
         usdt = get_token_balance(HELP_COIN)
         print(grass)
         print(usdt)
+        scheduler.checkpoint("fetch")
         # **Price Change Calculation**
-        historical_prices = price_history.get(COIN, {}).get("prices", [])
-        
-        # Append latest token price
+        # Append latest token price (the ring buffer keeps only the last X prices)
         if token_price:
-            historical_prices.append(token_price)
-
-        # Keep only last X prices
-        price_history[COIN] = {"prices": historical_prices[-X:]}
+            price_history.append(COIN, token_price)
+            tick_archive.append(COIN, token_price, "bybit")
+            if price_history.count(COIN) > 1:
+                rolling_min.push(token_price)
         save_price_history(price_history)
+        tick_archive.flush()
 
         # Ensure price change is calculated over 2.5 minutes to 4 hours
-        if len(historical_prices) < min_X:
+        if price_history.count(COIN) < min_X:
             continue
-        
-        # Extract price history
-        token_price_history = [entry for entry in historical_prices]
-
-        # Ensure we have enough history
-        if len(token_price_history) < min_X:
-            continue
-
-        save_price_history(price_history)
 
         # Get price change over time
         threshold = 0.027
-        price_change = find_price_jump(token_price_history, len(token_price_history) - 1, threshold)
+        price_change = find_price_jump(rolling_min, price_history.latest(COIN), threshold)
         print(f"🔍 DEBUG: {SYMBOL} Price Change = {price_change:.20%}, Threshold = {threshold:.4%}")
         if price_change >= threshold and TOKEN_START_PRICE == 0 and TOKEN_PROFIT_PRICE == 0:
             TOKEN_START_PRICE = token_price - 0.00001
             TOKEN_PROFIT_PRICE = token_price * 1.027
             save_prices(TOKEN_START_PRICE, TOKEN_PROFIT_PRICE)
             # Keep only last 3 prices
-            price_history[COIN] = {"prices": historical_prices[-3:]}
+            price_history.truncate(COIN, 3)
+            rolling_min.reset(price_history.window(COIN)[1:])
             save_price_history(price_history)
         print('TOKEN_START_PRICE')
         print(TOKEN_START_PRICE)
@@ -270,11 +262,13 @@ while True:
                     TOKEN_PROFIT_PRICE = 0.0
                     smart_take_profit = False
                     save_prices(TOKEN_START_PRICE, TOKEN_PROFIT_PRICE)
-                    price_history[COIN] = {"prices": historical_prices[-3:]}
+                    price_history.truncate(COIN, 3)
+                    rolling_min.reset(price_history.window(COIN)[1:])
                     save_price_history(price_history)
 
         token_history_price = token_price
-        sleep(30)
+        save_held_tokens()  # Journal highest-price updates and fsync batched events
+        scheduler.checkpoint("trade")
     except CONNECTION_ERRORS as e:
         print(f'Éxception  {e}')
     except Exception as e:
@@ -0,0 +1,106 @@
+# pragma version 0.4.3
+# @license MIT
+"""
+@title BatchSwapExecutor
+@notice Runs every swap of one bot decision cycle in a single transaction through the Aerodrome router.
+        Each swap is tried on its own: a swap that reverts refunds its input to the owner and the
+        rest of the batch still executes. Tokens are pulled from the owner (approve this contract
+        once per token), swapped, and the output is sent straight back to the owner.
+"""
+
+MAX_SWAPS: constant(uint256) = 64  # Swaps per batch
+MAX_HOPS: constant(uint256) = 4    # Routes per swap
+MAX_REASON: constant(uint256) = 1024  # Bytes of router revert data kept in SwapResult
+
+# Field names differ from the router's Solidity struct (`from` is reserved); the ABI encoding is the same
+struct Route:
+    from_: address
+    to: address
+    stable: bool
+    factory: address
+
+struct Swap:
+    tokenIn: address
+    amountIn: uint256
+    amountOutMin: uint256
+    routes: DynArray[Route, MAX_HOPS]
+
+event SwapResult:
+    index: indexed(uint256)
+    tokenIn: indexed(address)
+    success: bool
+    amountOut: uint256
+    reason: Bytes[MAX_REASON]
+
+owner: public(immutable(address))
+router: public(immutable(address))
+
+
+@deploy
+def __init__(router_: address):
+    owner = msg.sender
+    router = router_
+
+
+@external
+def batchSwap(swaps: DynArray[Swap, MAX_SWAPS], deadline: uint256) -> (DynArray[bool, MAX_SWAPS], DynArray[uint256, MAX_SWAPS]):
+    assert msg.sender == owner, "not owner"
+    succeeded: DynArray[bool, MAX_SWAPS] = []
+    amounts_out: DynArray[uint256, MAX_SWAPS] = []
+    for i: uint256 in range(len(swaps), bound=MAX_SWAPS):
+        swap: Swap = swaps[i]
+        succeeded.append(False)
+        amounts_out.append(0)
+        if not self._call(swap.tokenIn, abi_encode(owner, self, swap.amountIn, method_id=method_id("transferFrom(address,address,uint256)"))):
+            log SwapResult(index=i, tokenIn=swap.tokenIn, success=False, amountOut=0, reason=b"transferFrom failed")
+            continue
+        self._call(swap.tokenIn, abi_encode(router, swap.amountIn, method_id=method_id("approve(address,uint256)")))
+
+        ok: bool = False
+        response: Bytes[MAX_REASON] = b""
+        ok, response = raw_call(
+            router,
+            abi_encode(swap.amountIn, swap.amountOutMin, swap.routes, owner, deadline,
+                       method_id=method_id("swapExactTokensForTokens(uint256,uint256,(address,address,bool,address)[],address,uint256)")),
+            max_outsize=MAX_REASON,
+            revert_on_failure=False,
+        )
+        if ok:
+            amounts: DynArray[uint256, MAX_HOPS + 1] = abi_decode(response, DynArray[uint256, MAX_HOPS + 1])
+            succeeded[i] = True
+            amounts_out[i] = amounts[len(amounts) - 1]
+            log SwapResult(index=i, tokenIn=swap.tokenIn, success=True, amountOut=amounts_out[i], reason=b"")
+        else:
+            # Give the input back and clear the router allowance before the next swap
+            self._call(swap.tokenIn, abi_encode(router, empty(uint256), method_id=method_id("approve(address,uint256)")))
+            self._call(swap.tokenIn, abi_encode(owner, swap.amountIn, method_id=method_id("transfer(address,uint256)")))
+            log SwapResult(index=i, tokenIn=swap.tokenIn, success=False, amountOut=0, reason=response)
+    return succeeded, amounts_out
+
+
+@external
+def rescue(token: address):
+    """
+    @notice Sends any token balance left on the contract (e.g. fee-on-transfer dust) to the owner
+    """
+    assert msg.sender == owner, "not owner"
+    ok: bool = False
+    data: Bytes[32] = b""
+    ok, data = raw_call(token, abi_encode(self, method_id=method_id("balanceOf(address)")),
+                        max_outsize=32, is_static_call=True, revert_on_failure=False)
+    assert token.is_contract and ok and len(data) == 32, "balanceOf failed"
+    assert self._call(token, abi_encode(owner, convert(data, uint256), method_id=method_id("transfer(address,uint256)"))), "transfer failed"
+
+
+@internal
+def _call(token: address, data: Bytes[100]) -> bool:
+    """
+    @notice ERC-20 call that tolerates tokens returning nothing instead of a bool. A call to an
+            address without code would "succeed" with no return data, so it counts as failed.
+    """
+    if not token.is_contract:
+        return False
+    ok: bool = False
+    result: Bytes[32] = b""
+    ok, result = raw_call(token, data, max_outsize=32, revert_on_failure=False)
+    return ok and (len(result) == 0 or (len(result) == 32 and convert(result, uint256) == 1))
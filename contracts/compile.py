@@ -0,0 +1,43 @@
+"""Compile Vyper contracts into the JSON artifacts (ABI + deploy bytecode) committed next to them.
+
+Usage: python3 contracts/compile.py contracts/BatchSwapExecutor.vy tests/contracts/*.vy
+Needs `pip install vyper==0.4.3`; the bot and the tests only read the artifacts.
+"""
+import json
+import os
+import sys
+
+VYPER_VERSION = "0.4.3"
+EVM_VERSION = "cancun"  # Base supports Cancun opcodes
+
+
+def compile_contract(path):
+    """{"compiler", "evm_version", "abi", "bytecode"} of the Vyper source at `path`."""
+    import vyper
+    from vyper.compiler import compile_code
+    from vyper.compiler.settings import Settings
+
+    if vyper.__version__.split("+")[0] != VYPER_VERSION:
+        raise RuntimeError(f"vyper {VYPER_VERSION} required, found {vyper.__version__}")
+    with open(path) as f:
+        source = f.read()
+    output = compile_code(source, contract_path=os.path.basename(path), output_formats=["abi", "bytecode"],
+                          settings=Settings(evm_version=EVM_VERSION))
+    return {"compiler": f"vyper {VYPER_VERSION}", "evm_version": EVM_VERSION,
+            "abi": output["abi"], "bytecode": output["bytecode"]}
+
+
+def artifact_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def main(paths):
+    for path in paths:
+        with open(artifact_path(path), "w") as f:
+            json.dump(compile_contract(path), f, indent=1)
+            f.write("\n")
+        print(f"{path} -> {artifact_path(path)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
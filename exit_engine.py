@@ -0,0 +1,64 @@
+"""Tick-driven stop-loss / take-profit / trailing-stop exits, checked per held token as its price moves."""
+from collections import namedtuple
+
+from signal_kernel import STOP_LOSS, TAKE_PROFIT, TRAILING_STOP
+
+ExitSignal = namedtuple("ExitSignal", ["token", "reason", "price", "buy_price", "highest_price"])
+
+
+class ExitEngine:
+    """Exit levels per held position, checked against each new price of that token only.
+
+    Positions are the bot's own {"buy_price", "highest_price"} dicts (held_token_prices values),
+    so highest_price raises made here are journaled with the rest. The stop-loss and take-profit
+    prices are fixed at open, so an update is two comparisons; the caller decides which tokens
+    a tick touched. Same rules as signal_kernel: sell at the stop-loss, and inside the
+    take-profit zone raise highest_price and sell once the price trails it by trailing_stop.
+    """
+
+    def __init__(self, stop_loss=STOP_LOSS, take_profit=TAKE_PROFIT, trailing_stop=TRAILING_STOP):
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.trailing_stop = trailing_stop
+        self.positions = {}
+        self.levels = {}  # token -> (stop-loss price, take-profit price)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def sync(self, positions):
+        """Open/close so the engine tracks exactly `positions` ({token: position dict})."""
+        for token in [token for token, position in self.positions.items() if positions.get(token) is not position]:
+            self.close(token)
+        for token, position in positions.items():
+            if token not in self.positions and isinstance(position, dict) and position.get("buy_price"):
+                self.open(token, position)
+
+    def open(self, token, position):
+        buy_price = position["buy_price"]
+        self.positions[token] = position
+        self.levels[token] = (buy_price * (1 + self.stop_loss), buy_price * (1 + self.take_profit))
+
+    def close(self, token):
+        self.positions.pop(token, None)
+        self.levels.pop(token, None)
+
+    def update(self, token, price):
+        """Feed a new price; returns an ExitSignal (and stops tracking the token) if a level was crossed."""
+        position = self.positions.get(token)
+        if position is None or not price:
+            return None
+        buy_price = position["buy_price"]
+        stop_loss_level, take_profit_level = self.levels[token]
+        reason = None
+        if price <= stop_loss_level:
+            reason = "Stop Loss"
+        elif price >= take_profit_level:
+            if price > position.get("highest_price", buy_price):
+                position["highest_price"] = price
+            if price <= position.get("highest_price", buy_price) * (1 - self.trailing_stop):
+                reason = "SMART TAKE PROFIT"
+        if reason is None:
+            return None
+        self.close(token)
+        return ExitSignal(token, reason, price, buy_price, position.get("highest_price", buy_price))
@@ -0,0 +1,66 @@
+"""EIP-1559 fee fields computed once per block, and gas limits learned from our own receipts."""
+import threading
+
+BASE_FEE_MULTIPLIER = 2        # maxFeePerGas covers this many base fees, so a tx survives a few full blocks
+MIN_PRIORITY_FEE = 1_000_000   # Wei (0.001 gwei); the node's suggestion is used when higher
+GAS_MARGIN = 1.25              # Gas limit = learned usage * margin
+GAS_DECAY = 0.9                # A lower reading pulls the learned usage down by at most 10% per receipt
+
+
+class FeeOracle:
+    """Transaction fee and gas fields without per-transaction RPCs.
+
+    read_state() returns the bot's per-block chain state ({"block", "base_fee", "priority_fee",
+    "gas_price"}); fee fields are derived from it once per block. Only the base fee times
+    BASE_FEE_MULTIPLIER plus the tip is offered as maxFeePerGas, and the chain charges the
+    actual base fee, instead of a flat multiple of the legacy gas price. Chains without a base
+    fee fall back to gasPrice. Gas limits are keyed by (contract, call shape) and learned from
+    successful receipts; unseen keys use the caller's default, and a key whose transaction ran
+    out of gas gets twice the limit that failed.
+    """
+
+    def __init__(self, read_state, chain_id, base_fee_multiplier=BASE_FEE_MULTIPLIER,
+                 min_priority_fee=MIN_PRIORITY_FEE, gas_margin=GAS_MARGIN):
+        self.read_state = read_state
+        self.chain_id = chain_id
+        self.base_fee_multiplier = base_fee_multiplier
+        self.min_priority_fee = min_priority_fee
+        self.gas_margin = gas_margin
+        self.block = None
+        self.fee_fields = None
+        self.gas_used = {}  # (contract, shape) -> learned gas used
+        self.lock = threading.Lock()
+
+    def fees(self):
+        state = self.read_state()
+        with self.lock:
+            if state["block"] != self.block or self.fee_fields is None:
+                if state.get("base_fee"):
+                    priority_fee = max(state.get("priority_fee") or 0, self.min_priority_fee)
+                    self.fee_fields = {"maxFeePerGas": state["base_fee"] * self.base_fee_multiplier + priority_fee,
+                                       "maxPriorityFeePerGas": priority_fee}
+                else:
+                    self.fee_fields = {"gasPrice": state["gas_price"]}
+                self.block = state["block"]
+            return dict(self.fee_fields)
+
+    def gas_limit(self, key, default):
+        used = self.gas_used.get(key)
+        return int(used * self.gas_margin) if used else default
+
+    def learn(self, key, gas_used):
+        """Record the gas a successful transaction of shape `key` used."""
+        with self.lock:
+            self.gas_used[key] = max(gas_used, int(self.gas_used.get(key, 0) * GAS_DECAY))
+
+    def learn_out_of_gas(self, key, gas_limit):
+        """A transaction of shape `key` used all of `gas_limit` and reverted: double the next limit."""
+        with self.lock:
+            self.gas_used[key] = max(self.gas_used.get(key, 0), int(gas_limit * 2 / self.gas_margin))
+
+    def tx_params(self, key, default_gas, **fields):
+        """build_transaction() parameters: chainId, learned gas limit and this block's fees, plus `fields`."""
+        params = {"chainId": self.chain_id, "gas": self.gas_limit(key, default_gas)}
+        params.update(self.fees())
+        params.update(fields)
+        return params
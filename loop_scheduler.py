@@ -0,0 +1,116 @@
+"""Drift-free loop cadence (optionally gated on new blocks) with per-phase time budgets and overrun reports."""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LoopScheduler:
+    """Starts iterations on a fixed grid (first tick + k * cadence) instead of sleeping after the work.
+
+    An iteration that overruns its slot skips the missed slots (and says so) rather than
+    running them back to back. With `block_number` set, a slot also waits for a block newer
+    than the one the previous iteration ran on, so an unchanged chain costs no work. Phases
+    are timed with checkpoint(); a phase over its budget is reported, and report_every
+    iterations a per-phase summary is logged.
+    """
+
+    def __init__(self, cadence, name="loop", budgets=None, block_number=None, block_time=2.0, report_every=60):
+        self.cadence = cadence
+        self.name = name
+        self.budgets = budgets or {}
+        self.block_number = block_number
+        self.block_time = block_time
+        self.report_every = report_every
+        self.next_tick = None
+        self.block = None
+        self.iteration = 0
+        self.phase_start = None
+        self.inputs = {}
+        self.stats = {}  # phase -> [runs, skips, overruns, total seconds, worst seconds]
+
+    def wait(self, idle=None):
+        """Block until the next slot, then return the current block (None without `block_number`).
+
+        `idle(seconds)` is called instead of sleeping when given, e.g. to follow Sync logs.
+        """
+        now = time.time()
+        if self.next_tick is None:
+            self.next_tick = now
+        else:
+            self.next_tick += self.cadence
+            if now > self.next_tick:
+                missed = int((now - self.next_tick) // self.cadence) + 1
+                logger.warning(f"⏱️ {self.name}: iteration {self.iteration} overran by {now - self.next_tick:.1f}s, "
+                               f"skipping {missed} slot(s)")
+                self.next_tick += missed * self.cadence
+            self._pause(self.next_tick, idle)
+
+        if self.block_number is not None:
+            block = self._safe_block_number()
+            while block is not None and self.block is not None and block <= self.block:
+                self._pause(time.time() + self.block_time, idle)
+                block = self._safe_block_number()
+            self.block = block
+
+        self.iteration += 1
+        if self.report_every and self.iteration % self.report_every == 0:
+            self.report()
+        self.phase_start = time.time()
+        return self.block
+
+    def _pause(self, until, idle):
+        seconds = until - time.time()
+        if seconds <= 0:
+            return
+        if idle is not None:
+            idle(seconds)
+        remaining = until - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _safe_block_number(self):
+        try:
+            return self.block_number()
+        except Exception as e:
+            logger.error(f"⚠️ {self.name}: could not read block number: {e}")
+            return None
+
+    # **PHASES**
+    def checkpoint(self, phase):
+        """Close `phase` (timed from the previous checkpoint or the slot start) and check its budget."""
+        now = time.time()
+        elapsed = now - (self.phase_start or now)
+        self.phase_start = now
+        return self.record(phase, elapsed)
+
+    def record(self, phase, elapsed):
+        """Account `elapsed` seconds to `phase` (for phases timed outside the slot, e.g. pipeline stages)."""
+        stats = self.stats.setdefault(phase, [0, 0, 0, 0.0, 0.0])
+        stats[0] += 1
+        stats[3] += elapsed
+        stats[4] = max(stats[4], elapsed)
+        budget = self.budgets.get(phase)
+        if budget is not None and elapsed > budget:
+            stats[2] += 1
+            logger.warning(f"⏱️ {self.name}: phase '{phase}' took {elapsed:.2f}s (budget {budget:.2f}s)")
+        return elapsed
+
+    def changed(self, key, value):
+        """True if `value` differs from the last one seen for `key`; gate phases whose input did not change."""
+        if key in self.inputs and self.inputs[key] == value:
+            return False
+        self.inputs[key] = value
+        return True
+
+    def skip(self, phase):
+        """Record that `phase` had no new data this iteration (resets the phase timer)."""
+        self.stats.setdefault(phase, [0, 0, 0, 0.0, 0.0])[1] += 1
+        self.phase_start = time.time()
+
+    def report(self):
+        parts = [
+            f"{phase}: avg {total / runs if runs else 0:.2f}s, worst {worst:.2f}s, {overruns} over budget, {skips} skipped"
+            for phase, (runs, skips, overruns, total, worst) in self.stats.items()
+        ]
+        logger.info(f"📊 {self.name}: {self.iteration} iterations | " + " | ".join(parts))
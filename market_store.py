@@ -0,0 +1,202 @@
+"""On-disk pool/token metadata store for the Aerodrome bot (replaces pools_cache.json / token_pairs_cache.json)."""
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pools (
+    id        TEXT PRIMARY KEY,
+    token0    TEXT NOT NULL,
+    token1    TEXT NOT NULL,
+    liquidity TEXT NOT NULL,
+    data      TEXT NOT NULL,            -- raw subgraph pool as JSON
+    seq       INTEGER NOT NULL,         -- store-wide change counter of the last write
+    deleted   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pools_by_token0 ON pools(token0);
+CREATE INDEX IF NOT EXISTS pools_by_token1 ON pools(token1);
+CREATE INDEX IF NOT EXISTS pools_by_seq ON pools(seq);
+
+CREATE TABLE IF NOT EXISTS tokens (
+    id       TEXT PRIMARY KEY,
+    symbol   TEXT,
+    decimals INTEGER,
+    seq      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_by_symbol ON tokens(symbol);
+
+-- One row per fetcher so they no longer invalidate each other
+CREATE TABLE IF NOT EXISTS fetch_state (
+    name       TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    block      INTEGER,
+    result     TEXT                     -- optional cached result for fetchers without a table
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class MarketStore:
+    """SQLite tables of pools and tokens keyed by id, indexed by token, with per-fetcher freshness.
+
+    One connection is shared by the bot's threads, so every method holds `lock` for its
+    statements and transactions.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def _next_seq(self):
+        """Bump and return the store-wide change counter (call inside a transaction)."""
+        self.db.execute(
+            "INSERT INTO counters(name, value) VALUES('seq', 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+        )
+        return self.db.execute("SELECT value FROM counters WHERE name = 'seq'").fetchone()[0]
+
+    def current_seq(self):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM counters WHERE name = 'seq'").fetchone()
+            return row[0] if row else 0
+
+    # **POOLS**
+    def _write_pools(self, pools, seq):
+        self.db.executemany(
+            "INSERT INTO pools(id, token0, token1, liquidity, data, seq, deleted) VALUES(?, ?, ?, ?, ?, ?, 0) "
+            "ON CONFLICT(id) DO UPDATE SET token0 = excluded.token0, token1 = excluded.token1, "
+            "liquidity = excluded.liquidity, data = excluded.data, seq = excluded.seq, deleted = 0",
+            [
+                (pool["id"], pool["token0"]["id"].lower(), pool["token1"]["id"].lower(),
+                 str(pool["liquidity"]), json.dumps(pool), seq)
+                for pool in pools
+            ],
+        )
+
+    def _tombstone_pools(self, pool_ids, seq):
+        self.db.executemany(
+            "UPDATE pools SET deleted = 1, seq = ? WHERE id = ?",
+            [(seq, pool_id) for pool_id in pool_ids],
+        )
+
+    def upsert_pools(self, pools):
+        """Insert or replace raw subgraph pools; returns the change counter they were written at."""
+        if not pools:
+            return self.current_seq()
+        with self.lock, self.db:
+            seq = self._next_seq()
+            self._write_pools(pools, seq)
+        return seq
+
+    def delete_pools(self, pool_ids):
+        """Tombstone pools so readers tracking changes see the removal."""
+        if not pool_ids:
+            return self.current_seq()
+        with self.lock, self.db:
+            seq = self._next_seq()
+            self._tombstone_pools(pool_ids, seq)
+        return seq
+
+    def replace_pools(self, pools):
+        """Tombstone every pool not in `pools` and upsert the rest in one transaction (used after a full sync)."""
+        keep = {pool["id"] for pool in pools}
+        with self.lock, self.db:
+            stale = [row[0] for row in self.db.execute("SELECT id FROM pools WHERE deleted = 0") if row[0] not in keep]
+            seq = self._next_seq()
+            self._tombstone_pools(stale, seq)
+            self._write_pools(pools, seq)
+        return seq
+
+    def all_pools(self):
+        """Every live pool (startup only; use pools_changed_since() afterwards)."""
+        with self.lock:
+            return [json.loads(row[0]) for row in self.db.execute("SELECT data FROM pools WHERE deleted = 0 ORDER BY id")]
+
+    def pools_changed_since(self, seq):
+        """Return (changed pools, deleted pool ids, latest seq) for writes after `seq`."""
+        changed = []
+        deleted = []
+        with self.lock:
+            for pool_id, data, is_deleted in self.db.execute(
+                "SELECT id, data, deleted FROM pools WHERE seq > ? ORDER BY id", (seq,)
+            ):
+                if is_deleted:
+                    deleted.append(pool_id)
+                else:
+                    changed.append(json.loads(data))
+            return changed, deleted, self.current_seq()
+
+    def pools_for_token(self, token_id):
+        """Live pools that have `token_id` on either side (served by the token indexes)."""
+        token_id = token_id.lower()
+        with self.lock:
+            return [
+                json.loads(row[0]) for row in self.db.execute(
+                    "SELECT data FROM pools WHERE token0 = ? AND deleted = 0 "
+                    "UNION ALL SELECT data FROM pools WHERE token1 = ? AND deleted = 0",
+                    (token_id, token_id),
+                )
+            ]
+
+    # **TOKENS**
+    def upsert_tokens(self, tokens):
+        """Insert or update {"id", "symbol", "decimals"} token rows."""
+        if not tokens:
+            return
+        with self.lock, self.db:
+            seq = self._next_seq()
+            self.db.executemany(
+                "INSERT INTO tokens(id, symbol, decimals, seq) VALUES(?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET symbol = excluded.symbol, decimals = excluded.decimals, seq = excluded.seq",
+                [(token["id"].lower(), token.get("symbol"), token.get("decimals"), seq) for token in tokens],
+            )
+
+    def get_token(self, token_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id, symbol, decimals FROM tokens WHERE id = ?", (token_id.lower(),)
+            ).fetchone()
+        return {"id": row[0], "symbol": row[1], "decimals": row[2]} if row else None
+
+    def all_tokens(self):
+        with self.lock:
+            return [
+                {"id": row[0], "symbol": row[1], "decimals": row[2]}
+                for row in self.db.execute("SELECT id, symbol, decimals FROM tokens")
+            ]
+
+    # **FETCH FRESHNESS** (one row per fetcher)
+    def mark_fetched(self, name, block=None, result=None, fetched_at=None):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO fetch_state(name, fetched_at, block, result) VALUES(?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET fetched_at = excluded.fetched_at, block = excluded.block, "
+                "result = excluded.result",
+                (name, fetched_at if fetched_at is not None else time.time(), block,
+                 json.dumps(result) if result is not None else None),
+            )
+
+    def last_fetch(self, name):
+        """Return (fetched_at, block) for a fetcher, or (0, None) if it never ran."""
+        with self.lock:
+            row = self.db.execute("SELECT fetched_at, block FROM fetch_state WHERE name = ?", (name,)).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def is_fresh(self, name, ttl):
+        return time.time() - self.last_fetch(name)[0] < ttl
+
+    def cached_result(self, name):
+        """Result stored by mark_fetched(result=...), or None."""
+        with self.lock:
+            row = self.db.execute("SELECT result FROM fetch_state WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
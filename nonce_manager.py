@@ -0,0 +1,98 @@
+"""Local nonce allocation for one sending account: sync from the chain once, then hand out nonces without RPCs."""
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Node error messages meaning our local counter no longer matches the account (geth / reth / erigon wording)
+NONCE_ERRORS = ("nonce too low", "nonce too high", "already known", "replacement transaction underpriced",
+                "invalid nonce", "nonce has already been used")
+
+
+def is_nonce_error(error):
+    message = str(error).lower()
+    return any(text in message for text in NONCE_ERRORS)
+
+
+class NonceManager:
+    """Consecutive nonces for one account from a local counter, safe to share between threads.
+
+    The counter starts from the account's pending transaction count on first use. A nonce
+    whose transaction was never accepted is released and handed out again before new ones,
+    so a failed build or send leaves no gap. When the node rejects a nonce (used by a
+    transaction sent elsewhere, replaced, or ahead of a dropped one) send() resyncs from the
+    chain and retries once. A transaction the node accepted and then dropped raises no error,
+    so callers run check_gap() when a receipt never arrives.
+    """
+
+    def __init__(self, transaction_count):
+        self.transaction_count = transaction_count  # transaction_count(block_identifier) -> int
+        self.lock = threading.RLock()
+        self.next_nonce = None
+        self.released = []  # Min-heap of nonces below next_nonce that were never used
+        self.outstanding = set()  # Nonces of accepted transactions not yet seen mined
+
+    def sync(self):
+        """Reset the counter to the chain's pending transaction count."""
+        with self.lock:
+            self.next_nonce = self.transaction_count("pending")
+            self.released = []
+            self.outstanding = {nonce for nonce in self.outstanding if nonce < self.next_nonce}
+            logger.info(f"🔢 Nonce synced from chain: next nonce {self.next_nonce}")
+            return self.next_nonce
+
+    def allocate(self):
+        with self.lock:
+            if self.next_nonce is None:
+                self.sync()
+            if self.released:
+                return heapq.heappop(self.released)
+            nonce = self.next_nonce
+            self.next_nonce += 1
+            return nonce
+
+    def release(self, nonce):
+        """Give back a nonce whose transaction was not sent."""
+        with self.lock:
+            if self.next_nonce is None or nonce >= self.next_nonce:
+                return
+            heapq.heappush(self.released, nonce)
+            # Fold released nonces at the top back into the counter
+            while self.released and max(self.released) == self.next_nonce - 1:
+                self.released.remove(self.next_nonce - 1)
+                heapq.heapify(self.released)
+                self.next_nonce -= 1
+
+    def send(self, sign, send_raw):
+        """Allocate a nonce, sign(nonce) -> raw transaction, send_raw(raw) -> hash; returns (hash, nonce)."""
+        for attempt in range(2):
+            nonce = self.allocate()
+            try:
+                tx_hash = send_raw(sign(nonce))
+            except Exception as e:
+                if attempt == 0 and is_nonce_error(e):
+                    logger.warning(f"⚠️ Nonce {nonce} rejected ({e}); resyncing from chain")
+                    self.sync()
+                    continue
+                self.release(nonce)
+                raise
+            with self.lock:
+                self.outstanding.add(nonce)
+            return tx_hash, nonce
+
+    def check_gap(self):
+        """Resync if the chain has not mined our oldest outstanding nonce; returns True if it did.
+
+        Compares the account's latest (mined) transaction count with the oldest nonce sent:
+        nonces below it are done, and if any are left the oldest one was dropped or is stuck,
+        so every later transaction waits on it and the counter goes back to the chain.
+        """
+        with self.lock:
+            mined = self.transaction_count("latest")
+            self.outstanding = {nonce for nonce in self.outstanding if nonce >= mined}
+            if not self.outstanding:
+                return False
+            logger.warning(f"⚠️ Nonce {min(self.outstanding)} not mined (account at {mined}); resyncing from chain")
+            self.sync()
+            return True
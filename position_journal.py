@@ -0,0 +1,190 @@
+"""Held positions and trade levels kept as an append-only JSONL journal (replaces held_tokens.json / token_prices.txt)."""
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # No advisory locks on Windows; distinct journal paths per bot still apply
+    fcntl = None
+
+SYNC_INTERVAL = 1.0  # Seconds between fsyncs; commits in between only reach the OS until the flush timer fires
+COMPACT_AFTER = 1000  # Events appended before the journal is rewritten as one open event per position
+
+
+class JournalLockedError(RuntimeError):
+    """Another process already has this journal open."""
+
+
+class PositionJournal:
+    """Replays open/update/close/levels events from `path` and appends new ones.
+
+    record() diffs the bot's {token: position} dict against the journal and appends only what
+    changed, so callers keep mutating their dicts as before and call record() + commit() where
+    they used to rewrite the whole JSON file. A torn final line from a crash is dropped on load.
+    A commit that skips the fsync arms a timer, so the batch reaches disk within sync_interval
+    even if no further commit follows. Each bot needs its own path: the journal holds an
+    exclusive lock on `<path>.lock` while open, because compact() swaps the file and another
+    writer would keep appending to the replaced one.
+    """
+
+    def __init__(self, path, sync_interval=SYNC_INTERVAL, compact_after=COMPACT_AFTER):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_after = compact_after
+        self.positions = {}
+        self.levels = None
+        self.pending = []
+        self.events_since_compact = 0
+        self.unsynced = False
+        self.last_sync = 0.0
+        self.timer = None
+        self.lock = threading.RLock()  # commit() and the flush timer run on different threads
+        self.lock_file = self._acquire_lock()
+
+        torn = self._load() if os.path.exists(path) else False
+        self.file = open(path, "a")
+        if torn:
+            self.compact()
+
+    def open_positions(self):
+        """Deep copy of {token: position} for the caller to mutate."""
+        return json.loads(json.dumps(self.positions))
+
+    # **EVENTS**
+    def record(self, positions):
+        """Append open/update/close events turning the journal's positions into `positions`."""
+        for token, position in positions.items():
+            if token not in self.positions:
+                self._event({"op": "open", "token": token, "position": position})
+            elif self.positions[token] != position:
+                self._event({"op": "update", "token": token, "position": position})
+        for token in [token for token in self.positions if token not in positions]:
+            self._event({"op": "close", "token": token})
+
+    def record_levels(self, start_price, profit_price):
+        levels = [start_price, profit_price]
+        if levels != self.levels:
+            self._event({"op": "levels", "start_price": start_price, "profit_price": profit_price})
+
+    def _event(self, event):
+        event["ts"] = time.time()
+        self._apply(event)
+        self.pending.append(json.dumps(event) + "\n")
+
+    def _apply(self, event):
+        op = event["op"]
+        if op in ("open", "update"):
+            # Copy so later in-place edits by the caller show up as a diff
+            self.positions[event["token"]] = json.loads(json.dumps(event["position"]))
+        elif op == "close":
+            self.positions.pop(event["token"], None)
+        elif op == "levels":
+            self.levels = [event["start_price"], event["profit_price"]]
+
+    # **PERSISTENCE**
+    def commit(self, force_sync=False):
+        """Write pending events; fsync at most once per sync_interval unless `force_sync`."""
+        with self.lock:
+            if self.pending:
+                self.file.write("".join(self.pending))
+                self.file.flush()
+                self.events_since_compact += len(self.pending)
+                self.pending = []
+                self.unsynced = True
+            if self.unsynced:
+                elapsed = time.time() - self.last_sync
+                if force_sync or elapsed >= self.sync_interval:
+                    self._fsync()
+                elif self.timer is None:
+                    self.timer = threading.Timer(self.sync_interval - elapsed, self.sync)
+                    self.timer.daemon = True
+                    self.timer.start()
+            if self.events_since_compact >= self.compact_after:
+                self.compact()
+
+    def sync(self):
+        """fsync events committed since the last sync (the flush timer's target)."""
+        with self.lock:
+            self.timer = None
+            if self.unsynced:
+                self._fsync()
+
+    def _fsync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = False
+        self.last_sync = time.time()
+
+    def compact(self):
+        """Rewrite the journal as the current state only (temp file + fsync + atomic rename)."""
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            now = time.time()
+            with open(tmp_path, "w") as f:
+                for token, position in self.positions.items():
+                    f.write(json.dumps({"op": "open", "token": token, "position": position, "ts": now}) + "\n")
+                if self.levels is not None:
+                    f.write(json.dumps({"op": "levels", "start_price": self.levels[0],
+                                        "profit_price": self.levels[1], "ts": now}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, "a")
+            self.events_since_compact = 0
+            self.unsynced = False
+            self.last_sync = now
+
+    def close(self):
+        """Commit and fsync pending events, then release the journal."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.commit(force_sync=True)
+            self.file.close()
+            self.lock_file.close()
+
+    def _acquire_lock(self):
+        lock_file = open(self.path + ".lock", "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                raise JournalLockedError(f"{self.path} is in use by another process")
+        return lock_file
+
+    def _load(self):
+        """Replay the journal; returns True if a torn final line had to be dropped."""
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    return True
+                self._apply(event)
+                self.events_since_compact += 1
+                if not line.endswith("\n"):
+                    return True  # Complete but unterminated; rewrite so appends start on a new line
+        return False
+
+    # **MIGRATION**
+    def import_legacy(self, held_tokens_file=None, token_prices_file=None):
+        """Seed an empty journal from held_tokens.json / token_prices.txt (first start only)."""
+        if self.positions or self.levels is not None or os.path.getsize(self.path) > 0:
+            return
+        if held_tokens_file and os.path.exists(held_tokens_file):
+            with open(held_tokens_file, "r") as f:
+                data = json.load(f)
+            prices = data.get("held_token_prices", {})
+            self.record({token: prices.get(token) for token in data.get("held_tokens", [])})
+        if token_prices_file and os.path.exists(token_prices_file):
+            with open(token_prices_file, "r") as f:
+                data = f.read().strip()
+            if data:
+                self.record_levels(*map(float, data.split(",")))
+        if self.pending:
+            self.pending = []
+            self.compact()
@@ -0,0 +1,119 @@
+"""USD price propagation over the pool graph (one BFS from the base tokens, NumPy edge arrays)."""
+from collections import namedtuple
+
+import numpy as np
+
+# token_ids[i] is the lower-case id of token i; edge k prices dst[k] as price(src[k]) * rates[k]
+PriceGraph = namedtuple("PriceGraph", ["token_ids", "token_index", "src", "dst", "rates", "liquidity"])
+
+
+def build_price_graph(pairs):
+    """Build the token index and directed edge arrays for `pairs` (parsed once per snapshot).
+
+    Each pair follows the subgraph convention used by the bot:
+    price(token1) = price(token0) * token0Price and price(token0) = price(token1) * token1Price.
+    """
+    token_index = {}
+    src = []
+    dst = []
+    rates = []
+    liquidity = []
+
+    for pair in pairs:
+        token0_id = pair["token0"]["id"].lower()
+        token1_id = pair["token1"]["id"].lower()
+        i0 = token_index.setdefault(token0_id, len(token_index))
+        i1 = token_index.setdefault(token1_id, len(token_index))
+        pair_liquidity = float(pair.get("liquidity") or 0)
+
+        src.extend((i0, i1))
+        dst.extend((i1, i0))
+        rates.extend((float(pair["token0Price"] or 0), float(pair["token1Price"] or 0)))
+        liquidity.extend((pair_liquidity, pair_liquidity))
+
+    return PriceGraph(
+        token_ids=list(token_index),
+        token_index=token_index,
+        src=np.asarray(src, dtype=np.int64),
+        dst=np.asarray(dst, dtype=np.int64),
+        rates=np.asarray(rates, dtype=np.float64),
+        liquidity=np.asarray(liquidity, dtype=np.float64),
+    )
+
+
+def pool_spot_price(x, y, stable):
+    """Marginal token0 per token1 of a pool holding x token0 and y token1 (human units, both > 0).
+
+    Volatile pools trade on x*y = k; stable pools on x^3*y + y^3*x = k, whose marginal rate
+    token1 per token0 is (3x^2*y + y^3) / (x^3 + 3x*y^2).
+    """
+    if stable:
+        return (x ** 3 + 3 * x * y ** 2) / (3 * x ** 2 * y + y ** 3)
+    return x / y
+
+
+def propagate_usd_price_array(graph, base_prices, rates=None):
+    """Return a float array of USD prices per token (NaN where unreachable).
+
+    Level-synchronous BFS from the base tokens: every unpriced token next to the priced
+    frontier takes its price through the deepest pool reaching it. Already-priced tokens,
+    including the base tokens, are never overwritten, so results do not depend on pair order.
+    """
+    return propagate_usd_price_tree(graph, base_prices, rates)[0]
+
+
+def propagate_usd_price_tree(graph, base_prices, rates=None):
+    """propagate_usd_price_array() plus, per token, the edge it was priced through (-1 if none)."""
+    rates = graph.rates if rates is None else rates
+    prices = np.full(len(graph.token_ids), np.nan)
+    parent = np.full(len(graph.token_ids), -1, dtype=np.int64)
+    for token_id, price in base_prices.items():
+        index = graph.token_index.get(token_id.lower())
+        if index is not None:
+            prices[index] = price
+
+    # Drop dead edges and sort the rest by liquidity (desc), edge order breaking ties
+    usable = np.isfinite(rates) & (rates > 0)
+    edge_ids = np.nonzero(usable)[0]
+    order = edge_ids[np.lexsort((edge_ids, -graph.liquidity[edge_ids]))]
+    src = graph.src[order]
+    dst = graph.dst[order]
+    edge_rates = rates[order]
+
+    while True:
+        priced = ~np.isnan(prices)
+        frontier = np.nonzero(priced[src] & ~priced[dst])[0]
+        if frontier.size == 0:
+            return prices, parent
+        # Edges are liquidity-sorted, so the first frontier edge per token is its deepest pool
+        _, first = np.unique(dst[frontier], return_index=True)
+        chosen = frontier[first]
+        prices[dst[chosen]] = prices[src[chosen]] * edge_rates[chosen]
+        parent[dst[chosen]] = order[chosen]
+
+
+def price_path(graph, parent, index):
+    """Edges from a base token down to token `index` along `parent` (empty for base tokens)."""
+    path = []
+    while parent[index] >= 0:
+        path.append(int(parent[index]))
+        index = graph.src[parent[index]]
+    path.reverse()
+    return path
+
+
+def path_price(graph, base_prices, rates, index, path):
+    """USD price of token `index` re-derived along `path` with `rates`; NaN if a pool went dead."""
+    root = graph.token_ids[graph.src[path[0]]] if path else graph.token_ids[index]
+    price = base_prices.get(root, np.nan)
+    for edge in path:
+        if not (np.isfinite(rates[edge]) and rates[edge] > 0):
+            return np.nan
+        price *= rates[edge]
+    return float(price)
+
+
+def propagate_usd_prices(graph, base_prices, rates=None):
+    """Return {lower-case token id: USD price} for every token reachable from `base_prices`."""
+    prices = propagate_usd_price_array(graph, base_prices, rates)
+    return {graph.token_ids[i]: float(prices[i]) for i in np.nonzero(~np.isnan(prices))[0]}
@@ -0,0 +1,252 @@
+"""Fixed-capacity NumPy ring buffers of per-token prices, persisted as an append-only tick log plus snapshots."""
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+# Tick log record: op (b"A" append / b"T" truncate), sequence number, timestamp, value (price or rows kept),
+# token length, token. Logs start with LOG_MAGIC; logs without it hold LEGACY_RECORD_HEADER records.
+RECORD_HEADER = struct.Struct("<cQddH")
+LEGACY_RECORD_HEADER = struct.Struct("<cddH")
+LOG_MAGIC = b"PHTICKS2"
+SNAPSHOT_INTERVAL = 3600  # Seconds between compacting snapshots of the whole store
+
+
+class PriceHistory:
+    """Per-token price/timestamp ring buffers stored as rows of one 2-D array.
+
+    Every append/truncate is buffered as a small binary record and written to `<path>.ticks`
+    by flush(); every SNAPSHOT_INTERVAL seconds the whole store is written to `<path>.npz` and
+    the tick log starts over, so restarts replay at most one interval of ticks. Records are
+    numbered and the snapshot keeps the last number it contains, so a log that outlived its
+    snapshot (crash between the two writes) is not applied twice.
+    With path=None the store is in-memory only (used for replays).
+    """
+
+    def __init__(self, path, capacity, snapshot_interval=SNAPSHOT_INTERVAL, legacy_json=None):
+        self.path = path
+        self.capacity = capacity
+        self.snapshot_interval = snapshot_interval
+        self.token_index = {}
+        self.token_ids = []
+        self.prices = np.full((0, capacity), np.nan)
+        self.timestamps = np.full((0, capacity), np.nan)
+        self.heads = np.zeros(0, dtype=np.int64)   # Next slot to write per row
+        self.counts = np.zeros(0, dtype=np.int64)  # Filled slots per row
+        self.pending = []
+        self.seq = 0  # Sequence number of the last recorded tick
+        self.last_snapshot = time.time()
+
+        if self.path is None:
+            self.log = None
+            return
+        imported = self._load(legacy_json)
+        self.log = open(self.path + ".ticks", "ab")
+        if self.log.tell() == 0:
+            self.log.write(LOG_MAGIC)
+        elif not self._log_has_magic():
+            self.snapshot()  # Fold the legacy-format log into a snapshot before appending new records
+        if imported:
+            self.snapshot()  # Persist the imported JSON so it is never read again
+
+    # **ROWS**
+    def row(self, token, create=False):
+        """Return the row of `token` (adding one if `create`), or None."""
+        row = self.token_index.get(token)
+        if row is None and create:
+            row = len(self.token_ids)
+            if row == len(self.heads):
+                self._grow(max(16, 2 * row))
+            self.token_index[token] = row
+            self.token_ids.append(token)
+        return row
+
+    def _grow(self, rows):
+        extra = rows - len(self.heads)
+        self.prices = np.vstack([self.prices, np.full((extra, self.capacity), np.nan)])
+        self.timestamps = np.vstack([self.timestamps, np.full((extra, self.capacity), np.nan)])
+        self.heads = np.concatenate([self.heads, np.zeros(extra, dtype=np.int64)])
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+
+    # **API**
+    def append(self, token, price, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        self._append(token, price, timestamp)
+        self._record(b"A", token, timestamp, price)
+
+    def append_many(self, tokens, prices, timestamp=None):
+        """Append one price per (unique) token at the same timestamp with vectorized writes; returns their rows."""
+        timestamp = time.time() if timestamp is None else timestamp
+        rows = np.fromiter((self.row(token, create=True) for token in tokens), dtype=np.int64, count=len(tokens))
+        prices = np.asarray(prices, dtype=np.float64)
+        slots = self.heads[rows]
+        self.prices[rows, slots] = prices
+        self.timestamps[rows, slots] = timestamp
+        self.heads[rows] = (slots + 1) % self.capacity
+        self.counts[rows] = np.minimum(self.counts[rows] + 1, self.capacity)
+        if self.log is not None:
+            for token, price in zip(tokens, prices.tolist()):
+                self._record(b"A", token, timestamp, price)
+        return rows
+
+    def truncate(self, token, keep):
+        """Keep only the last `keep` prices of `token`."""
+        self._truncate(token, keep)
+        self._record(b"T", token, time.time(), keep)
+
+    def count(self, token):
+        row = self.token_index.get(token)
+        return 0 if row is None else int(self.counts[row])
+
+    def __contains__(self, token):
+        return self.count(token) > 0
+
+    def price_at(self, token, k):
+        """The k-th most recent price (k=1 is the latest), like prices[-k] on a list."""
+        row = self.token_index[token]
+        if not 1 <= k <= self.counts[row]:
+            raise IndexError(f"{token} has {self.counts[row]} prices, asked for #{k} from the end")
+        return float(self.prices[row, (self.heads[row] - k) % self.capacity])
+
+    def latest(self, token):
+        return self.price_at(token, 1)
+
+    def window(self, token, n=None, with_timestamps=False):
+        """The last `n` (default: all) prices of `token` in chronological order."""
+        row = self.token_index.get(token)
+        if row is None:
+            empty = np.empty(0)
+            return (empty, empty) if with_timestamps else empty
+        count = int(self.counts[row]) if n is None else min(n, int(self.counts[row]))
+        slots = (self.heads[row] - count + np.arange(count)) % self.capacity
+        if with_timestamps:
+            return self.prices[row, slots], self.timestamps[row, slots]
+        return self.prices[row, slots]
+
+    # **PERSISTENCE**
+    def flush(self):
+        """Append buffered ticks to the log; write a snapshot and reset the log when one is due."""
+        if self.log is None:
+            return
+        if self.pending:
+            self.log.write(b"".join(self.pending))
+            self.log.flush()
+            self.pending = []
+        if time.time() - self.last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self):
+        """Write the whole store to `<path>.npz` atomically and start a fresh tick log."""
+        rows = len(self.token_ids)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            capacity=self.capacity,
+            token_ids=np.array(json.dumps(self.token_ids)),
+            prices=self.prices[:rows],
+            timestamps=self.timestamps[:rows],
+            heads=self.heads[:rows],
+            counts=self.counts[:rows],
+            seq=self.seq,
+        )
+        os.replace(tmp_path, self.path + ".npz")
+        self.log.close()
+        self.log = open(self.path + ".ticks", "wb")
+        self.log.write(LOG_MAGIC)
+        self.log.flush()
+        self.last_snapshot = time.time()
+
+    def close(self):
+        self.flush()
+        if self.log is not None:
+            self.log.close()
+
+    def _record(self, op, token, timestamp, value):
+        if self.log is None:
+            return
+        self.seq += 1
+        token_bytes = token.encode("utf-8")
+        self.pending.append(RECORD_HEADER.pack(op, self.seq, timestamp, value, len(token_bytes)) + token_bytes)
+
+    def _append(self, token, price, timestamp):
+        row = self.row(token, create=True)
+        slot = self.heads[row]
+        self.prices[row, slot] = price
+        self.timestamps[row, slot] = timestamp
+        self.heads[row] = (slot + 1) % self.capacity
+        self.counts[row] = min(self.counts[row] + 1, self.capacity)
+
+    def _truncate(self, token, keep):
+        row = self.token_index.get(token)
+        if row is not None:
+            self.counts[row] = min(self.counts[row], max(0, int(keep)))
+
+    def _load(self, legacy_json):
+        snapshot_path = self.path + ".npz"
+        log_path = self.path + ".ticks"
+        if os.path.exists(snapshot_path):
+            with np.load(snapshot_path) as data:
+                self.token_ids = json.loads(str(data["token_ids"]))
+                self.token_index = {token: row for row, token in enumerate(self.token_ids)}
+                self._grow(len(self.token_ids))
+                rows = len(self.token_ids)
+                self.seq = int(data["seq"]) if "seq" in data else 0
+                stored_capacity = int(data["capacity"])
+                if stored_capacity == self.capacity:
+                    self.prices[:rows] = data["prices"]
+                    self.timestamps[:rows] = data["timestamps"]
+                    self.heads[:rows] = data["heads"]
+                    self.counts[:rows] = data["counts"]
+                else:
+                    # Capacity changed: re-append each row's history in order
+                    prices, timestamps = data["prices"], data["timestamps"]
+                    for row, token in enumerate(self.token_ids):
+                        count = int(data["counts"][row])
+                        slots = (int(data["heads"][row]) - count + np.arange(count)) % stored_capacity
+                        for slot in slots:
+                            self._append(token, float(prices[row, slot]), float(timestamps[row, slot]))
+        elif legacy_json and os.path.exists(legacy_json) and not os.path.exists(log_path):
+            # One-time import of the old {token: {"prices": [...]}} JSON file
+            with open(legacy_json, "r") as f:
+                for token, entry in json.load(f).items():
+                    for price in entry.get("prices", [])[-self.capacity:]:
+                        self._append(token, price, float("nan"))
+            return True
+
+        if os.path.exists(log_path):
+            self._replay(log_path)
+        return False
+
+    def _log_has_magic(self):
+        with open(self.path + ".ticks", "rb") as f:
+            return f.read(len(LOG_MAGIC)) == LOG_MAGIC
+
+    def _replay(self, log_path):
+        """Apply the log records newer than the snapshot (all of them for a legacy log)."""
+        with open(log_path, "rb") as f:
+            data = f.read()
+        legacy = not data.startswith(LOG_MAGIC)
+        header = LEGACY_RECORD_HEADER if legacy else RECORD_HEADER
+        applied = self.seq
+        offset = 0 if legacy else len(LOG_MAGIC)
+        while offset + header.size <= len(data):
+            if legacy:
+                op, timestamp, value, token_length = header.unpack_from(data, offset)
+                seq = applied + 1
+            else:
+                op, seq, timestamp, value, token_length = header.unpack_from(data, offset)
+            end = offset + header.size + token_length
+            if end > len(data):
+                break  # Torn final record from a crash; drop it
+            offset = end
+            if seq <= applied:
+                continue  # Already in the snapshot (crash before the log was reset)
+            applied = seq
+            token = data[end - token_length:end].decode("utf-8")
+            if op == b"A":
+                self._append(token, value, timestamp)
+            elif op == b"T":
+                self._truncate(token, value)
+        self.seq = applied
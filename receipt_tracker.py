@@ -0,0 +1,106 @@
+"""Background receipt polling: every pending transaction is checked in one batched request per block."""
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 2.0  # Seconds between block checks (one Base block)
+RECEIPT_TIMEOUT = 300  # Seconds before a transaction that never lands is given up on
+
+
+class ReceiptTracker:
+    """Resolves transaction hashes to receipts without blocking the sender.
+
+    track() returns a concurrent.futures.Future and optionally registers a callback; a daemon
+    thread waits for each new block and fetches the receipts of everything still pending with
+    one fetch_receipts(hashes) call (a JSON-RPC batch), so in-flight transactions confirm
+    together. Callbacks run on the tracker thread; exceptions in them are logged, not raised.
+    A transaction still unmined after `timeout` seconds calls its callbacks with None (so
+    callers can undo what they booked) and fails its future with TimeoutError.
+    """
+
+    def __init__(self, fetch_receipts, block_number, poll_interval=POLL_INTERVAL, timeout=RECEIPT_TIMEOUT):
+        self.fetch_receipts = fetch_receipts  # fetch_receipts([tx_hash, ...]) -> [receipt or None, ...]
+        self.block_number = block_number
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {}  # tx_hash -> (future, [callbacks], submitted at)
+        self.last_block = None
+        self.thread = None
+        self.stopped = False
+
+    def __len__(self):
+        return len(self.pending)
+
+    def track(self, tx_hash, callback=None):
+        """Future for the receipt of `tx_hash` (hex string or bytes); callback(receipt) runs when it lands.
+
+        On timeout the callback runs with None instead.
+        """
+        if not isinstance(tx_hash, str):
+            tx_hash = "0x" + bytes(tx_hash).hex()
+        with self.lock:
+            if tx_hash not in self.pending:
+                self.pending[tx_hash] = (Future(), [], time.time())
+            future, callbacks, _ = self.pending[tx_hash]
+            if callback is not None:
+                callbacks.append(callback)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="receipt-tracker", daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+        return future
+
+    def wait(self, tx_hash, timeout=None):
+        """Block until the receipt of `tx_hash` arrives (for callers that really need it)."""
+        return self.track(tx_hash).result(timeout)
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+
+    def _run(self):
+        while not self.stopped:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            if not self.pending:
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"⚠️ Receipt polling failed: {e}")
+
+    def poll(self):
+        """Fetch receipts for all pending hashes if a new block arrived; resolve what landed."""
+        block = self.block_number()
+        if block == self.last_block:
+            return
+        self.last_block = block
+        with self.lock:
+            hashes = list(self.pending)
+        receipts = self.fetch_receipts(hashes)
+        now = time.time()
+        for tx_hash, receipt in zip(hashes, receipts):
+            if receipt is None:
+                if now - self.pending[tx_hash][2] > self.timeout:
+                    with self.lock:
+                        future, callbacks, _ = self.pending.pop(tx_hash)
+                    logger.error(f"⚠️ Transaction {tx_hash} not mined after {self.timeout}s")
+                    self._notify(tx_hash, callbacks, None)
+                    future.set_exception(TimeoutError(f"Transaction {tx_hash} not mined after {self.timeout}s"))
+                continue
+            with self.lock:
+                future, callbacks, _ = self.pending.pop(tx_hash)
+            self._notify(tx_hash, callbacks, receipt)
+            future.set_result(receipt)
+
+    def _notify(self, tx_hash, callbacks, receipt):
+        for callback in callbacks:
+            try:
+                callback(receipt)
+            except Exception as e:
+                logger.error(f"⚠️ Receipt callback for {tx_hash} failed: {e}")
@@ -0,0 +1,52 @@
+"""Incremental rolling minimum (monotonic deque) for multi-window momentum in amortized O(1) per tick."""
+from collections import deque
+
+
+class RollingMin:
+    """Minimum of the values pushed between `lag` and `window - 1` ticks ago (lag 0 is the newest).
+
+    "Max rise over any lookback from lag to window - 1" is then (price - min) / min, so one
+    deque replaces scanning every lookback. Values younger than `lag` wait in a delay buffer
+    and only enter the deque once they are old enough.
+    """
+
+    def __init__(self, window, lag=0):
+        if not 0 <= lag < window:
+            raise ValueError(f"lag must be in [0, window), got lag={lag}, window={window}")
+        self.window = window
+        self.lag = lag
+        self.tick = -1
+        self.delayed = deque()
+        self.candidates = deque()  # (tick, value) with increasing values; front is the minimum
+
+    def push(self, value):
+        """Add the newest value and return the current minimum (None until one is old enough)."""
+        self.tick += 1
+        self.delayed.append((self.tick, value))
+        if len(self.delayed) > self.lag:
+            tick, eligible = self.delayed.popleft()
+            while self.candidates and self.candidates[-1][1] >= eligible:
+                self.candidates.pop()
+            self.candidates.append((tick, eligible))
+        while self.candidates and self.candidates[0][0] <= self.tick - self.window:
+            self.candidates.popleft()
+        return self.min()
+
+    def min(self):
+        return self.candidates[0][1] if self.candidates else None
+
+    def reset(self, values=()):
+        """Forget everything and replay `values` (oldest first), e.g. after the history was cut."""
+        self.tick = -1
+        self.delayed.clear()
+        self.candidates.clear()
+        for value in values:
+            self.push(value)
+        return self.min()
+
+
+def rise_from_min(price, minimum):
+    """Relative rise of `price` above `minimum`, 0.0 when there is no minimum yet."""
+    if not minimum:
+        return 0.0
+    return (price - minimum) / minimum
@@ -0,0 +1,142 @@
+"""Pooled keep-alive JSON-RPC client: identical in-flight calls are coalesced, the rest go out as batches."""
+import asyncio
+import itertools
+import json
+import threading
+
+import aiohttp
+
+BATCH_WINDOW = 0.002  # Seconds a call waits for others to share its HTTP request
+MAX_BATCH = 100       # Calls per JSON-RPC batch (provider limit)
+MAX_CONNECTIONS = 8   # Keep-alive connections to the RPC endpoint
+TIMEOUT = 30          # Seconds per HTTP request
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class AsyncRpcClient:
+    """JSON-RPC over one aiohttp session.
+
+    call() parks the request for batch_window seconds (or until max_batch are waiting) and
+    sends everything parked as a single JSON-RPC batch. A call whose method and params match
+    one already in flight awaits that request's result instead of sending its own.
+    """
+
+    def __init__(self, url, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH,
+                 max_connections=MAX_CONNECTIONS, timeout=TIMEOUT):
+        self.url = url
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.session = None
+        self.ids = itertools.count(1)
+        self.inflight = {}  # (method, params json) -> future shared by every caller
+        self.queue = []     # [(key, method, params, future)] waiting for the next batch
+        self.flush_handle = None
+
+    async def _session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def call(self, method, params=()):
+        params = list(params)
+        key = (method, json.dumps(params, sort_keys=True, default=str))
+        future = self.inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self.inflight[key] = future
+            self.queue.append((key, method, params, future))
+            if len(self.queue) >= self.max_batch:
+                self._flush()
+            elif self.flush_handle is None:
+                self.flush_handle = loop.call_later(self.batch_window, self._flush)
+        # Shielded so one caller giving up does not cancel the request for the others
+        return await asyncio.shield(future)
+
+    async def batch(self, calls):
+        """Results of [(method, params), ...] in order; all of them share one round trip."""
+        return await asyncio.gather(*(self.call(method, params) for method, params in calls))
+
+    def _flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.queue = self.queue, []
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch):
+        payload = [{"jsonrpc": "2.0", "id": next(self.ids), "method": method, "params": params}
+                   for _, method, params, _ in batch]
+        try:
+            session = await self._session()
+            async with session.post(self.url, json=payload if len(payload) > 1 else payload[0]) as response:
+                response.raise_for_status()
+                replies = await response.json(content_type=None)
+            if isinstance(replies, dict):
+                replies = [replies]
+            by_id = {reply.get("id"): reply for reply in replies}
+            for request, (_, _, _, future) in zip(payload, batch):
+                reply = by_id.get(request["id"])
+                if future.done():
+                    continue
+                if reply is None:
+                    future.set_exception(RpcError(None, f"no reply to {request['method']}"))
+                elif reply.get("error"):
+                    future.set_exception(RpcError(reply["error"].get("code"), reply["error"].get("message")))
+                else:
+                    future.set_result(reply.get("result"))
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for key, _, _, future in batch:
+                if self.inflight.get(key) is future:
+                    del self.inflight[key]
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class RpcClient:
+    """Blocking facade for threaded callers; the async client runs on its own event loop thread.
+
+    Calls made from different threads at the same moment still coalesce and batch together.
+    """
+
+    def __init__(self, url, **kwargs):
+        self.timeout = kwargs.get("timeout", TIMEOUT)
+        self.client = AsyncRpcClient(url, **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="rpc-client", daemon=True)
+        self.thread.start()
+
+    def call(self, method, *params):
+        return self._run(self.client.call(method, params))
+
+    def batch(self, calls):
+        return self._run(self.client.batch(calls))
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(self.timeout)
+
+    def close(self):
+        self._run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def to_int(value):
+    """Decode a hex quantity ("0x..." or empty "0x") from an RPC result."""
+    return int(value, 16) if value and value != "0x" else 0
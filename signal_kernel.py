@@ -0,0 +1,49 @@
+"""Batch momentum and exit signals for every token at once, computed on the PriceHistory matrix."""
+from collections import namedtuple
+
+import numpy as np
+
+STOP_LOSS = -0.03  # Sell if price drops 3% from buy price
+TAKE_PROFIT = 0.07  # Start trailing once price is 7% above buy price
+TRAILING_STOP = 0.02  # ...and sell when it drops 2% from the highest price since
+
+# Index arrays point into the `rows`/`prices` arrays passed to momentum_signals()
+Signals = namedtuple("Signals", ["buy", "stop_loss", "take_profit", "price_change", "highest_prices"])
+
+
+def momentum_signals(history, rows, prices, lag, threshold, held_index, buy_prices, highest_prices,
+                     stop_loss=STOP_LOSS, take_profit=TAKE_PROFIT, trailing_stop=TRAILING_STOP):
+    """Return the tokens that need action this tick.
+
+    `rows`/`prices` are the history rows and latest prices of every token (already appended);
+    `held_index`, `buy_prices` and `highest_prices` describe the held positions, `held_index`
+    pointing into `rows`. price_change is measured against the price `lag` ticks back, like
+    prices[-lag] on a list; tokens with fewer than `lag` prices never buy. highest_prices comes
+    back raised to the current price for positions in the take-profit zone.
+    """
+    price_change = np.full(len(rows), np.nan)
+    enough = history.counts[rows] >= lag
+    ref_rows = rows[enough]
+    reference = history.prices[ref_rows, (history.heads[ref_rows] - lag) % history.capacity]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_change[enough] = (prices[enough] - reference) / reference
+
+    candidates = price_change > threshold
+    candidates[held_index] = False
+
+    current = prices[held_index]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gain = (current - buy_prices) / buy_prices
+    stopped = gain <= stop_loss
+    in_profit = ~stopped & (gain >= take_profit)
+    highest_prices = np.where(in_profit, np.maximum(highest_prices, current), highest_prices)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trailed = in_profit & ((highest_prices - current) / highest_prices >= trailing_stop)
+
+    return Signals(
+        buy=np.flatnonzero(candidates),
+        stop_loss=held_index[stopped],
+        take_profit=held_index[trailed],
+        price_change=price_change,
+        highest_prices=highest_prices,
+    )
@@ -0,0 +1,93 @@
+"""Aerodrome pool pagination over the subgraph: id shards walked with `id_gt` cursors, pages merged under aliases."""
+
+PAGE_SIZE = 1000
+START_CURSOR = "0x0000000000000000000000000000000000000000"
+SHARDS = 16  # Disjoint pool id ranges fetched in parallel
+SHARD_PREFIX_DIGITS = 2  # Hex digits used to cut the id space into shards
+SHARDS_PER_REQUEST = 4  # Shard pages merged into one request under GraphQL aliases
+
+# Union of the fields the three old pool fetchers asked for
+POOL_QUERY_FIELDS = """
+        id
+        token0 { id symbol decimals derivedETH }
+        token1 { id symbol decimals derivedETH }
+        liquidity
+        token0Price
+        token1Price
+"""
+
+
+def pool_page(where, lower_id, upper_id, last_id, page_size=PAGE_SIZE, block=None):
+    """The `pools` field for the page after `last_id` in one [lower_id, upper_id) slice of the pool id space."""
+    bounds = f'id_gte: "{lower_id}"'
+    if upper_id:
+        bounds += f', id_lt: "{upper_id}"'
+    # Pin every page to the same block so shards and pages are mutually consistent
+    block_arg = f"block: {{ number: {block} }}, " if block is not None else ""
+    return """pools(%sfirst: %d, orderBy: id, orderDirection: asc, where: { id_gt: "%s", %s, %s }) {%s}""" % (
+        block_arg, page_size, last_id, bounds, where, POOL_QUERY_FIELDS)
+
+
+def shard_bounds(shards=SHARDS):
+    """Split the pool id space into `shards` contiguous ranges by leading hex digits."""
+    bounds = []
+    step = 16 ** SHARD_PREFIX_DIGITS // shards
+    for i in range(shards):
+        lower = "0x" + format(i * step, f"0{SHARD_PREFIX_DIGITS}x")
+        upper = "0x" + format((i + 1) * step, f"0{SHARD_PREFIX_DIGITS}x") if i < shards - 1 else None
+        bounds.append((lower, upper))
+    return bounds
+
+
+def fetch_pools(client, where="", page_size=PAGE_SIZE, block=None, shards=SHARDS,
+                shards_per_request=SHARDS_PER_REQUEST):
+    """Fetch every pool matching `where` through `client` (a GraphQLClient), all id shards at once.
+
+    Each round asks for the next page of every unfinished shard: `shards_per_request` shards
+    share a request under aliases, and the requests of a round run concurrently.
+    """
+    bounds = shard_bounds(shards)
+    shard_pools = [[] for _ in bounds]
+    cursors = {i: START_CURSOR for i in range(len(bounds))}
+
+    def fetch_pages(group):
+        return client.execute_many({
+            f"shard{i}": pool_page(where, *bounds[i], cursors[i], page_size, block) for i in group
+        })
+
+    while cursors:
+        active = sorted(cursors)
+        groups = [active[start:start + shards_per_request]
+                  for start in range(0, len(active), shards_per_request)]
+        for group, pages in zip(groups, client.map(fetch_pages, groups)):
+            for i in group:
+                page = pages[f"shard{i}"]
+                shard_pools[i].extend(page)
+                if len(page) < page_size:
+                    del cursors[i]
+                else:
+                    cursors[i] = page[-1]["id"]
+    # ✅ Shards are disjoint id ranges, so merging in shard order keeps ids sorted
+    return [pool for pools in shard_pools for pool in pools]
+
+
+def changed_since(block):
+    """`where` filter for pools created or touched at or after `block` (re-reading `block` itself is harmless)."""
+    return f"_change_block: {{ number_gte: {block} }}"
+
+
+def merge_changed_pools(pools, changed, min_liquidity):
+    """Apply `changed` pools to `pools` ({id: pool}); returns (kept pools, evicted ids).
+
+    `changed` carries no liquidity filter, so a pool that fell below `min_liquidity` shows up
+    here and is dropped from `pools` instead of lingering with stale reserves.
+    """
+    kept = []
+    evicted = []
+    for pool in changed:
+        if float(pool["liquidity"]) >= min_liquidity:
+            pools[pool["id"]] = pool
+            kept.append(pool)
+        elif pools.pop(pool["id"], None) is not None:
+            evicted.append(pool["id"])
+    return kept, evicted
@@ -0,0 +1,29 @@
+# pragma version 0.4.3
+"""Aerodrome router stand-in: pays 2 output tokens per input token of the route's first hop."""
+
+interface Token:
+    def transfer(to: address, amount: uint256) -> bool: nonpayable
+    def transferFrom(owner: address, to: address, amount: uint256) -> bool: nonpayable
+
+struct Route:
+    from_: address
+    to: address
+    stable: bool
+    factory: address
+
+
+@external
+def swapExactTokensForTokens(amountIn: uint256, amountOutMin: uint256, routes: DynArray[Route, 4],
+                             to: address, deadline: uint256) -> DynArray[uint256, 5]:
+    assert block.timestamp <= deadline, "expired"
+    amountOut: uint256 = amountIn * 2
+    assert amountOut >= amountOutMin, "INSUFFICIENT_OUTPUT_AMOUNT"
+    assert extcall Token(routes[0].from_).transferFrom(msg.sender, self, amountIn), "pull failed"
+    assert extcall Token(routes[len(routes) - 1].to).transfer(to, amountOut), "pay failed"
+    amounts: DynArray[uint256, 5] = [amountIn]
+    for i: uint256 in range(1, 5):
+        if i == len(routes):
+            amounts.append(amountOut)
+            break
+        amounts.append(0)
+    return amounts
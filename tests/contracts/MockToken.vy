@@ -0,0 +1,34 @@
+# pragma version 0.4.3
+"""Minimal ERC-20 for the BatchSwapExecutor tests; anyone can mint."""
+
+balanceOf: public(HashMap[address, uint256])
+allowance: public(HashMap[address, HashMap[address, uint256]])
+
+
+@external
+def mint(to: address, amount: uint256):
+    self.balanceOf[to] += amount
+
+
+@external
+def approve(spender: address, amount: uint256) -> bool:
+    self.allowance[msg.sender][spender] = amount
+    return True
+
+
+@external
+def transfer(to: address, amount: uint256) -> bool:
+    assert self.balanceOf[msg.sender] >= amount, "balance"
+    self.balanceOf[msg.sender] -= amount
+    self.balanceOf[to] += amount
+    return True
+
+
+@external
+def transferFrom(owner: address, to: address, amount: uint256) -> bool:
+    assert self.allowance[owner][msg.sender] >= amount, "allowance"
+    assert self.balanceOf[owner] >= amount, "balance"
+    self.allowance[owner][msg.sender] -= amount
+    self.balanceOf[owner] -= amount
+    self.balanceOf[to] += amount
+    return True
@@ -0,0 +1,133 @@
+from hexbytes import HexBytes
+from web3 import Web3
+
+from allowance_cache import APPROVAL_TOPIC, UNLIMITED, AllowanceCache
+
+OWNER = "0x" + "11" * 20
+TOKEN = "0x" + "22" * 20
+ROUTER = "0x" + "33" * 20
+
+
+class FakeToken:
+    """On-chain allowances of OWNER, plus the approvals the cache sent."""
+
+    def __init__(self, allowance=0):
+        self.allowance = allowance
+        self.reads = 0
+        self.sent = []
+
+    def read_allowances(self, pairs):
+        self.reads += 1
+        return [self.allowance for _ in pairs]
+
+    def approve(self, token, spender, amount):
+        self.sent.append(amount)
+        return f"0xapprove{len(self.sent)}"
+
+
+def topic(address):
+    return HexBytes(address[2:].rjust(64, "0"))
+
+
+def approval_receipt(value, status=1):
+    log = {"address": TOKEN, "topics": [HexBytes(APPROVAL_TOPIC), topic(OWNER), topic(ROUTER)],
+           "data": Web3.to_bytes(value).rjust(32, b"\0")}
+    return {"status": status, "logs": [log] if status else []}
+
+
+def swap_receipt(status=1):
+    return {"status": status, "logs": []}
+
+
+def make_cache(chain, approval_amount=0):
+    return AllowanceCache(OWNER, chain.read_allowances, chain.approve, approval_amount)
+
+
+def test_cached_allowance_covers_swaps_without_rereading():
+    chain = FakeToken(allowance=100)
+    cache = make_cache(chain)
+
+    assert cache.ensure(TOKEN, ROUTER, 60) is None
+    cache.spend(TOKEN, ROUTER, 60)
+    cache.swap_receipt(TOKEN, ROUTER, 60, swap_receipt())
+    assert cache.ensure(TOKEN, ROUTER, 40) is None
+    assert cache.get(TOKEN, ROUTER) == 40
+    assert chain.reads == 1 and chain.sent == []
+
+
+def test_approval_receipt_after_a_swap_keeps_the_spend():
+    chain = FakeToken(allowance=0)
+    cache = make_cache(chain)
+
+    tx_hash = cache.ensure(TOKEN, ROUTER, 50)
+    cache.spend(TOKEN, ROUTER, 50)  # Swap sent before the approval is mined
+    cache.approval_receipt(TOKEN, ROUTER, tx_hash, approval_receipt(50))
+
+    assert cache.get(TOKEN, ROUTER) == 0
+    cache.swap_receipt(TOKEN, ROUTER, 50, swap_receipt())
+    assert cache.ensure(TOKEN, ROUTER, 50) is not None  # The next buy approves again
+    assert chain.sent == [50, 50]
+
+
+def test_reverted_swap_drops_the_key_and_the_reread_skips_swaps_in_flight():
+    chain = FakeToken(allowance=0)
+    cache = make_cache(chain)
+    tx_hash = cache.ensure(TOKEN, ROUTER, 80)
+    cache.approval_receipt(TOKEN, ROUTER, tx_hash, approval_receipt(80))
+    cache.spend(TOKEN, ROUTER, 30)
+    cache.spend(TOKEN, ROUTER, 50)
+
+    cache.swap_receipt(TOKEN, ROUTER, 30, swap_receipt(status=0))
+    assert cache.get(TOKEN, ROUTER) is None
+    chain.allowance = 80  # Neither swap has pulled anything yet
+    cache.prefetch([(TOKEN, ROUTER)])
+    assert cache.get(TOKEN, ROUTER) == 30  # The 50 still in flight is not counted twice
+
+
+def test_swap_that_reverts_before_the_approval_receipt_is_not_charged():
+    chain = FakeToken(allowance=0)
+    cache = make_cache(chain)
+    tx_hash = cache.ensure(TOKEN, ROUTER, 100)
+    cache.spend(TOKEN, ROUTER, 40)
+    cache.spend(TOKEN, ROUTER, 25)
+    cache.swap_receipt(TOKEN, ROUTER, 40, swap_receipt(status=0))
+
+    cache.approval_receipt(TOKEN, ROUTER, tx_hash, approval_receipt(100))
+    assert cache.get(TOKEN, ROUTER) == 75
+
+
+def test_timed_out_swap_is_reread():
+    chain = FakeToken(allowance=100)
+    cache = make_cache(chain)
+    cache.prefetch([(TOKEN, ROUTER)])
+    cache.spend(TOKEN, ROUTER, 60)
+
+    cache.swap_receipt(TOKEN, ROUTER, 60, None)
+    assert cache.get(TOKEN, ROUTER) is None
+    cache.ensure(TOKEN, ROUTER, 10)
+    assert chain.reads == 2
+
+
+def test_failed_or_superseded_approval_receipts():
+    chain = FakeToken(allowance=0)
+    cache = make_cache(chain)
+    first = cache.ensure(TOKEN, ROUTER, 10)
+    cache.spend(TOKEN, ROUTER, 10)
+    second = cache.ensure(TOKEN, ROUTER, 20)
+
+    cache.approval_receipt(TOKEN, ROUTER, first, approval_receipt(10))
+    assert cache.get(TOKEN, ROUTER) == 20  # The newer approval's optimistic value stands
+    cache.approval_receipt(TOKEN, ROUTER, second, approval_receipt(0, status=0))
+    assert cache.get(TOKEN, ROUTER) is None
+
+
+def test_unlimited_approval_is_never_drawn_down():
+    chain = FakeToken(allowance=0)
+    cache = make_cache(chain, approval_amount=UNLIMITED)
+    tx_hash = cache.ensure(TOKEN, ROUTER, 10)
+    cache.spend(TOKEN, ROUTER, 10)
+    cache.approval_receipt(TOKEN, ROUTER, tx_hash, approval_receipt(UNLIMITED))
+    cache.spend(TOKEN, ROUTER, 10**30)
+
+    assert cache.get(TOKEN, ROUTER) == UNLIMITED
+    assert chain.sent == [UNLIMITED]
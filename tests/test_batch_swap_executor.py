@@ -0,0 +1,150 @@
+"""contracts/BatchSwapExecutor.vy on an in-process chain (eth-tester) against a mock Aerodrome router.
+
+Runs from the committed artifacts (contracts/*.json, tests/contracts/*.json), so no compiler is
+needed; when vyper is installed the artifacts are also checked against their sources.
+Needs `pip install pytest "eth-tester[py-evm]"`.
+"""
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("eth_tester")
+from eth_tester.exceptions import TransactionFailed
+from web3 import EthereumTesterProvider, Web3
+from web3.exceptions import ContractLogicError
+
+from batch_swap import BATCH_EXECUTOR_ABI, swap_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "contracts"))
+from compile import artifact_path, compile_contract  # noqa: E402
+
+FACTORY = "0x420DD381b31aEf6683db6B902084cB0FFECe40Da"
+SOURCES = {
+    "BatchSwapExecutor": os.path.join(ROOT, "contracts", "BatchSwapExecutor.vy"),
+    "MockToken": os.path.join(ROOT, "tests", "contracts", "MockToken.vy"),  # Minimal ERC-20
+    "MockRouter": os.path.join(ROOT, "tests", "contracts", "MockRouter.vy"),  # Pays 2 out per 1 in
+}
+
+
+def load_artifact(name):
+    with open(artifact_path(SOURCES[name])) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def compiled():
+    """{contract name: (abi, bytecode)} for the executor and the mocks."""
+    artifacts = {name: load_artifact(name) for name in SOURCES}
+    return {name: (artifact["abi"], artifact["bytecode"]) for name, artifact in artifacts.items()}
+
+
+@pytest.mark.parametrize("name", sorted(SOURCES))
+def test_artifact_matches_source(name):
+    pytest.importorskip("vyper")
+    assert compile_contract(SOURCES[name]) == load_artifact(name), "re-run contracts/compile.py"
+
+
+@pytest.fixture
+def chain(compiled):
+    """Fresh chain: executor owned by accounts[0], two input tokens approved to it, WETH held by the router."""
+    w3 = Web3(EthereumTesterProvider())
+    owner, other = w3.eth.accounts[:2]
+
+    def deploy(name, *args):
+        abi, bytecode = compiled[name]
+        tx_hash = w3.eth.contract(abi=abi, bytecode=bytecode).constructor(*args).transact({"from": owner})
+        return w3.eth.contract(address=w3.eth.wait_for_transaction_receipt(tx_hash)["contractAddress"], abi=abi)
+
+    router = deploy("MockRouter")
+    executor = deploy("BatchSwapExecutor", router.address)
+    token_a, token_b, weth = deploy("MockToken"), deploy("MockToken"), deploy("MockToken")
+    for token in (token_a, token_b):
+        token.functions.mint(owner, 1000).transact({"from": owner})
+        token.functions.approve(executor.address, 1000).transact({"from": owner})
+    weth.functions.mint(router.address, 10**6).transact({"from": owner})
+    return SimpleNamespace(w3=w3, owner=owner, other=other, router=router, executor=executor,
+                           batch=w3.eth.contract(address=executor.address, abi=BATCH_EXECUTOR_ABI),
+                           token_a=token_a, token_b=token_b, weth=weth)
+
+
+def swap(token, amount_in, amount_out_min, token_out):
+    return (token.address, amount_in, amount_out_min, [(token.address, token_out.address, False, FACTORY)])
+
+
+def batch_swap(chain, swaps, sender=None):
+    deadline = chain.w3.eth.get_block("latest")["timestamp"] + 300
+    tx_hash = chain.batch.functions.batchSwap(swaps, deadline).transact({"from": sender or chain.owner})
+    return chain.w3.eth.wait_for_transaction_receipt(tx_hash)
+
+
+def test_swap_fills_and_pays_the_owner(chain):
+    receipt = batch_swap(chain, [swap(chain.token_a, 100, 150, chain.weth)])
+
+    assert receipt["status"] == 1
+    assert chain.token_a.functions.balanceOf(chain.owner).call() == 900
+    assert chain.weth.functions.balanceOf(chain.owner).call() == 200
+    assert chain.weth.functions.balanceOf(chain.executor.address).call() == 0
+    results = swap_results(receipt, chain.executor.address)
+    assert list(results) == [0]
+    assert results[0].success and results[0].amount_out == 200 and results[0].reason == b""
+    assert results[0].token_in == chain.token_a.address.lower()
+
+
+def test_reverting_swap_is_refunded_and_next_swap_fills(chain):
+    receipt = batch_swap(chain, [
+        swap(chain.token_a, 100, 1000, chain.weth),  # Asks for more than the router pays: reverts
+        swap(chain.token_b, 50, 100, chain.weth),
+    ])
+
+    assert receipt["status"] == 1
+    assert chain.token_a.functions.balanceOf(chain.owner).call() == 1000
+    assert chain.token_a.functions.balanceOf(chain.executor.address).call() == 0
+    assert chain.token_a.functions.allowance(chain.executor.address, chain.router.address).call() == 0
+    assert chain.token_b.functions.balanceOf(chain.owner).call() == 950
+    assert chain.weth.functions.balanceOf(chain.owner).call() == 100
+    results = swap_results(receipt, chain.executor.address)
+    assert not results[0].success and results[0].amount_out == 0
+    assert b"INSUFFICIENT_OUTPUT_AMOUNT" in results[0].reason
+    assert results[1].success and results[1].amount_out == 100
+    assert results[1].token_in == chain.token_b.address.lower()
+
+
+def test_failed_pull_is_reported_without_reverting_the_batch(chain):
+    receipt = batch_swap(chain, [
+        swap(chain.token_a, 5000, 0, chain.weth),  # More than the wallet approved
+        swap(chain.token_b, 10, 20, chain.weth),
+    ])
+
+    results = swap_results(receipt, chain.executor.address)
+    assert not results[0].success and results[0].reason == b"transferFrom failed"
+    assert results[1].success and results[1].amount_out == 20
+    assert chain.token_a.functions.balanceOf(chain.owner).call() == 1000
+
+
+def test_swap_results_ignore_other_contracts(chain):
+    receipt = batch_swap(chain, [swap(chain.token_a, 100, 0, chain.weth)])
+
+    assert swap_results(receipt, chain.router.address) == {}
+
+
+def test_only_owner_can_swap_or_rescue(chain):
+    with pytest.raises((ContractLogicError, TransactionFailed), match="not owner"):
+        batch_swap(chain, [swap(chain.token_a, 100, 0, chain.weth)], sender=chain.other)
+    with pytest.raises((ContractLogicError, TransactionFailed), match="not owner"):
+        chain.executor.functions.rescue(chain.token_a.address).transact({"from": chain.other})
+    assert chain.token_a.functions.balanceOf(chain.owner).call() == 1000
+
+
+def test_token_without_code_is_not_treated_as_a_transfer(chain):
+    # A call to an address without code succeeds with no return data, like a token that returns nothing
+    no_code = SimpleNamespace(address=chain.other)
+    receipt = batch_swap(chain, [swap(no_code, 100, 0, chain.weth), swap(chain.token_a, 10, 20, chain.weth)])
+
+    results = swap_results(receipt, chain.executor.address)
+    assert not results[0].success and results[0].reason == b"transferFrom failed"
+    assert results[1].success and results[1].amount_out == 20
+    assert chain.weth.functions.balanceOf(chain.owner).call() == 20
@@ -0,0 +1,78 @@
+import pytest
+
+from fee_oracle import GAS_MARGIN, MIN_PRIORITY_FEE, FeeOracle
+
+KEY = ("0xrouter", "swap:2")
+
+
+class FakeChain:
+    """Per-block chain state as the bot's chain_state() returns it, counting reads."""
+
+    def __init__(self, **state):
+        self.state = {"block": 1, "base_fee": None, "priority_fee": None, "gas_price": None, **state}
+        self.reads = 0
+
+    def read_state(self):
+        self.reads += 1
+        return dict(self.state)
+
+
+def test_eip1559_fees_cover_twice_the_base_fee_plus_the_tip():
+    chain = FakeChain(base_fee=100, priority_fee=5 * MIN_PRIORITY_FEE)
+
+    assert FeeOracle(chain.read_state, 8453).fees() == {"maxFeePerGas": 200 + 5 * MIN_PRIORITY_FEE,
+                                                        "maxPriorityFeePerGas": 5 * MIN_PRIORITY_FEE}
+
+
+def test_tip_is_raised_to_the_minimum():
+    chain = FakeChain(base_fee=100, priority_fee=1)
+
+    assert FeeOracle(chain.read_state, 8453).fees()["maxPriorityFeePerGas"] == MIN_PRIORITY_FEE
+
+
+def test_fees_are_computed_once_per_block():
+    chain = FakeChain(base_fee=100, priority_fee=0)
+    oracle = FeeOracle(chain.read_state, 8453)
+    first = oracle.fees()
+    chain.state["base_fee"] = 300  # Same block: the cached fields stand
+    assert oracle.fees() == first
+
+    chain.state["block"] = 2
+    assert oracle.fees()["maxFeePerGas"] == 600 + MIN_PRIORITY_FEE
+
+
+def test_gas_price_without_a_base_fee():
+    chain = FakeChain(gas_price=7)
+
+    assert FeeOracle(chain.read_state, 8453).fees() == {"gasPrice": 7}
+
+
+def test_gas_limit_learns_with_margin_and_decays_slowly():
+    oracle = FeeOracle(FakeChain().read_state, 8453)
+    assert oracle.gas_limit(KEY, 500_000) == 500_000
+
+    oracle.learn(KEY, 200_000)
+    assert oracle.gas_limit(KEY, 500_000) == int(200_000 * GAS_MARGIN)
+    oracle.learn(KEY, 100_000)  # Pulled down by at most 10% per receipt
+    assert oracle.gas_used[KEY] == 180_000
+    oracle.learn(KEY, 250_000)  # Higher readings are taken as they are
+    assert oracle.gas_used[KEY] == 250_000
+
+
+def test_out_of_gas_doubles_the_failed_limit():
+    oracle = FeeOracle(FakeChain().read_state, 8453)
+    oracle.learn(KEY, 100_000)
+
+    oracle.learn_out_of_gas(KEY, 125_000)
+    assert oracle.gas_limit(KEY, 0) == pytest.approx(250_000, abs=2)
+    oracle.learn_out_of_gas(KEY, 10_000)  # A stale, smaller failure never lowers the limit
+    assert oracle.gas_limit(KEY, 0) == pytest.approx(250_000, abs=2)
+
+
+def test_tx_params_merge_fees_gas_and_fields():
+    oracle = FeeOracle(FakeChain(base_fee=10, priority_fee=0).read_state, 8453)
+
+    assert oracle.tx_params(KEY, 300_000, nonce=4, gas=1) == {
+        "chainId": 8453, "gas": 1, "maxFeePerGas": 20 + MIN_PRIORITY_FEE,
+        "maxPriorityFeePerGas": MIN_PRIORITY_FEE, "nonce": 4}
+    assert oracle.tx_params(KEY, 300_000)["gas"] == 300_000
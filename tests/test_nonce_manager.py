@@ -0,0 +1,97 @@
+import pytest
+
+from nonce_manager import NonceManager, is_nonce_error
+
+
+class FakeAccount:
+    """Transaction counts of one account: `mined` confirmed, `pending` including the mempool."""
+
+    def __init__(self, mined=0, pending=None):
+        self.mined = mined
+        self.pending = mined if pending is None else pending
+        self.reads = []
+
+    def transaction_count(self, block_identifier):
+        self.reads.append(block_identifier)
+        return self.pending if block_identifier == "pending" else self.mined
+
+
+def test_allocates_consecutive_nonces_after_one_sync():
+    account = FakeAccount(pending=7)
+    nonces = NonceManager(account.transaction_count)
+
+    assert [nonces.allocate() for _ in range(3)] == [7, 8, 9]
+    assert account.reads == ["pending"]
+
+
+def test_released_nonces_are_reused_before_new_ones():
+    nonces = NonceManager(FakeAccount(pending=0).transaction_count)
+    for _ in range(4):
+        nonces.allocate()
+
+    nonces.release(1)
+    nonces.release(3)  # Top of the range folds back into the counter
+    assert nonces.next_nonce == 3
+    assert [nonces.allocate(), nonces.allocate(), nonces.allocate()] == [1, 3, 4]
+
+
+def test_failed_send_releases_its_nonce():
+    nonces = NonceManager(FakeAccount(pending=5).transaction_count)
+
+    def reject(raw):
+        raise ValueError("insufficient funds for gas")
+
+    with pytest.raises(ValueError):
+        nonces.send(lambda nonce: nonce, reject)
+    assert nonces.send(lambda nonce: nonce, lambda raw: f"0x{raw}") == ("0x5", 5)
+    assert nonces.outstanding == {5}
+
+
+def test_nonce_too_low_resyncs_from_chain_and_retries_once():
+    account = FakeAccount(pending=3)
+    nonces = NonceManager(account.transaction_count)
+    assert nonces.allocate() == 3
+    account.pending = 10  # Transactions sent from elsewhere
+    sent = []
+
+    def send_raw(nonce):
+        if nonce < account.pending:
+            raise ValueError({"code": -32000, "message": "nonce too low: next nonce 10, tx nonce 4"})
+        sent.append(nonce)
+        return f"0x{nonce}"
+
+    assert nonces.send(lambda nonce: nonce, send_raw) == ("0x10", 10)
+    assert sent == [10]
+    assert nonces.allocate() == 11
+
+
+def test_second_nonce_error_is_raised():
+    nonces = NonceManager(FakeAccount(pending=0).transaction_count)
+
+    def send_raw(nonce):
+        raise ValueError("already known")
+
+    with pytest.raises(ValueError, match="already known"):
+        nonces.send(lambda nonce: nonce, send_raw)
+
+
+def test_check_gap_resyncs_only_when_a_sent_nonce_is_not_mined():
+    account = FakeAccount(pending=0)
+    nonces = NonceManager(account.transaction_count)
+    for _ in range(3):
+        nonces.send(lambda nonce: nonce, lambda raw: raw)
+
+    account.mined = account.pending = 3
+    assert nonces.check_gap() is False
+    assert nonces.outstanding == set()
+
+    nonces.send(lambda nonce: nonce, lambda raw: raw)  # Nonce 3, then dropped by the node
+    nonces.send(lambda nonce: nonce, lambda raw: raw)
+    assert nonces.check_gap() is True
+    assert nonces.allocate() == 3
+
+
+def test_is_nonce_error():
+    assert is_nonce_error(ValueError("Nonce too low"))
+    assert is_nonce_error("replacement transaction underpriced")
+    assert not is_nonce_error(ValueError("execution reverted"))
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from position_journal import JournalLockedError, PositionJournal
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "positions.jsonl")
+
+
+def events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_replay_restores_positions_and_levels(path):
+    journal = PositionJournal(path)
+    positions = {"a": {"buy_price": 1.0, "highest_price": 1.0}, "b": {"buy_price": 2.0}}
+    journal.record(positions)
+    positions["a"]["highest_price"] = 1.5
+    del positions["b"]
+    journal.record(positions)
+    journal.record_levels(10.0, 12.0)
+    journal.close()
+
+    assert [event["op"] for event in events(path)] == ["open", "open", "update", "close", "levels"]
+    journal = PositionJournal(path)
+    assert journal.open_positions() == {"a": {"buy_price": 1.0, "highest_price": 1.5}}
+    assert journal.levels == [10.0, 12.0]
+
+
+def test_unchanged_positions_append_nothing(path):
+    journal = PositionJournal(path)
+    positions = {"a": {"buy_price": 1.0}}
+    journal.record(positions)
+    journal.commit()
+    journal.record(positions)
+    journal.record_levels(1.0, 2.0)
+    journal.record_levels(1.0, 2.0)
+    journal.close()
+
+    assert len(events(path)) == 2
+
+
+def test_compaction_keeps_state_and_later_appends(path):
+    journal = PositionJournal(path, compact_after=5)
+    for i in range(5):  # The fifth commit compacts to one open event
+        journal.record({"a": {"buy_price": 1.0, "highest_price": 1.0 + i}})
+        journal.commit()
+    journal.record({"a": {"buy_price": 1.0, "highest_price": 9.0}, "b": {"buy_price": 3.0}})
+    journal.close()
+
+    assert [event["op"] for event in events(path)] == ["open", "update", "open"]
+    assert PositionJournal(path).open_positions() == {"a": {"buy_price": 1.0, "highest_price": 9.0},
+                                                      "b": {"buy_price": 3.0}}
+
+
+def test_torn_final_line_is_dropped_and_rewritten(path):
+    journal = PositionJournal(path)
+    journal.record({"a": {"buy_price": 1.0}})
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"op": "open", "token": "b", "posi')
+
+    journal = PositionJournal(path)
+    assert journal.open_positions() == {"a": {"buy_price": 1.0}}
+    journal.record({"a": {"buy_price": 1.0}, "c": {"buy_price": 2.0}})
+    journal.close()
+    assert PositionJournal(path).open_positions() == {"a": {"buy_price": 1.0}, "c": {"buy_price": 2.0}}
+
+
+def test_legacy_files_seed_an_empty_journal_once(path, tmp_path):
+    held_tokens_file = tmp_path / "held_tokens.json"
+    held_tokens_file.write_text(json.dumps({"held_tokens": ["a"], "held_token_prices": {"a": {"buy_price": 1.0}}}))
+    token_prices_file = tmp_path / "token_prices.txt"
+    token_prices_file.write_text("10.0,12.0\n")
+
+    journal = PositionJournal(path)
+    journal.import_legacy(str(held_tokens_file), str(token_prices_file))
+    assert journal.open_positions() == {"a": {"buy_price": 1.0}}
+    assert journal.levels == [10.0, 12.0]
+    journal.record({})
+    journal.close()
+
+    journal = PositionJournal(path)
+    journal.import_legacy(str(held_tokens_file), str(token_prices_file))
+    assert journal.open_positions() == {}
+
+
+def test_second_writer_is_refused_while_the_journal_is_open(path):
+    pytest.importorskip("fcntl")
+    journal = PositionJournal(path)
+
+    with pytest.raises(JournalLockedError):
+        PositionJournal(path)
+    journal.close()
+    PositionJournal(path).close()
@@ -0,0 +1,43 @@
+import pytest
+
+from price_engine import pool_spot_price
+
+
+def stable_k(x, y):
+    return x ** 3 * y + y ** 3 * x
+
+
+def stable_y(x, k, y):
+    """Solve x^3*y + y^3*x = k for y by Newton's method, starting from `y`."""
+    for _ in range(50):
+        y -= (stable_k(x, y) - k) / (x ** 3 + 3 * x * y ** 2)
+    return y
+
+
+@pytest.mark.parametrize("stable", [False, True])
+def test_balanced_pool_trades_at_par(stable):
+    assert pool_spot_price(1000.0, 1000.0, stable) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("x,y", [(1000.0, 1000.0), (1200.0, 800.0), (50.0, 3.0), (1e6, 2.5e6)])
+def test_stable_price_matches_the_curve_slope(x, y):
+    k = stable_k(x, y)
+    dx = x * 1e-6
+    dy = y - stable_y(x + dx, k, y)  # token1 paid out for dx token0 in
+
+    assert pool_spot_price(x, y, stable=True) == pytest.approx(dx / dy, rel=1e-5)
+
+
+def test_stable_price_stays_closer_to_par_than_constant_product():
+    x, y = 1200.0, 800.0
+
+    volatile = pool_spot_price(x, y, stable=False)
+    stable = pool_spot_price(x, y, stable=True)
+
+    assert volatile == pytest.approx(1.5)
+    assert 1.0 < stable < volatile
+
+
+def test_swapping_the_reserves_inverts_the_price():
+    for stable in (False, True):
+        assert pool_spot_price(1200.0, 800.0, stable) * pool_spot_price(800.0, 1200.0, stable) == pytest.approx(1.0)
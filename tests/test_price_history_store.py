@@ -0,0 +1,89 @@
+import shutil
+
+import numpy as np
+
+from price_history_store import LEGACY_RECORD_HEADER, PriceHistory
+
+
+def reopen(path, capacity=8):
+    return PriceHistory(path, capacity)
+
+
+def test_ticks_survive_a_restart(tmp_path):
+    path = str(tmp_path / "history")
+    store = reopen(path)
+    store.append_many(["a", "b"], [1.0, 10.0], timestamp=100.0)
+    store.append("a", 2.0, timestamp=160.0)
+    store.truncate("b", 0)
+    store.close()
+
+    store = reopen(path)
+    assert store.window("a").tolist() == [1.0, 2.0]
+    assert store.window("a", with_timestamps=True)[1].tolist() == [100.0, 160.0]
+    assert store.count("b") == 0
+
+
+def test_ticks_after_a_snapshot_are_replayed_on_top_of_it(tmp_path):
+    path = str(tmp_path / "history")
+    store = reopen(path)
+    store.append("a", 1.0, timestamp=100.0)
+    store.flush()
+    store.snapshot()
+    store.append("a", 2.0, timestamp=160.0)
+    store.close()
+
+    assert reopen(path).window("a").tolist() == [1.0, 2.0]
+
+
+def test_log_left_over_from_a_crash_during_snapshot_is_not_applied_twice(tmp_path):
+    path = str(tmp_path / "history")
+    store = reopen(path)
+    for i in range(3):
+        store.append("a", float(i), timestamp=100.0 + i)
+    store.flush()
+    shutil.copy(path + ".ticks", path + ".ticks.before")
+    store.snapshot()
+    store.log.close()
+    # Crash after the snapshot replaced the .npz but before the tick log was reset
+    shutil.copy(path + ".ticks.before", path + ".ticks")
+
+    store = reopen(path)
+    assert store.window("a").tolist() == [0.0, 1.0, 2.0]
+    store.append("a", 3.0, timestamp=103.0)
+    store.close()
+    assert reopen(path).window("a").tolist() == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_torn_final_record_is_dropped(tmp_path):
+    path = str(tmp_path / "history")
+    store = reopen(path)
+    store.append("a", 1.0, timestamp=100.0)
+    store.append("a", 2.0, timestamp=101.0)
+    store.close()
+    with open(path + ".ticks", "r+b") as f:
+        f.truncate(f.seek(0, 2) - 1)
+
+    assert reopen(path).window("a").tolist() == [1.0]
+
+
+def test_legacy_log_without_sequence_numbers_is_replayed(tmp_path):
+    path = str(tmp_path / "history")
+    with open(path + ".ticks", "wb") as f:
+        for timestamp, price in ((100.0, 1.0), (101.0, 2.0)):
+            f.write(LEGACY_RECORD_HEADER.pack(b"A", timestamp, price, 1) + b"a")
+
+    store = reopen(path)
+    assert store.window("a").tolist() == [1.0, 2.0]
+    store.append("a", 3.0, timestamp=102.0)
+    store.close()
+    assert reopen(path).window("a").tolist() == [1.0, 2.0, 3.0]
+
+
+def test_ring_buffer_keeps_the_last_capacity_prices(tmp_path):
+    store = PriceHistory(None, capacity=4)
+    for i in range(10):
+        store.append("a", float(i), timestamp=float(i))
+
+    assert store.window("a").tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert store.latest("a") == 9.0 and store.price_at("a", 4) == 6.0
+    assert np.array_equal(store.window("a", 2), [8.0, 9.0])
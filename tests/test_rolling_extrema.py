@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from rolling_extrema import RollingMin, rise_from_min
+
+
+def naive_min(values, window, lag):
+    """min of values[-window:] without the newest `lag` ones, by rescanning."""
+    eligible = values[max(0, len(values) - window):max(0, len(values) - lag)]
+    return min(eligible) if eligible else None
+
+
+@pytest.mark.parametrize("window,lag", [(1, 0), (2, 0), (5, 0), (5, 1), (5, 4), (30, 7)])
+def test_matches_a_naive_rescan(window, lag):
+    rng = random.Random(window * 100 + lag)
+    rolling = RollingMin(window, lag)
+    values = []
+    for _ in range(500):
+        values.append(rng.choice([rng.uniform(0.5, 2.0), 1.0]))  # Ties exercise the >= eviction
+        assert rolling.push(values[-1]) == naive_min(values, window, lag)
+
+
+def test_reset_replays_the_kept_history():
+    rolling = RollingMin(4, lag=1)
+    for value in (5.0, 1.0, 3.0, 4.0, 2.0):
+        rolling.push(value)
+
+    assert rolling.reset([3.0, 4.0, 2.0]) == naive_min([3.0, 4.0, 2.0], 4, 1) == 3.0
+    assert rolling.push(6.0) == 2.0
+
+
+def test_lag_must_leave_room_in_the_window():
+    with pytest.raises(ValueError):
+        RollingMin(3, lag=3)
+
+
+def test_rise_from_min():
+    assert rise_from_min(1.1, 1.0) == pytest.approx(0.1)
+    assert rise_from_min(1.1, None) == 0.0
@@ -0,0 +1,105 @@
+import re
+
+import pytest
+
+from subgraph_pools import (START_CURSOR, changed_since, fetch_pools, merge_changed_pools, pool_page,
+                            shard_bounds)
+
+
+class FakeSubgraph:
+    """Answers the `pools` fields pool_page() builds from an in-memory list of pool ids."""
+
+    def __init__(self, pool_ids):
+        self.pools = [{"id": pool_id, "liquidity": "1"} for pool_id in sorted(pool_ids)]
+        self.requests = []
+
+    def execute_many(self, fields):
+        self.requests.append(fields)
+        return {alias: self.page(field) for alias, field in fields.items()}
+
+    def map(self, function, items):
+        return [function(item) for item in items]
+
+    def page(self, field):
+        first = int(re.search(r"first: (\d+)", field).group(1))
+        last_id = re.search(r'id_gt: "(\w+)"', field).group(1)
+        lower = re.search(r'id_gte: "(\w+)"', field).group(1)
+        upper = re.search(r'id_lt: "(\w+)"', field)
+        upper = upper.group(1) if upper else None
+        return [pool for pool in self.pools
+                if pool["id"] > last_id and pool["id"] >= lower and (upper is None or pool["id"] < upper)][:first]
+
+
+def pool_id(n):
+    return "0x" + format(n, "040x")
+
+
+def test_shard_bounds_cover_the_id_space_without_gaps():
+    bounds = shard_bounds(4)
+
+    assert bounds == [("0x00", "0x40"), ("0x40", "0x80"), ("0x80", "0xc0"), ("0xc0", None)]
+
+
+def test_pool_page_pins_the_block_and_bounds_the_shard():
+    field = pool_page("liquidity_gte: \"1\"", "0x40", "0x80", START_CURSOR, page_size=5, block=123)
+
+    assert field.startswith("pools(block: { number: 123 }, first: 5,")
+    assert f'id_gt: "{START_CURSOR}"' in field
+    assert 'id_gte: "0x40", id_lt: "0x80"' in field
+
+
+@pytest.mark.parametrize("shards,shards_per_request", [(1, 1), (4, 4), (16, 4), (16, 3)])
+def test_fetch_pools_returns_every_pool_once_in_id_order(shards, shards_per_request):
+    ids = [pool_id(n) for n in range(1, 2**160, 2**160 // 37)]  # Spread over every shard
+    client = FakeSubgraph(ids)
+
+    pools = fetch_pools(client, "", page_size=3, shards=shards, shards_per_request=shards_per_request)
+
+    assert [pool["id"] for pool in pools] == sorted(ids)
+    assert all(len(fields) <= shards_per_request for fields in client.requests)
+
+
+def test_fetch_pools_advances_each_shard_cursor_to_its_last_id():
+    ids = [pool_id(n) for n in range(1, 6)]  # All in the first shard
+    client = FakeSubgraph(ids)
+
+    fetch_pools(client, "", page_size=2, shards=4)
+
+    cursors = [re.search(r'id_gt: "(\w+)"', fields["shard0"]).group(1)
+               for fields in client.requests if "shard0" in fields]
+    assert cursors == [START_CURSOR, ids[1], ids[3]]
+    # Empty shards finish after their first short page
+    assert sum("shard1" in fields for fields in client.requests) == 1
+
+
+def test_fetch_pools_stops_on_an_exactly_full_last_page():
+    ids = [pool_id(n) for n in range(1, 5)]
+    client = FakeSubgraph(ids)
+
+    pools = fetch_pools(client, "", page_size=2, shards=1)
+
+    assert len(pools) == 4
+    assert len(client.requests) == 3  # Two full pages, then an empty one
+
+
+def test_changed_since_pages_from_the_last_synced_block():
+    field = pool_page(changed_since(100), "0x00", None, START_CURSOR, block=120)
+
+    assert "_change_block: { number_gte: 100 }" in field
+    assert "block: { number: 120 }" in field
+
+
+def test_merge_changed_pools_keeps_liquid_pools_and_evicts_drained_ones():
+    pools = {"a": {"id": "a", "liquidity": "5"}, "b": {"id": "b", "liquidity": "5"}}
+    changed = [
+        {"id": "a", "liquidity": "7.5"},  # Still above the threshold: updated
+        {"id": "b", "liquidity": "0.5"},  # Drained: evicted
+        {"id": "c", "liquidity": "9"},    # New pool
+        {"id": "d", "liquidity": "0"},    # New but too small: never tracked
+    ]
+
+    kept, evicted = merge_changed_pools(pools, changed, min_liquidity=1.0)
+
+    assert [pool["id"] for pool in kept] == ["a", "c"]
+    assert evicted == ["b"]
+    assert pools == {"a": changed[0], "c": changed[2]}
@@ -0,0 +1,46 @@
+import os
+
+from tick_archive import SECONDS_PER_DAY, TickArchive
+
+DAY = 20000 * SECONDS_PER_DAY  # Some UTC midnight
+
+
+def test_ticks_round_trip_across_days_and_reopen(tmp_path):
+    root = str(tmp_path / "archive")
+    archive = TickArchive(root)
+    ticks = [
+        (DAY + 60.0, {"a": 1.0, "b": 2.0}),
+        (DAY + 120.0, {"a": 1.5}),
+        (DAY + SECONDS_PER_DAY + 60.0, {"b": 2.5, "c": 3.0}),  # Next day
+    ]
+    for timestamp, prices in ticks:
+        archive.append_many(prices, "aerodrome", timestamp)
+    archive.flush()
+
+    assert archive.days() == ["2024-10-04", "2024-10-05"]
+    assert list(archive.replay()) == ticks
+    assert list(TickArchive(root).replay(source="aerodrome")) == ticks
+
+
+def test_replay_filters_by_time_range_and_source(tmp_path):
+    archive = TickArchive(str(tmp_path))
+    archive.append_many({"a": 1.0}, "aerodrome", DAY + 60.0)
+    archive.append_many({"a": 9.0}, "bybit", DAY + 90.0)
+    archive.append_many({"a": 2.0}, "aerodrome", DAY + 120.0)
+    archive.append_many({"a": 3.0}, "aerodrome", DAY + 180.0)
+    archive.flush()
+
+    assert list(archive.replay(DAY + 100.0, DAY + 180.0, source="aerodrome")) == [(DAY + 120.0, {"a": 2.0})]
+    assert [prices for _, prices in archive.replay(source="bybit")] == [{"a": 9.0}]
+    assert list(archive.replay(source="unknown")) == []
+
+
+def test_torn_final_flush_is_ignored(tmp_path):
+    archive = TickArchive(str(tmp_path))
+    archive.append_many({"a": 1.0, "b": 2.0}, "aerodrome", DAY + 60.0)
+    archive.flush()
+    # Crash part-way through a flush: only some columns got the new row
+    with open(os.path.join(str(tmp_path), "2024-10-04", "ts.bin"), "ab") as f:
+        f.write(b"\0" * 8)
+
+    assert list(TickArchive(str(tmp_path)).replay()) == [(DAY + 60.0, {"a": 1.0, "b": 2.0})]
@@ -0,0 +1,150 @@
+"""Day-partitioned, memory-mapped columnar archive of price ticks (timestamp, token, price, source)."""
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+# One raw little-endian file per column per day: <root>/<YYYY-MM-DD>/<column>.bin
+COLUMNS = {"ts": np.float64, "token": np.uint32, "price": np.float64, "source": np.uint8}
+SECONDS_PER_DAY = 86400
+
+# Columns of one day's rows; arrays are read-only views over the memory-mapped files
+TickBlock = namedtuple("TickBlock", ["day", "ts", "token", "price", "source"])
+
+
+def day_name(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def day_start(name):
+    return datetime.strptime(name, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+
+
+class TickArchive:
+    """Append-only tick columns under `root`, one directory per UTC day.
+
+    Tokens and sources are stored as small integer codes; the code -> name lists live in
+    `dictionary.json`. One writer process per archive appends rows in time order, so `ts` is
+    sorted inside each day and a time-range scan is two binary searches per day.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.dictionary_path = os.path.join(root, "dictionary.json")
+        os.makedirs(root, exist_ok=True)
+
+        self.token_ids = []
+        self.source_names = []
+        if os.path.exists(self.dictionary_path):
+            with open(self.dictionary_path, "r") as f:
+                dictionary = json.load(f)
+            self.token_ids = dictionary["tokens"]
+            self.source_names = dictionary["sources"]
+        self.token_codes = {token: code for code, token in enumerate(self.token_ids)}
+        self.source_codes = {source: code for code, source in enumerate(self.source_names)}
+        self.dictionary_dirty = False
+
+        self.pending = {column: [] for column in COLUMNS}
+        self.maps = {}  # day -> (rows, TickBlock) of open memmaps
+
+    # **WRITING**
+    def _code(self, codes, names, name):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+            self.dictionary_dirty = True
+        return code
+
+    def append(self, token, price, source, timestamp=None):
+        self.append_many({token: price}, source, timestamp)
+
+    def append_many(self, prices, source, timestamp=None):
+        """Buffer one tick per {token: price} entry, all at the same timestamp."""
+        timestamp = time.time() if timestamp is None else timestamp
+        source_code = self._code(self.source_codes, self.source_names, source)
+        for token, price in prices.items():
+            self.pending["ts"].append(timestamp)
+            self.pending["token"].append(self._code(self.token_codes, self.token_ids, token))
+            self.pending["price"].append(price)
+            self.pending["source"].append(source_code)
+
+    def flush(self):
+        """Append buffered ticks to their day's column files."""
+        if not self.pending["ts"]:
+            return
+        if self.dictionary_dirty:
+            # Codes must be on disk before any row that uses them
+            tmp_path = self.dictionary_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"tokens": self.token_ids, "sources": self.source_names}, f)
+            os.replace(tmp_path, self.dictionary_path)
+            self.dictionary_dirty = False
+
+        columns = {column: np.asarray(values, dtype=COLUMNS[column]) for column, values in self.pending.items()}
+        days = (columns["ts"] // SECONDS_PER_DAY).astype(np.int64)
+        for day in np.unique(days):
+            rows = days == day
+            directory = os.path.join(self.root, day_name(day * SECONDS_PER_DAY))
+            os.makedirs(directory, exist_ok=True)
+            for column, values in columns.items():
+                with open(os.path.join(directory, column + ".bin"), "ab") as f:
+                    f.write(values[rows].tobytes())
+        self.pending = {column: [] for column in COLUMNS}
+
+    # **READING**
+    def days(self):
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def partition(self, day):
+        """TickBlock of memmaps over every complete row of `day` (a torn final flush is ignored)."""
+        directory = os.path.join(self.root, day)
+        paths = {column: os.path.join(directory, column + ".bin") for column in COLUMNS}
+        rows = min(
+            os.path.getsize(path) // np.dtype(COLUMNS[column]).itemsize if os.path.exists(path) else 0
+            for column, path in paths.items()
+        )
+        cached = self.maps.get(day)
+        if cached and cached[0] == rows:
+            return cached[1]
+
+        arrays = {
+            column: np.memmap(paths[column], dtype=COLUMNS[column], mode="r", shape=(rows,))
+            if rows else np.empty(0, dtype=COLUMNS[column])
+            for column in COLUMNS
+        }
+        block = TickBlock(day=day, **arrays)
+        self.maps[day] = (rows, block)
+        return block
+
+    def scan(self, start=None, end=None):
+        """Yield one TickBlock per day holding the rows with start <= ts < end (views, no copies)."""
+        for day in self.days():
+            first = day_start(day)
+            if (end is not None and first >= end) or (start is not None and first + SECONDS_PER_DAY <= start):
+                continue
+            block = self.partition(day)
+            lo = 0 if start is None else int(np.searchsorted(block.ts, start, side="left"))
+            hi = len(block.ts) if end is None else int(np.searchsorted(block.ts, end, side="left"))
+            if hi > lo:
+                yield TickBlock(day, block.ts[lo:hi], block.token[lo:hi], block.price[lo:hi], block.source[lo:hi])
+
+    def replay(self, start=None, end=None, source=None):
+        """Yield (timestamp, {token: price}) for every archived loop tick, oldest first."""
+        source_code = self.source_codes.get(source) if source is not None else None
+        if source is not None and source_code is None:
+            return
+        for block in self.scan(start, end):
+            ts, tokens, prices = block.ts, block.token, block.price
+            if source_code is not None:
+                rows = block.source == source_code
+                ts, tokens, prices = ts[rows], tokens[rows], prices[rows]
+            bounds = np.concatenate(([0], np.flatnonzero(np.diff(ts)) + 1, [len(ts)]))
+            token_list = [self.token_ids[code] for code in tokens.tolist()]
+            price_list = prices.tolist()
+            for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                if hi > lo:
+                    yield float(ts[lo]), dict(zip(token_list[lo:hi], price_list[lo:hi]))